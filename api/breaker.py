@@ -0,0 +1,130 @@
+"""Circuit breaker tracking the health of the shared Elasticsearch client.
+
+The breaker is fed by two sources: a background task that pings ES on a
+fixed interval, and the outcome of real search requests. After
+`failure_threshold` consecutive failures it opens and every request goes
+straight to the fallback engine without touching the network. Once
+`reset_timeout` seconds have passed it half-opens and lets a single trial
+request through; a success closes it again, a failure re-opens it.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_es_outage(exc: BaseException) -> bool:
+    """Tell transport/server failures apart from errors caused by the query itself."""
+    if isinstance(exc, (ConnectionError, ConnectionTimeout)):
+        return True
+    if isinstance(exc, ApiError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened_count = 0
+        self.short_circuited = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a request may be sent to ES right now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if error is not None:
+                self.last_error = str(error)
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self.opened_count += 1
+            elif self._state == OPEN:
+                # A failed probe while open restarts the cool-down
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self._state,
+            "consecutive_failures": self._failures,
+            "opened_count": self.opened_count,
+            "short_circuited": self.short_circuited,
+            "last_error": self.last_error,
+        }
+
+
+class HealthProbe:
+    """Background asyncio task that pings ES and reports the result to the breaker."""
+
+    def __init__(self, breaker: CircuitBreaker, ping: Callable[[], Awaitable[bool]], interval: float = 5.0):
+        self.breaker = breaker
+        self.ping = ping
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self) -> bool:
+        try:
+            ok = bool(await self.ping())
+        except Exception as e:
+            self.breaker.record_failure(e)
+            return False
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return ok
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="es-health-probe")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,64 @@
+"""Opaque cursors for deep pagination of /search.
+
+A cursor is URL-safe base64 of a small JSON object. Clients only echo back
+the `next_cursor` of the previous page. It records where the walk stands:
+
+  es        - `search_after` sort values of the last hit, plus the
+              point-in-time id once the walk has opened one, and whether
+              the total counted on the first page is exact
+  fallback  - position in the fallback engine's result order and the corpus
+              generation that order was computed from
+
+Every cursor also carries a fingerprint of the query parameters, so a cursor
+cannot be replayed against a different query. A cursor missing a field of
+its source, or holding one of the wrong type, is rejected as malformed.
+"""
+import base64
+import binascii
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from api.cache import normalize_query
+
+CURSOR_VERSION = 1
+
+# Fields each cursor source needs, with their types
+CURSOR_FIELDS = {
+    "es": {"after": list, "n": int, "t": int, "x": bool},
+    "fallback": {"gen": int, "pos": int, "t": int},
+}
+
+
+class InvalidCursor(ValueError):
+    """The cursor is malformed or was issued for another query."""
+
+
+def query_fingerprint(q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], sort: Optional[str]) -> str:
+    params = [normalize_query(q), min_price, max_price, size, color.lower() if color else None, sort]
+    return hashlib.sha1(json.dumps(params).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    raw = json.dumps(dict(state, v=CURSOR_VERSION), separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor("malformed cursor") from e
+    if not isinstance(state, dict) or state.get("v") != CURSOR_VERSION or state.get("src") not in ("es", "fallback"):
+        raise InvalidCursor("malformed cursor")
+    if state.get("k") != fingerprint:
+        raise InvalidCursor("cursor was issued for different query parameters")
+    for field, kind in CURSOR_FIELDS[state["src"]].items():
+        value = state.get(field)
+        # bool is an int subclass: a flag is no count
+        if not isinstance(value, kind) or (kind is int and (isinstance(value, bool) or value < 0)):
+            raise InvalidCursor("malformed cursor")
+    if state["src"] == "es" and (not state["after"] or not isinstance(state.get("pit"), (str, type(None)))):
+        raise InvalidCursor("malformed cursor")
+    return state
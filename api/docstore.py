@@ -0,0 +1,118 @@
+"""Process-wide, change-aware store for the JSON fallback corpus.
+
+The JSON export is parsed once and the search engine and the similar-product
+neighbors are built from it. The file is re-read only when its mtime or size
+changes. A reload builds a complete new snapshot before publishing it with a
+single reference swap, so readers always see either the old or the new corpus
+and never a half-built one.
+"""
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.search_engine import SearchEngine
+from api.similar import SimilarityIndex
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """An immutable, fully built view of the corpus."""
+
+    docs: List[Dict[str, Any]]
+    engine: SearchEngine
+    # Precomputed nearest neighbors of every product
+    similar: SimilarityIndex
+    generation: int
+    # (st_mtime_ns, st_size) of the file this snapshot was loaded from
+    signature: Optional[Tuple[int, int]]
+    loaded_at: float = field(default_factory=time.time)
+    load_seconds: float = 0.0
+
+
+class DocumentStore:
+    """Loads a JSON array of documents and reloads it when the file changes."""
+
+    def __init__(self, path: Path, check_interval: float = 1.0):
+        self.path = Path(path)
+        # Minimum seconds between two stat() calls on the hot path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self._last_check = 0.0
+        self.last_error: Optional[str] = None
+
+    def _signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read(self) -> List[Dict[str, Any]]:
+        with self.path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError(f"{self.path} does not contain a JSON array")
+        return data
+
+    def _load(self, signature: Optional[Tuple[int, int]]) -> None:
+        current = self._snapshot
+        generation = current.generation + 1 if current else 1
+        start = time.perf_counter()
+        if signature is None:
+            docs: List[Dict[str, Any]] = []
+        else:
+            try:
+                docs = self._read()
+            except Exception as e:
+                # Most likely the file is being rewritten: keep serving the
+                # previous snapshot and retry on the next check.
+                self.last_error = str(e)
+                if current is not None:
+                    return
+                docs, signature = [], None
+        engine = SearchEngine(docs)
+        self._snapshot = Snapshot(
+            docs=docs,
+            engine=engine,
+            similar=SimilarityIndex(docs),
+            generation=generation,
+            signature=signature,
+            load_seconds=time.perf_counter() - start,
+        )
+        if signature is not None:
+            self.last_error = None
+
+    def get(self) -> Snapshot:
+        """Return the current snapshot, reloading first if the file changed."""
+        snap = self._snapshot
+        now = time.monotonic()
+        if snap is not None and now - self._last_check < self.check_interval:
+            return snap
+        self._last_check = now
+        signature = self._signature()
+        if snap is not None and signature == snap.signature:
+            return snap
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            snap = self._snapshot
+            if snap is None or signature != snap.signature:
+                self._load(signature)
+            return self._snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        if snap is None:
+            return {"loaded": False, "path": str(self.path)}
+        return {
+            "loaded": True,
+            "path": str(self.path),
+            "generation": snap.generation,
+            "doc_count": len(snap.docs),
+            "loaded_at": snap.loaded_at,
+            "load_seconds": round(snap.load_seconds, 4),
+            "last_error": self.last_error,
+        }
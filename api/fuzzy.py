@@ -0,0 +1,104 @@
+"""Typo-tolerant term lookup for the fallback search engine.
+
+A SymSpell-style deletion dictionary: every vocabulary term is indexed under
+all the strings obtained by deleting up to `max_distance` characters from
+(the first `prefix_length` characters of) it. A query term generates its own
+deletes and looks them up, so candidates within the edit distance are found
+with a few dictionary probes instead of a scan of the vocabulary. Candidates
+are then checked with an exact, bounded Damerau-Levenshtein distance.
+
+Edit distances follow Elasticsearch's `fuzziness: AUTO`, so the fallback and
+the ES query tolerate the same typos.
+"""
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Same as Elasticsearch fuzziness AUTO (AUTO:3,6)
+AUTO_LOW, AUTO_HIGH = 3, 6
+# Leading characters that must match exactly (ES `prefix_length`)
+FUZZY_PREFIX_LENGTH = 1
+# Most expansions kept per query term (ES `max_expansions` defaults to 50)
+FUZZY_MAX_EXPANSIONS = 50
+# Deletes are generated from this many leading characters only
+DELETE_PREFIX_LENGTH = 7
+
+
+def auto_distance(term: str) -> int:
+    """Edits allowed for a term of this length under fuzziness AUTO."""
+    if len(term) < AUTO_LOW:
+        return 0
+    return 1 if len(term) < AUTO_HIGH else 2
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    out = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        nxt = set()
+        for w in frontier:
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        out |= nxt
+        frontier = nxt
+    return out
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, or max_distance + 1 once exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+            row_min = min(row_min, cur[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class DeletionIndex:
+    def __init__(self, vocabulary: Iterable[str], max_distance: int = 2, prefix_length: int = DELETE_PREFIX_LENGTH):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._deletes: Dict[str, List[str]] = {}
+        self.size = 0
+        for term in set(vocabulary):
+            if len(term) < AUTO_LOW:
+                # Never fuzzy-matched under AUTO
+                continue
+            self.size += 1
+            for d in _deletes(term[:prefix_length], max_distance):
+                self._deletes.setdefault(d, []).append(term)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def lookup(self, term: str, max_distance: int = None) -> List[Tuple[str, int]]:
+        """Vocabulary terms within `max_distance` edits of `term` (AUTO by
+        default), closest first. The term itself is included when indexed."""
+        if max_distance is None:
+            max_distance = auto_distance(term)
+        max_distance = min(max_distance, self.max_distance)
+        if max_distance == 0:
+            return []
+        seen: Set[str] = set()
+        found: List[Tuple[str, int]] = []
+        for d in _deletes(term[:self.prefix_length], max_distance):
+            for candidate in self._deletes.get(d, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if candidate[:FUZZY_PREFIX_LENGTH] != term[:FUZZY_PREFIX_LENGTH]:
+                    continue
+                dist = edit_distance(term, candidate, max_distance)
+                if dist <= max_distance:
+                    found.append((candidate, dist))
+        found.sort(key=lambda x: (x[1], x[0]))
+        return found[:FUZZY_MAX_EXPANSIONS]
@@ -1,6 +1,5 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import os
-import json
 from pathlib import Path
 import sys
 
@@ -10,11 +9,136 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from fastapi import FastAPI, Query
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from elasticsearch import Elasticsearch
+from elasticsearch import ApiError, AsyncElasticsearch
+from pydantic import BaseModel, Field
+
+from api.breaker import CircuitBreaker, HealthProbe, is_es_outage
+from api.cache import QueryCache, normalize_query
+from api.cursor import InvalidCursor, decode_cursor, encode_cursor, query_fingerprint
+from api.docstore import DocumentStore
+from api.fuzzy import FUZZY_MAX_EXPANSIONS, FUZZY_PREFIX_LENGTH
+from api.search_engine import PRICE_HISTOGRAM_INTERVAL, PRICE_RANGES, SearchEngine
+from api.responses import CompressionMiddleware, FastJSONResponse, fast_json
+from api.similar import SIMILAR_K
+from api.suggest import MAX_SUGGESTIONS, SuggestIndex, titles_from_docs, titles_from_terms_agg
+from index_tools.doc_utils import DOC_FIELDS
+
+ES_HOST = os.environ.get("ES_HOST", "http://localhost:9200")
+INDEX = os.environ.get("ES_INDEX", "scuffers_products")
+ES_PROBE_INTERVAL = float(os.environ.get("ES_PROBE_INTERVAL", "5"))
+ES_PROBE_TIMEOUT = float(os.environ.get("ES_PROBE_TIMEOUT", "2"))
+# Size of the shared HTTP connection pool to the ES node
+ES_POOL_SIZE = int(os.environ.get("ES_POOL_SIZE", "32"))
+ES_REQUEST_TIMEOUT = float(os.environ.get("ES_REQUEST_TIMEOUT", "10"))
+# How long a cursor walk's point-in-time stays open between two pages
+CURSOR_KEEP_ALIVE = os.environ.get("CURSOR_KEEP_ALIVE", "2m")
+# Upper bound on distinct titles loaded into the completion index
+SUGGEST_MAX_TITLES = int(os.environ.get("SUGGEST_MAX_TITLES", "10000"))
+# Most searches accepted in one /msearch request
+MSEARCH_MAX_SEARCHES = int(os.environ.get("MSEARCH_MAX_SEARCHES", "10"))
+
+# Created in the lifespan hook so the client and its connection pool are
+# bound to the running event loop.
+es: Optional[AsyncElasticsearch] = None
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get("ES_BREAKER_FAILURES", "3")),
+    reset_timeout=float(os.environ.get("ES_BREAKER_RESET", "10")),
+)
+
+query_cache = QueryCache(
+    max_bytes=int(os.environ.get("QUERY_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl=float(os.environ.get("QUERY_CACHE_TTL", "60")),
+)
+
+# Facets only depend on the query and filters, not on the page or sort, so
+# they live longer in a cache of their own
+facets_cache = QueryCache(
+    max_bytes=int(os.environ.get("FACETS_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    ttl=float(os.environ.get("FACETS_CACHE_TTL", "300")),
+)
+
+# Identifies the data behind INDEX: the concrete index names plus the version
+# that index_tools/insert_docs.py stamps into the mapping _meta. It is part of
+# every ES cache key, so a rebuild or alias swap invalidates cached results.
+es_index_version: Optional[Tuple[Tuple[str, str], ...]] = None
+
+# Title completions built from ES whenever es_index_version changes. Until ES
+# has been reached once they come from the fallback corpus instead, rebuilt
+# per corpus generation.
+suggest_index: Optional[SuggestIndex] = None
+fallback_suggest: Tuple[int, Optional[SuggestIndex]] = (0, None)
+
+
+async def refresh_index_version(client: AsyncElasticsearch) -> None:
+    global es_index_version
+    try:
+        resp = await client.indices.get_mapping(index=INDEX)
+    except Exception:
+        return
+    version = tuple(sorted(
+        (name, str(((m.get("mappings") or {}).get("_meta") or {}).get("version")))
+        for name, m in resp.body.items()
+    ))
+    if version != es_index_version:
+        if es_index_version is not None:
+            query_cache.clear()
+            facets_cache.clear()
+        es_index_version = version
+        await refresh_suggest_index(client)
+
+
+async def refresh_suggest_index(client: AsyncElasticsearch) -> None:
+    global suggest_index
+    try:
+        resp = await client.search(
+            index=INDEX,
+            size=0,
+            aggs={"titles": {"terms": {"field": "title.keyword", "size": SUGGEST_MAX_TITLES}}},
+        )
+        titles = titles_from_terms_agg(resp["aggregations"]["titles"]["buckets"])
+    except Exception:
+        return
+    suggest_index = await run_in_threadpool(SuggestIndex, titles)
+
+
+async def ping_es() -> bool:
+    client = es.options(request_timeout=ES_PROBE_TIMEOUT)
+    if not await client.ping():
+        return False
+    await refresh_index_version(client)
+    return True
+
+
+probe = HealthProbe(breaker, ping_es, interval=ES_PROBE_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global es
+    es = AsyncElasticsearch(
+        hosts=[ES_HOST],
+        connections_per_node=ES_POOL_SIZE,
+        request_timeout=ES_REQUEST_TIMEOUT,
+    )
+    # Build the fallback engine up front instead of on the first ES outage
+    await run_in_threadpool(fallback_store.get)
+    await run_in_threadpool(fallback_suggest_index)
+    probe.start()
+    try:
+        yield
+    finally:
+        await probe.stop()
+        await es.close()
+        es = None
+
 
-app = FastAPI(title="Scuffers Search API")
+app = FastAPI(title="Scuffers Search API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,21 +147,58 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
-ES_HOST = os.environ.get("ES_HOST", "http://localhost:9200")
-INDEX = os.environ.get("ES_INDEX", "scuffers_products")
 
-es = Elasticsearch(hosts=[ES_HOST])
+def es_available() -> bool:
+    # No network call: the breaker is kept up to date by the background
+    # probe and by the outcome of real queries.
+    return es is not None and breaker.allow_request()
 
 
-def es_available() -> bool:
-    try:
-        return es.ping()
-    except Exception:
-        return False
+ES_AGGS = {
+    "sizes": {"terms": {"field": "sizes"}},
+    "price_stats": {"stats": {"field": "price"}},
+    "colors": {"terms": {"field": "color"}},
+    "price_histogram": {"histogram": {"field": "price", "interval": PRICE_HISTOGRAM_INTERVAL}},
+    "price_ranges": {"range": {"field": "price", "ranges": [
+        {k: v for k, v in (("from", lo), ("to", hi)) if v is not None} for lo, hi in PRICE_RANGES
+    ]}},
+}
+
+
+# Fields a hit can be projected to with the `fields` parameter
+SOURCE_FIELDS = DOC_FIELDS + ("price", "color")
+
 
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Comma-separated field list -> tuple of known fields (None = everything)."""
+    if not fields:
+        return None
+    names = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in names if f not in SOURCE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown fields: {', '.join(unknown)}; allowed: {', '.join(SOURCE_FIELDS)}")
+    return names or None
 
-def build_es_body(q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], page: int, per_page: int, sort: Optional[str]) -> Dict[str, Any]:
+
+def source_filter(fields: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    if fields is None:
+        # Indexing bookkeeping, not part of the product
+        return {"excludes": ["content_hash"]}
+    return {"includes": list(fields)}
+
+
+def project_hit(doc: Dict[str, Any], fields: Optional[Tuple[str, ...]], max_images: Optional[int]) -> Dict[str, Any]:
+    """Apply the projection ES applies with `_source` (plus the image cap) to a fallback hit."""
+    if fields is not None:
+        doc = {k: doc[k] for k in fields if k in doc}
+    if max_images is not None and isinstance(doc.get("images"), list) and len(doc["images"]) > max_images:
+        doc = dict(doc, images=doc["images"][:max_images])
+    return doc
+
+
+def build_es_query(q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str]) -> Dict[str, Any]:
     must = []
     filters = []
 
@@ -47,6 +208,10 @@ def build_es_body(q: Optional[str], min_price: Optional[float], max_price: Optio
                 "query": q,
                 "fields": ["title^3", "title.autocomplete", "description", "sku"],
                 "type": "best_fields",
+                # Same edit distances as the fallback engine (api/fuzzy.py)
+                "fuzziness": "AUTO",
+                "prefix_length": FUZZY_PREFIX_LENGTH,
+                "max_expansions": FUZZY_MAX_EXPANSIONS,
             }
         })
     else:
@@ -67,123 +232,207 @@ def build_es_body(q: Optional[str], min_price: Optional[float], max_price: Optio
         # color is stored as keyword, lowercase
         filters.append({"term": {"color": color.lower()}})
 
+    return {"bool": {"must": must, "filter": filters}}
+
+
+def build_es_body(q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], page: int, per_page: int, sort: Optional[str], include_aggs: bool = True, fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
     body = {
-        "query": {"bool": {"must": must, "filter": filters}},
+        "query": build_es_query(q, min_price, max_price, size, color),
+        "_source": source_filter(fields),
         "from": (page - 1) * per_page,
         "size": per_page,
-        "aggs": {
-            "sizes": {"terms": {"field": "sizes"}},
-            "price_stats": {"stats": {"field": "price"}},
-            "colors": {"terms": {"field": "color"}}
-        },
     }
+    if include_aggs:
+        body["aggs"] = ES_AGGS
 
+    # url breaks ties, so every hit has a unique sort position for search_after
     if sort == "price_asc":
-        body["sort"] = [{"price": {"order": "asc"}}]
+        body["sort"] = [{"price": {"order": "asc"}}, {"url": "asc"}]
     elif sort == "price_desc":
-        body["sort"] = [{"price": {"order": "desc"}}]
+        body["sort"] = [{"price": {"order": "desc"}}, {"url": "asc"}]
+    else:
+        body["sort"] = ["_score", {"url": "asc"}]
 
     return body
 
 
-def load_json_fallback() -> List[Dict[str, Any]]:
-    p = Path(__file__).resolve().parents[1] / "scuffers_output.json"
-    if not p.exists():
-        return []
+def es_search_result(resp: Dict[str, Any], fingerprint: str, page: int, per_page: int, max_images: Optional[int] = None) -> Dict[str, Any]:
+    """/search response for a page of ES results."""
+    raw_hits = resp["hits"]["hits"]
+    # ES already applied the field projection, only the image cap is left
+    hits = [project_hit(h.get("_source", {}), None, max_images) for h in raw_hits]
+    total = resp["hits"]["total"]["value"] if isinstance(resp["hits"]["total"], dict) else resp["hits"]["total"]
+    # ES stops counting at 10000 hits ("gte"); such a total is only a lower bound
+    exact = not isinstance(resp["hits"]["total"], dict) or resp["hits"]["total"].get("relation", "eq") == "eq"
+    next_cursor = es_next_cursor(fingerprint, raw_hits, (page - 1) * per_page + len(hits), total, exact)
+    return {"total": total, "page": page, "per_page": per_page, "hits": hits, "aggregations": resp.get("aggregations", {}), "es": True, "next_cursor": next_cursor}
+
+
+def es_next_cursor(fingerprint: str, hits: List[Dict[str, Any]], served: int, total: int, exact: bool, pit_id: Optional[str] = None) -> Optional[str]:
+    # With a lower-bound total only a short page tells the walk has ended
+    if not hits or (exact and served >= total):
+        return None
+    return encode_cursor({"src": "es", "k": fingerprint, "after": hits[-1]["sort"], "pit": pit_id, "n": served, "t": total, "x": exact})
+
+
+async def es_cursor_page(state: Dict[str, Any], q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], per_page: int, sort: Optional[str], fields: Optional[Tuple[str, ...]] = None, max_images: Optional[int] = None) -> Dict[str, Any]:
+    """Next page of a cursor walk: search_after on a point-in-time, so every
+    page costs the same however deep the walk is and sees the same data."""
+    body = build_es_body(q, min_price, max_price, size, color, 1, per_page, sort, include_aggs=False, fields=fields)
+    del body["from"]
+    body["search_after"] = state["after"]
+    # The total was counted on the first page
+    body["track_total_hits"] = False
+    pit_id = state.get("pit") or (await es.open_point_in_time(index=INDEX, keep_alive=CURSOR_KEEP_ALIVE))["id"]
+    body["pit"] = {"id": pit_id, "keep_alive": CURSOR_KEEP_ALIVE}
     try:
-        with p.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
+        resp = await es.search(body=body)
+    except ApiError as e:
+        if e.status_code != 404:
+            raise
+        # The point-in-time expired between two pages: go on with a fresh one
+        body["pit"]["id"] = (await es.open_point_in_time(index=INDEX, keep_alive=CURSOR_KEEP_ALIVE))["id"]
+        resp = await es.search(body=body)
+    pit_id = resp.get("pit_id") or body["pit"]["id"]
+
+    hits = resp["hits"]["hits"]
+    served = state["n"] + len(hits)
+    total = max(state["t"], served)
+    next_cursor = es_next_cursor(state["k"], hits, served, total, state["x"], pit_id) if len(hits) == per_page else None
+    if next_cursor is None:
+        try:
+            await es.close_point_in_time(id=pit_id)
+        except Exception:
+            pass
+    return {
+        "total": total,
+        "page": state["n"] // per_page + 1,
+        "per_page": per_page,
+        "hits": [project_hit(h.get("_source", {}), None, max_images) for h in hits],
+        "aggregations": {},
+        "es": True,
+        "next_cursor": next_cursor,
+    }
 
 
-from index_tools.color_utils import infer_color_from_url
+FALLBACK_PATH = Path(os.environ.get("FALLBACK_JSON", str(ROOT / "scuffers_output.json")))
 
+fallback_store = DocumentStore(FALLBACK_PATH)
 
-def fallback_search(docs: List[Dict[str, Any]], q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], page: int, per_page: int, sort: Optional[str]) -> Dict[str, Any]:
-    def matches_text(item: Dict[str, Any], qstr: str) -> bool:
-        ql = qstr.lower()
-        for f in ("title", "description", "sku"):
-            v = item.get(f) or ""
-            if isinstance(v, list):
-                v = " ".join(v)
-            if isinstance(v, (int, float)):
-                v = str(v)
-            if ql in str(v).lower():
-                return True
-        return False
 
-    filtered = []
-    for item in docs:
-        if q and not matches_text(item, q):
-            continue
-        # color filter: try item['color'] first, otherwise infer from URL
-        if color:
-            item_color = (item.get('color') or '').lower()
-            if not item_color or item_color == 'unknown':
-                item_color = infer_color_from_url(item.get('url') or '').lower()
-            if item_color != color.lower():
-                continue
-        price = item.get("price")
-        try:
-            price_val = float(price) if price is not None else None
-        except Exception:
-            price_val = None
-        if min_price is not None and (price_val is None or price_val < min_price):
-            continue
-        if max_price is not None and (price_val is None or price_val > max_price):
-            continue
-        if size:
-            sizes = item.get("sizes") or []
-            if isinstance(sizes, str):
-                sizes = [s.strip() for s in sizes.split(",") if s.strip()]
-            if size not in sizes:
-                continue
-        filtered.append(item)
-
-    total = len(filtered)
+def get_fallback_engine() -> SearchEngine:
+    """Return the search engine of the current fallback corpus snapshot."""
+    return fallback_store.get().engine
 
-    if sort == "price_asc":
-        filtered.sort(key=lambda d: (float(d.get("price") or 0) if d.get("price") is not None else float("inf")))
-    elif sort == "price_desc":
-        filtered.sort(key=lambda d: (float(d.get("price") or 0) if d.get("price") is not None else -float("inf")), reverse=True)
 
-    start = (page - 1) * per_page
-    end = start + per_page
-    hits = filtered[start:end]
+def fallback_suggest_index() -> SuggestIndex:
+    global fallback_suggest
+    snap = fallback_store.get()
+    generation, index = fallback_suggest
+    if index is None or generation != snap.generation:
+        index = SuggestIndex(titles_from_docs(snap.docs))
+        fallback_suggest = (snap.generation, index)
+    return index
 
-    sizes_count: Dict[str, int] = {}
-    prices = []
-    for d in filtered:
-        for s in (d.get("sizes") or []):
-            sizes_count[s] = sizes_count.get(s, 0) + 1
-        try:
-            pval = float(d.get("price"))
-            prices.append(pval)
-        except Exception:
-            pass
 
-    # color aggregation over filtered docs
-    colors_count: Dict[str, int] = {}
-    for d in filtered:
-        c = (d.get('color') or '').lower()
-        if not c or c == 'unknown':
-            c = infer_color_from_url(d.get('url') or '').lower()
-        colors_count[c] = colors_count.get(c, 0) + 1
-
-    aggs: Dict[str, Any] = {}
-    aggs["sizes"] = {"buckets": [{"key": k, "doc_count": v} for k, v in sizes_count.items()]}
-    aggs["colors"] = {"buckets": [{"key": k, "doc_count": v} for k, v in colors_count.items()]}
-    if prices:
-        aggs["price_stats"] = {"min": min(prices), "max": max(prices), "avg": sum(prices) / len(prices), "count": len(prices)}
-    else:
-        aggs["price_stats"] = {"min": None, "max": None, "avg": None, "count": 0}
+def fallback_page(engine: SearchEngine, ids, start: int, per_page: int, with_aggs: bool = True) -> Dict[str, Any]:
+    hits = [engine.docs[i] for i in ids[start:start + per_page].tolist()]
+    aggs = engine.aggregations(ids) if with_aggs else {}
+    return {"total": len(ids), "hits": hits, "aggs": aggs}
+
+
+def fallback_order(snap, q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], sort: Optional[str]):
+    """Result order of a query, cached so a cursor walk sorts only once."""
+    key = ("fallback-order", snap.generation, normalize_query(q), min_price, max_price, size, color.lower() if color else None, sort)
+    ids = query_cache.get(key)
+    if ids is None:
+        ids = snap.engine.search(q, min_price, max_price, size, color, sort)
+        query_cache.put(key, ids)
+    return ids
+
+
+def fallback_next_cursor(fingerprint: str, generation: int, served: int, total: int) -> Optional[str]:
+    if served >= total:
+        return None
+    return encode_cursor({"src": "fallback", "k": fingerprint, "gen": generation, "pos": served, "t": total})
+
+
+def search_cache_key(source: str, generation: Any, q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], page: int, per_page: int, sort: Optional[str], include_aggs: bool = True) -> Tuple:
+    return (source, generation, normalize_query(q), min_price, max_price, size, color.lower() if color else None, page, per_page, sort, include_aggs)
+
+
+def facets_cache_key(source: str, generation: Any, q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str]) -> Tuple:
+    return (source, generation, normalize_query(q), min_price, max_price, size, color.lower() if color else None)
+
+
+def fallback_search_page(snap, q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], page: int, per_page: int, sort: Optional[str], include_aggs: bool = True) -> Dict[str, Any]:
+    key = search_cache_key("fallback", snap.generation, q, min_price, max_price, size, color, page, per_page, sort, include_aggs)
+    res = query_cache.get(key)
+    if res is None:
+        ids = fallback_order(snap, q, min_price, max_price, size, color, sort)
+        start = (page - 1) * per_page
+        res = fallback_page(snap.engine, ids, start, per_page, with_aggs=include_aggs)
+        fingerprint = query_fingerprint(q, min_price, max_price, size, color, sort)
+        res["next_cursor"] = fallback_next_cursor(fingerprint, snap.generation, start + len(res["hits"]), res["total"])
+        query_cache.put(key, res)
+        if include_aggs:
+            facets_key = facets_cache_key("fallback", snap.generation, q, min_price, max_price, size, color)
+            facets_cache.put(facets_key, {"total": res["total"], "aggregations": res["aggs"], "es": False})
+    return res
+
+
+async def run_fallback_search(q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], page: int, per_page: int, sort: Optional[str], include_aggs: bool = True) -> Dict[str, Any]:
+    """Run the CPU-bound fallback search in the threadpool, off the event loop."""
+    def run() -> Dict[str, Any]:
+        return fallback_search_page(fallback_store.get(), q, min_price, max_price, size, color, page, per_page, sort, include_aggs)
+    return await run_in_threadpool(run)
+
 
-    return {"total": total, "hits": hits, "aggs": aggs}
+async def run_fallback_facets(q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str]) -> Dict[str, Any]:
+    def run() -> Dict[str, Any]:
+        snap = fallback_store.get()
+        key = facets_cache_key("fallback", snap.generation, q, min_price, max_price, size, color)
+        res = facets_cache.get(key)
+        if res is None:
+            # Facets do not depend on the order: reuse the unsorted result
+            ids = fallback_order(snap, q, min_price, max_price, size, color, None)
+            res = {"total": len(ids), "aggregations": snap.engine.aggregations(ids), "es": False}
+            facets_cache.put(key, res)
+        return res
+    return await run_in_threadpool(run)
+
+
+async def run_fallback_cursor_page(state: Dict[str, Any], q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], per_page: int, sort: Optional[str]) -> Dict[str, Any]:
+    """Resume a cursor walk at its position in the fallback result order.
+
+    Also continues walks started on ES when ES became unavailable, from the
+    number of hits already served.
+    """
+    def run() -> Dict[str, Any]:
+        snap = fallback_store.get()
+        if state["src"] == "fallback" and state["gen"] != snap.generation:
+            raise HTTPException(status_code=410, detail="the corpus changed since this cursor was issued, start again without it")
+        start = state["pos"] if state["src"] == "fallback" else state["n"]
+        ids = fallback_order(snap, q, min_price, max_price, size, color, sort)
+        res = fallback_page(snap.engine, ids, start, per_page, with_aggs=False)
+        res["next_cursor"] = fallback_next_cursor(state["k"], snap.generation, start + len(res["hits"]), res["total"])
+        res["page"] = start // per_page + 1
+        return res
+    return await run_in_threadpool(run)
+
+
+def fallback_response(res: Dict[str, Any], page: int, per_page: int, error: Optional[Exception] = None, fields: Optional[Tuple[str, ...]] = None, max_images: Optional[int] = None) -> Dict[str, Any]:
+    # Cached fallback pages hold whole documents; the projection is applied per request
+    hits = [project_hit(h, fields, max_images) for h in res["hits"]] if fields is not None or max_images is not None else res["hits"]
+    result = {"total": res["total"], "page": res.get("page", page), "per_page": per_page, "hits": hits, "aggregations": res["aggs"], "es": False, "next_cursor": res["next_cursor"]}
+    if error is not None:
+        result["error"] = str(error)
+    return result
 
 
 @app.get("/search")
-def search(
+@fast_json
+async def search(
     q: Optional[str] = Query(None),
     min_price: Optional[float] = Query(None),
     max_price: Optional[float] = Query(None),
@@ -192,20 +441,263 @@ def search(
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
     sort: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page; replaces `page` for deep pagination"),
+    include_aggs: bool = Query(True, description="false skips the facets, e.g. when only the page or sort changes (see /facets)"),
+    fields: Optional[str] = Query(None, description="comma-separated fields to return per hit, e.g. url,title,price,currency,images"),
+    max_images: Optional[int] = Query(None, ge=0, description="keep only the first N image URLs of each hit"),
 ):
+    projection = parse_fields(fields)
+    fingerprint = query_fingerprint(q, min_price, max_price, size, color, sort)
+    if cursor:
+        try:
+            state = decode_cursor(cursor, fingerprint)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if state["src"] == "es" and es_available():
+            try:
+                result = await es_cursor_page(state, q, min_price, max_price, size, color, per_page, sort, projection, max_images)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                if is_es_outage(e):
+                    breaker.record_failure(e)
+                else:
+                    breaker.record_success()
+                res = await run_fallback_cursor_page(state, q, min_price, max_price, size, color, per_page, sort)
+                return fallback_response(res, page, per_page, e, projection, max_images)
+        res = await run_fallback_cursor_page(state, q, min_price, max_price, size, color, per_page, sort)
+        return fallback_response(res, page, per_page, None, projection, max_images)
+
+    # Cache first: es_available() claims the breaker's half-open trial, which
+    # only the outcome of an actual ES call releases
+    key = search_cache_key("es", es_index_version, q, min_price, max_price, size, color, page, per_page, sort, include_aggs) + (projection, max_images)
+    if es is not None:
+        cached = query_cache.get(key)
+        if cached is not None:
+            return cached
     if es_available():
-        body = build_es_body(q, min_price, max_price, size, color, page, per_page, sort)
+        body = build_es_body(q, min_price, max_price, size, color, page, per_page, sort, include_aggs, projection)
         try:
-            resp = es.search(index=INDEX, body=body)
-            hits = [h["_source"] for h in resp["hits"]["hits"]]
-            total = resp["hits"]["total"]["value"] if isinstance(resp["hits"]["total"], dict) else resp["hits"]["total"]
-            aggs = resp.get("aggregations", {})
-            return {"total": total, "page": page, "per_page": per_page, "hits": hits, "aggregations": aggs, "es": True}
+            resp = await es.search(index=INDEX, body=body)
+            breaker.record_success()
+            result = es_search_result(resp, fingerprint, page, per_page, max_images)
+            query_cache.put(key, result)
+            if include_aggs:
+                facets_key = facets_cache_key("es", es_index_version, q, min_price, max_price, size, color)
+                facets_cache.put(facets_key, {"total": result["total"], "aggregations": result["aggregations"], "es": True})
+            return result
         except Exception as e:
-            docs = load_json_fallback()
-            res = fallback_search(docs, q, min_price, max_price, size, color, page, per_page, sort)
-            return {"total": res["total"], "page": page, "per_page": per_page, "hits": res["hits"], "aggregations": res["aggs"], "es": False, "error": str(e)}
+            if is_es_outage(e):
+                breaker.record_failure(e)
+            else:
+                # ES answered (e.g. a 400): the cluster itself is healthy
+                breaker.record_success()
+            res = await run_fallback_search(q, min_price, max_price, size, color, page, per_page, sort, include_aggs)
+            return fallback_response(res, page, per_page, e, projection, max_images)
     else:
-        docs = load_json_fallback()
-        res = fallback_search(docs, q, min_price, max_price, size, color, page, per_page, sort)
-        return {"total": res["total"], "page": page, "per_page": per_page, "hits": res["hits"], "aggregations": res["aggs"], "es": False}
+        res = await run_fallback_search(q, min_price, max_price, size, color, page, per_page, sort, include_aggs)
+        return fallback_response(res, page, per_page, None, projection, max_images)
+
+
+class SearchSpec(BaseModel):
+    """One search of a /msearch batch: the /search parameters, minus the cursor."""
+    q: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    size: Optional[str] = None
+    color: Optional[str] = None
+    page: int = Field(1, ge=1)
+    per_page: int = Field(20, ge=1, le=100)
+    sort: Optional[str] = None
+    include_aggs: bool = True
+    fields: Optional[str] = None
+    max_images: Optional[int] = Field(None, ge=0)
+
+
+class MultiSearchRequest(BaseModel):
+    searches: List[SearchSpec] = Field(..., min_length=1)
+
+
+def msearch_fallback(specs: List[SearchSpec], projections: List[Optional[Tuple[str, ...]]], positions: List[int], errors: Dict[int, Any]) -> Dict[int, Dict[str, Any]]:
+    """Answer the searches at `positions` from one fallback corpus snapshot."""
+    snap = fallback_store.get()
+    out = {}
+    for i in positions:
+        s = specs[i]
+        res = fallback_search_page(snap, s.q, s.min_price, s.max_price, s.size, s.color, s.page, s.per_page, s.sort, s.include_aggs)
+        out[i] = fallback_response(res, s.page, s.per_page, errors.get(i), projections[i], s.max_images)
+    return out
+
+
+@app.post("/msearch")
+@fast_json
+async def msearch(request: MultiSearchRequest):
+    """Several searches in one round trip, e.g. the result page and its facets.
+
+    Each search takes the /search parameters and gets the /search response, in
+    request order. On ES they go out as one `_msearch` call; otherwise they
+    are answered together from the fallback corpus.
+    """
+    specs = request.searches
+    if len(specs) > MSEARCH_MAX_SEARCHES:
+        raise HTTPException(status_code=400, detail=f"at most {MSEARCH_MAX_SEARCHES} searches per request")
+    projections = [parse_fields(s.fields) for s in specs]
+    results: Dict[int, Dict[str, Any]] = {}
+    pending = list(range(len(specs)))
+    errors: Dict[int, Any] = {}
+
+    keys = {}
+    if es is not None:
+        for i, s in enumerate(specs):
+            keys[i] = search_cache_key("es", es_index_version, s.q, s.min_price, s.max_price, s.size, s.color, s.page, s.per_page, s.sort, s.include_aggs) + (projections[i], s.max_images)
+            cached = query_cache.get(keys[i])
+            if cached is not None:
+                results[i] = cached
+        pending = [i for i in pending if i not in results]
+    # Only a batch that needs ES takes the breaker's half-open trial
+    if pending and es_available():
+        searches: List[Dict[str, Any]] = []
+        for i in pending:
+            s = specs[i]
+            searches.append({})
+            searches.append(build_es_body(s.q, s.min_price, s.max_price, s.size, s.color, s.page, s.per_page, s.sort, s.include_aggs, projections[i]))
+        try:
+            resp = await es.msearch(index=INDEX, searches=searches)
+            breaker.record_success()
+        except Exception as e:
+            if is_es_outage(e):
+                breaker.record_failure(e)
+            else:
+                breaker.record_success()
+            errors = {i: e for i in pending}
+        else:
+            for i, item in zip(pending, resp["responses"]):
+                if "error" in item:
+                    # Only this search failed (e.g. a bad query): answer it from the fallback
+                    errors[i] = item["error"]
+                    continue
+                s = specs[i]
+                fingerprint = query_fingerprint(s.q, s.min_price, s.max_price, s.size, s.color, s.sort)
+                result = es_search_result(item, fingerprint, s.page, s.per_page, s.max_images)
+                query_cache.put(keys[i], result)
+                if s.include_aggs:
+                    facets_key = facets_cache_key("es", es_index_version, s.q, s.min_price, s.max_price, s.size, s.color)
+                    facets_cache.put(facets_key, {"total": result["total"], "aggregations": result["aggregations"], "es": True})
+                results[i] = result
+            pending = list(errors)
+
+    if pending:
+        results.update(await run_in_threadpool(msearch_fallback, specs, projections, pending, errors))
+    return {"responses": [results[i] for i in range(len(specs))]}
+
+
+@app.get("/facets")
+@fast_json
+async def facets(
+    q: Optional[str] = Query(None),
+    min_price: Optional[float] = Query(None),
+    max_price: Optional[float] = Query(None),
+    size: Optional[str] = Query(None),
+    color: Optional[str] = Query(None),
+):
+    """Facets (sizes, colors, price stats/histogram/ranges) of a query, without hits."""
+    key = facets_cache_key("es", es_index_version, q, min_price, max_price, size, color)
+    if es is not None:
+        cached = facets_cache.get(key)
+        if cached is not None:
+            return cached
+    if es_available():
+        body = {"query": build_es_query(q, min_price, max_price, size, color), "size": 0, "aggs": ES_AGGS}
+        try:
+            resp = await es.search(index=INDEX, body=body)
+            breaker.record_success()
+            total = resp["hits"]["total"]["value"] if isinstance(resp["hits"]["total"], dict) else resp["hits"]["total"]
+            result = {"total": total, "aggregations": resp.get("aggregations", {}), "es": True}
+            facets_cache.put(key, result)
+            return result
+        except Exception as e:
+            if is_es_outage(e):
+                breaker.record_failure(e)
+            else:
+                breaker.record_success()
+            res = await run_fallback_facets(q, min_price, max_price, size, color)
+            return dict(res, error=str(e))
+    return await run_fallback_facets(q, min_price, max_price, size, color)
+
+
+@app.get("/suggest")
+@fast_json
+async def suggest(
+    q: str = Query("", description="what the user has typed so far"),
+    k: int = Query(MAX_SUGGESTIONS, ge=1, le=50),
+):
+    """Top-k title completions for search-as-you-type, served from memory."""
+    if suggest_index is not None:
+        return {"q": q, "suggestions": suggest_index.suggest(q, k), "source": "es"}
+    index = await run_in_threadpool(fallback_suggest_index)
+    return {"q": q, "suggestions": index.suggest(q, k), "source": "fallback"}
+
+
+@app.get("/products/{product_id:path}/similar")
+@fast_json
+async def similar_products(product_id: str, k: int = Query(SIMILAR_K, ge=1, le=SIMILAR_K)):
+    """Products similar to `product_id` (its URL, or its SKU if it has none).
+
+    Served from the neighbors precomputed for the fallback corpus; products
+    that only exist in ES are answered with a `more_like_this` query. While
+    ES is unreachable those are answered with a 503, not a 404: the product
+    may well exist.
+    """
+    snap = await run_in_threadpool(fallback_store.get)
+    neighbors = snap.similar.similar(product_id, k)
+    if neighbors is not None:
+        hits = [dict(snap.docs[row], similarity=round(score, 4)) for row, score in neighbors]
+        return {"id": product_id, "hits": hits, "source": "precomputed"}
+
+    key = ("similar", es_index_version, product_id, k)
+    cached = query_cache.get(key) if es is not None else None
+    if cached is not None:
+        return cached
+    if es is None:
+        raise HTTPException(status_code=404, detail="unknown product")
+    if not es_available():
+        raise HTTPException(status_code=503, detail="search backend unavailable, try again later")
+    body = {
+        "size": k,
+        "_source": source_filter(None),
+        "query": {"more_like_this": {
+            "fields": ["title", "description", "color", "sizes"],
+            "like": [{"_index": INDEX, "_id": product_id}],
+            "min_term_freq": 1,
+            "min_doc_freq": 1,
+        }},
+    }
+    try:
+        resp = await es.search(index=INDEX, body=body)
+        breaker.record_success()
+    except Exception as e:
+        if is_es_outage(e):
+            breaker.record_failure(e)
+            raise HTTPException(status_code=503, detail="search backend unavailable, try again later")
+        breaker.record_success()
+        if isinstance(e, ApiError) and e.status_code < 500:
+            raise HTTPException(status_code=404, detail="unknown product")
+        raise
+    hits = [dict(h["_source"], similarity=h["_score"]) for h in resp["hits"]["hits"]]
+    result = {"id": product_id, "hits": hits, "source": "es"}
+    query_cache.put(key, result)
+    return result
+
+
+@app.get("/status")
+async def status():
+    return {
+        "es": dict(breaker.stats(), index_version=es_index_version),
+        "fallback": fallback_store.stats(),
+        "cache": query_cache.stats(),
+        "facets_cache": facets_cache.stats(),
+        "suggest": {
+            "source": "es" if suggest_index is not None else "fallback",
+            "titles": len(suggest_index if suggest_index is not None else fallback_suggest[1] or ()),
+        },
+    }
@@ -0,0 +1,127 @@
+"""Fast JSON responses and negotiated compression for the search API.
+
+Responses are serialized with orjson when it is installed. Endpoints wrapped
+with `fast_json` hand their dict straight to `FastJSONResponse`, skipping
+FastAPI's `jsonable_encoder` pass, which costs several times more than the
+serialization itself for a page of hits.
+
+`CompressionMiddleware` compresses complete responses with brotli or gzip,
+whichever the client prefers in `Accept-Encoding` (brotli only when the
+`brotli` package is installed).
+"""
+import functools
+import gzip
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+# Bodies smaller than this are not worth the compression CPU
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+# Fast brotli setting suited to dynamic responses (11 is for static assets)
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def fast_json(endpoint: Callable) -> Callable:
+    """Return the endpoint's dict as a FastJSONResponse (keeps its signature)."""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        result = await endpoint(*args, **kwargs)
+        return result if isinstance(result, Response) else FastJSONResponse(result)
+    return wrapper
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, honoring q-values."""
+    prefs: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        prefs[name.strip()] = q
+    candidates = [e for e in (("br", "gzip") if brotli is not None else ("gzip",)) if prefs.get(e, prefs.get("*", 0.0)) > 0]
+    if not candidates:
+        return None
+    # max() keeps the first of equal preferences, so brotli wins ties
+    return max(candidates, key=lambda e: prefs.get(e, prefs.get("*", 0.0)))
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing single-message responses.
+
+    Streamed responses (several body messages) pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_COMPRESS_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: List[Dict[str, Any]] = []
+        passthrough = [False]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                start.append(message)
+                return
+            if message["type"] != "http.response.body" or passthrough[0]:
+                await send(message)
+                return
+            body, more = message.get("body", b""), message.get("more_body", False)
+            headers = MutableHeaders(raw=start[0]["headers"])
+            compressible = (
+                not more
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            )
+            if compressible:
+                body = compress(body, encoding)
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = dict(message, body=body)
+            else:
+                passthrough[0] = True
+            await send(start[0])
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,335 @@
+"""In-process search engine used by the API when Elasticsearch is unavailable.
+
+Documents are tokenized once when the engine is built. Text queries walk the
+postings lists of the query terms and are ranked with BM25, mirroring the
+`multi_match` (best_fields) query that `build_es_body` sends to ES:
+
+  - title (boost 3) and description are analyzed with a lowercase tokenizer
+  - query terms also match title and description terms within the edit
+    distance of `fuzziness: AUTO`, looked up in a deletion dictionary
+    (api/fuzzy.py) and scored lower the more edits they need
+  - title.autocomplete matches query terms as prefixes of title terms
+  - sku is matched as a whole keyword
+
+Filters and facets run on typed columns built once at load time: a float
+price array, dictionary-encoded color codes and a document x size membership
+bitmap. Filters are vectorized mask operations and facet counts come from
+bincount-style reductions over the matching rows.
+"""
+import math
+import re
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from api.fuzzy import DeletionIndex
+from index_tools.color_utils import infer_color_from_url
+from index_tools.doc_utils import flatten_sizes, parse_price
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Field boosts, kept in sync with the `fields` of the ES multi_match query
+TEXT_FIELDS = {"title": 3.0, "description": 1.0}
+AUTOCOMPLETE_BOOST = 1.0
+SKU_BOOST = 1.0
+# Same as the edge_ngram_filter min_gram in index_tools/create_index.py
+AUTOCOMPLETE_MIN_GRAM = 2
+
+# Price facets, shared with the ES aggregations built in api/main.py
+PRICE_HISTOGRAM_INTERVAL = 25.0
+PRICE_RANGES: List[Tuple[Optional[float], Optional[float]]] = [
+    (None, 25.0), (25.0, 50.0), (50.0, 100.0), (100.0, 200.0), (200.0, None),
+]
+
+# Posting: (doc id, term frequency)
+Posting = Tuple[int, int]
+
+
+def tokenize(text: Any) -> List[str]:
+    """Lowercase and split text into word tokens."""
+    if text is None:
+        return []
+    if isinstance(text, list):
+        text = " ".join(str(t) for t in text if t is not None)
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def resolve_color(doc: Dict[str, Any]) -> str:
+    """Return the stored color of a document, inferring it from the URL if missing."""
+    c = (doc.get("color") or "").lower()
+    if not c or c == "unknown":
+        c = infer_color_from_url(doc.get("url") or "").lower()
+    return c
+
+
+class SearchEngine:
+    """Inverted index with BM25 ranking over a list of product documents."""
+
+    def __init__(self, docs: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75):
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+
+        self.postings: Dict[str, Dict[str, List[Posting]]] = {f: {} for f in TEXT_FIELDS}
+        self.field_lengths: Dict[str, List[int]] = {f: [] for f in TEXT_FIELDS}
+        self.avg_length: Dict[str, float] = {}
+        self.sku_postings: Dict[str, List[int]] = {}
+
+        prices: List[float] = []
+        self.colors: List[str] = []
+        self.sizes: List[List[str]] = []
+        # Dictionary encoding: value -> code, code -> value
+        self.color_codes: Dict[str, int] = {}
+        self.color_labels: List[str] = []
+        self.size_codes: Dict[str, int] = {}
+        self.size_labels: List[str] = []
+
+        for doc_id, doc in enumerate(docs):
+            self._add(doc_id, doc)
+            p = parse_price(doc.get("price"))
+            prices.append(np.nan if p is None else p)
+
+        for f, lengths in self.field_lengths.items():
+            self.avg_length[f] = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+        # Sorted title vocabulary, used for prefix (autocomplete) expansion
+        self.title_vocab: List[str] = sorted(self.postings["title"])
+        # Typo-tolerant lookup over the title and description vocabulary
+        self.fuzzy = DeletionIndex(t for f in TEXT_FIELDS for t in self.postings[f])
+
+        # --- columns ---
+        n = len(docs)
+        self.price = np.array(prices, dtype=np.float64)
+        self.color = np.array([self.color_codes[c] for c in self.colors], dtype=np.int32)
+        self.size_bitmap = np.zeros((n, len(self.size_labels)), dtype=bool)
+        for doc_id, sizes in enumerate(self.sizes):
+            for s in sizes:
+                self.size_bitmap[doc_id, self.size_codes[s]] = True
+        # Sort keys with missing prices last in both directions
+        has_price = ~np.isnan(self.price)
+        self._price_asc = np.where(has_price, self.price, np.inf)
+        self._price_desc = np.where(has_price, -self.price, np.inf)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _add(self, doc_id: int, doc: Dict[str, Any]) -> None:
+        for f in TEXT_FIELDS:
+            tokens = tokenize(doc.get(f))
+            self.field_lengths[f].append(len(tokens))
+            tf: Dict[str, int] = {}
+            for t in tokens:
+                tf[t] = tf.get(t, 0) + 1
+            field_postings = self.postings[f]
+            for t, n in tf.items():
+                field_postings.setdefault(t, []).append((doc_id, n))
+
+        sku = doc.get("sku")
+        if sku not in (None, ""):
+            self.sku_postings.setdefault(str(sku).lower(), []).append(doc_id)
+
+        color = resolve_color(doc)
+        self.colors.append(color)
+        if color not in self.color_codes:
+            self.color_codes[color] = len(self.color_labels)
+            self.color_labels.append(color)
+
+        sizes = flatten_sizes(doc.get("sizes"))
+        self.sizes.append(sizes)
+        for s in sizes:
+            if s not in self.size_codes:
+                self.size_codes[s] = len(self.size_labels)
+                self.size_labels.append(s)
+
+    # --- scoring -----------------------------------------------------------
+
+    def _idf(self, df: int) -> float:
+        n = len(self.docs)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _score_postings(self, field: str, postings: List[Posting], boost: float, scores: Dict[int, float], df: Optional[int] = None) -> None:
+        idf = self._idf(df if df is not None else len(postings))
+        avg = self.avg_length[field] or 1.0
+        lengths = self.field_lengths[field]
+        k1, b = self.k1, self.b
+        for doc_id, tf in postings:
+            norm = tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc_id] / avg))
+            scores[doc_id] = scores.get(doc_id, 0.0) + boost * idf * norm
+
+    def _prefix_terms(self, prefix: str) -> Iterable[str]:
+        vocab = self.title_vocab
+        i = bisect_left(vocab, prefix)
+        while i < len(vocab) and vocab[i].startswith(prefix):
+            yield vocab[i]
+            i += 1
+
+    def _variants(self, term: str) -> List[Tuple[str, float]]:
+        """The term plus its fuzzy variants, each with a boost that shrinks
+        with the share of edited characters (as Lucene's FuzzyQuery does)."""
+        variants = [(term, 1.0)]
+        for candidate, dist in self.fuzzy.lookup(term):
+            if candidate != term:
+                variants.append((candidate, 1.0 - dist / min(len(term), len(candidate))))
+        return variants
+
+    def match(self, q: str) -> Dict[int, float]:
+        """Return {doc id: score} for documents matching any query term."""
+        terms = tokenize(q)
+        field_scores: List[Dict[int, float]] = []
+        variants = {t: self._variants(t) for t in terms}
+
+        for f, boost in TEXT_FIELDS.items():
+            scores: Dict[int, float] = {}
+            for t in terms:
+                matched = [(self.postings[f][term], sim) for term, sim in variants[t] if term in self.postings[f]]
+                # Variants share the highest document frequency among them
+                # (Lucene's blended frequencies), so a rare misspelling in the
+                # corpus does not outrank the common spelling
+                df = max((len(postings) for postings, _ in matched), default=0)
+                # Each query term counts once, with its best scoring variant
+                best: Dict[int, float] = {}
+                for postings, similarity in matched:
+                    expanded: Dict[int, float] = {}
+                    self._score_postings(f, postings, boost * similarity, expanded, df)
+                    for doc_id, s in expanded.items():
+                        if s > best.get(doc_id, 0.0):
+                            best[doc_id] = s
+                for doc_id, s in best.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + s
+            field_scores.append(scores)
+
+        # title.autocomplete: each query term counts once, with the best
+        # scoring title term it is a prefix of
+        auto: Dict[int, float] = {}
+        for t in terms:
+            if len(t) < AUTOCOMPLETE_MIN_GRAM:
+                continue
+            best: Dict[int, float] = {}
+            for term in self._prefix_terms(t):
+                expanded: Dict[int, float] = {}
+                self._score_postings("title", self.postings["title"][term], AUTOCOMPLETE_BOOST, expanded)
+                for doc_id, s in expanded.items():
+                    if s > best.get(doc_id, 0.0):
+                        best[doc_id] = s
+            for doc_id, s in best.items():
+                auto[doc_id] = auto.get(doc_id, 0.0) + s
+        field_scores.append(auto)
+
+        sku_hits = self.sku_postings.get(q.strip().lower())
+        if sku_hits:
+            idf = self._idf(len(sku_hits))
+            field_scores.append({doc_id: SKU_BOOST * idf for doc_id in sku_hits})
+
+        # best_fields: a document scores as its best matching field
+        combined: Dict[int, float] = {}
+        for scores in field_scores:
+            for doc_id, s in scores.items():
+                if s > combined.get(doc_id, 0.0):
+                    combined[doc_id] = s
+        return combined
+
+    # --- filtering ---------------------------------------------------------
+
+    def filter_mask(self, min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str]) -> np.ndarray:
+        """Boolean row mask of the documents that pass every filter."""
+        mask = np.ones(len(self.docs), dtype=bool)
+        if color:
+            code = self.color_codes.get(color.lower())
+            if code is None:
+                return np.zeros(len(self.docs), dtype=bool)
+            mask &= self.color == code
+        if size:
+            code = self.size_codes.get(size)
+            if code is None:
+                return np.zeros(len(self.docs), dtype=bool)
+            mask &= self.size_bitmap[:, code]
+        # NaN compares False, so documents without a price drop out here
+        if min_price is not None:
+            mask &= self.price >= min_price
+        if max_price is not None:
+            mask &= self.price <= max_price
+        return mask
+
+    def search(self, q: Optional[str], min_price: Optional[float], max_price: Optional[float], size: Optional[str], color: Optional[str], sort: Optional[str]) -> np.ndarray:
+        """Return the ids of every matching document, in result order."""
+        mask = self.filter_mask(min_price, max_price, size, color)
+        scores: Optional[np.ndarray] = None
+        if q:
+            matched = self.match(q)
+            text_mask = np.zeros(len(self.docs), dtype=bool)
+            scores = np.zeros(len(self.docs), dtype=np.float64)
+            if matched:
+                ids = np.fromiter(matched.keys(), dtype=np.int64, count=len(matched))
+                text_mask[ids] = True
+                scores[ids] = np.fromiter(matched.values(), dtype=np.float64, count=len(matched))
+            mask &= text_mask
+
+        ids = np.flatnonzero(mask)
+        # ids are ascending, so stable sorts break ties by document order
+        if sort == "price_asc":
+            return ids[np.argsort(self._price_asc[ids], kind="stable")]
+        if sort == "price_desc":
+            return ids[np.argsort(self._price_desc[ids], kind="stable")]
+        if scores is not None:
+            return ids[np.argsort(-scores[ids], kind="stable")]
+        return ids
+
+    # --- facets ------------------------------------------------------------
+
+    def aggregations(self, ids: np.ndarray) -> Dict[str, Any]:
+        """Compute the sizes, colors and price facets of the given documents."""
+        size_counts = self.size_bitmap[ids].sum(axis=0)
+        color_counts = np.bincount(self.color[ids], minlength=len(self.color_labels))
+        prices = self.price[ids]
+        prices = prices[~np.isnan(prices)]
+
+        aggs: Dict[str, Any] = {}
+        aggs["sizes"] = {"buckets": _term_buckets(self.size_labels, size_counts)}
+        aggs["colors"] = {"buckets": _term_buckets(self.color_labels, color_counts)}
+        if prices.size:
+            aggs["price_stats"] = {"min": float(prices.min()), "max": float(prices.max()), "avg": float(prices.mean()), "count": int(prices.size)}
+        else:
+            aggs["price_stats"] = {"min": None, "max": None, "avg": None, "count": 0}
+        aggs["price_histogram"] = {"buckets": _histogram_buckets(prices, PRICE_HISTOGRAM_INTERVAL)}
+        aggs["price_ranges"] = {"buckets": _range_buckets(prices, PRICE_RANGES)}
+        return aggs
+
+
+def _term_buckets(labels: List[str], counts: np.ndarray) -> List[Dict[str, Any]]:
+    """ES-style terms buckets: non-empty, by descending count then key."""
+    order = sorted(np.flatnonzero(counts), key=lambda i: (-counts[i], labels[i]))
+    return [{"key": labels[i], "doc_count": int(counts[i])} for i in order]
+
+
+def _histogram_buckets(prices: np.ndarray, interval: float) -> List[Dict[str, Any]]:
+    """ES-style histogram buckets between the lowest and highest price."""
+    if not prices.size:
+        return []
+    slots = np.floor(prices / interval).astype(np.int64)
+    first = int(slots.min())
+    counts = np.bincount(slots - first)
+    return [{"key": (first + i) * interval, "doc_count": int(c)} for i, c in enumerate(counts)]
+
+
+def _range_key(lo: Optional[float], hi: Optional[float]) -> str:
+    return f"{'*' if lo is None else lo}-{'*' if hi is None else hi}"
+
+
+def _range_buckets(prices: np.ndarray, ranges: List[Tuple[Optional[float], Optional[float]]]) -> List[Dict[str, Any]]:
+    """ES-style range buckets (`from` inclusive, `to` exclusive)."""
+    buckets = []
+    for lo, hi in ranges:
+        inside = np.ones(prices.size, dtype=bool)
+        if lo is not None:
+            inside &= prices >= lo
+        if hi is not None:
+            inside &= prices < hi
+        bucket: Dict[str, Any] = {"key": _range_key(lo, hi)}
+        if lo is not None:
+            bucket["from"] = lo
+        if hi is not None:
+            bucket["to"] = hi
+        bucket["doc_count"] = int(inside.sum())
+        buckets.append(bucket)
+    return buckets
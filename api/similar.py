@@ -0,0 +1,91 @@
+"""Precomputed "more like this" neighbors for product pages.
+
+Every product becomes an L2-normalized TF-IDF vector over its title and
+description terms, its color and its sizes (each feature family weighted, and
+prefixed so "black" the color and "black" the word stay distinct). Cosine
+similarities are computed in one batched matrix product per block of rows,
+and only the top-k neighbors of each product are kept, so serving a
+recommendation is a dictionary lookup plus a row read.
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from api.search_engine import resolve_color, tokenize
+from index_tools.doc_utils import doc_id, flatten_sizes
+
+# Relative weight of each feature family in the product vector
+FEATURE_WEIGHTS = {"title": 2.0, "description": 1.0, "color": 1.0, "size": 0.5}
+# Vocabulary cap (most frequent features), bounds the dense matrix width
+MAX_FEATURES = 4096
+SIMILAR_K = 10
+# Rows per matrix product, bounds the block x n similarity matrix
+BLOCK_ROWS = 512
+
+
+def _features(doc: Dict[str, Any]) -> List[Tuple[str, float]]:
+    feats: List[Tuple[str, float]] = []
+    for field in ("title", "description"):
+        feats.extend((f"{field}:{t}", FEATURE_WEIGHTS[field]) for t in tokenize(doc.get(field)))
+    color = resolve_color(doc)
+    if color and color != "unknown":
+        feats.append((f"color:{color}", FEATURE_WEIGHTS["color"]))
+    feats.extend((f"size:{s}", FEATURE_WEIGHTS["size"]) for s in flatten_sizes(doc.get("sizes")))
+    return feats
+
+
+class SimilarityIndex:
+    def __init__(self, docs: List[Dict[str, Any]], k: int = SIMILAR_K):
+        n = len(docs)
+        self.k = min(k, max(n - 1, 0))
+        # Product id (url, else sku, as in the ES index) -> row
+        self.rows: Dict[str, int] = {}
+        for row, doc in enumerate(docs):
+            key = doc_id(doc)
+            if key is not None:
+                self.rows.setdefault(str(key), row)
+
+        doc_features = [_features(d) for d in docs]
+        df: Dict[str, int] = {}
+        for feats in doc_features:
+            for name in {f for f, _ in feats}:
+                df[name] = df.get(name, 0) + 1
+        vocab = sorted(df, key=lambda f: (-df[f], f))[:MAX_FEATURES]
+        columns = {f: i for i, f in enumerate(vocab)}
+        idf = np.array([math.log((1 + n) / (1 + df[f])) + 1.0 for f in vocab], dtype=np.float32)
+
+        matrix = np.zeros((n, len(vocab)), dtype=np.float32)
+        for row, feats in enumerate(doc_features):
+            for name, weight in feats:
+                col = columns.get(name)
+                if col is not None:
+                    matrix[row, col] += weight
+        matrix *= idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1.0)
+
+        self.neighbors = np.zeros((n, self.k), dtype=np.int32)
+        self.scores = np.zeros((n, self.k), dtype=np.float32)
+        if self.k == 0:
+            return
+        for start in range(0, n, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, n)
+            sims = matrix[start:end] @ matrix.T
+            sims[np.arange(end - start), np.arange(start, end)] = -np.inf
+            top = np.argpartition(-sims, self.k - 1, axis=1)[:, :self.k]
+            top_scores = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            self.neighbors[start:end] = np.take_along_axis(top, order, axis=1)
+            self.scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def similar(self, product_id: str, k: int = SIMILAR_K) -> Optional[List[Tuple[int, float]]]:
+        """(row, cosine similarity) of the nearest products, or None if the id is unknown."""
+        row = self.rows.get(product_id)
+        if row is None:
+            return None
+        k = min(k, self.k)
+        return [(r, float(s)) for r, s in zip(self.neighbors[row, :k].tolist(), self.scores[row, :k].tolist()) if s > 0]
@@ -0,0 +1,100 @@
+"""In-memory title completions for search-as-you-type.
+
+Titles are ranked once by popularity (how many products share the title),
+then every word suffix of every title ("bodega hoodie black", "hoodie black",
+"black") is stored in one sorted array. A completion is a bisect for the
+prefix range, so "hoo" and "bodega ho" both reach "Bodega Hoodie Black".
+Titles that start with the prefix come before titles that only contain it
+further in.
+
+Short prefixes match a large slice of the array, so their top-k is
+precomputed; longer prefixes only cover a few keys and are ranked on the fly.
+"""
+import heapq
+import unicodedata
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Prefixes up to this length are answered from a precomputed top-k
+PRECOMPUTED_PREFIX_LENGTH = 3
+MAX_SUGGESTIONS = 10
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+class SuggestIndex:
+    def __init__(self, weighted_titles: Iterable[Tuple[str, int]], k: int = MAX_SUGGESTIONS):
+        merged: Dict[str, List[Any]] = {}
+        for title, weight in weighted_titles:
+            title = " ".join((title or "").split())
+            key = normalize_text(title)
+            if not key:
+                continue
+            # Titles differing only in case/accents are one suggestion
+            entry = merged.setdefault(key, [title, 0])
+            entry[1] += weight
+        # rank 0 is the most popular title; ties by title for a stable order
+        ranked = sorted(merged.items(), key=lambda kv: (-kv[1][1], kv[0]))
+        self.titles: List[str] = [v[0] for _, v in ranked]
+        self.weights: List[int] = [v[1] for _, v in ranked]
+        self.k = k
+
+        # Order of a key: its title's rank, pushed behind every title start
+        # when the key begins mid-title
+        n = len(ranked)
+        pairs: List[Tuple[str, int]] = []
+        for rank, (key, _) in enumerate(ranked):
+            words = key.split(" ")
+            for i in range(len(words)):
+                pairs.append((" ".join(words[i:]), rank if i == 0 else n + rank))
+        pairs.sort()
+        self._keys: List[str] = [p[0] for p in pairs]
+        self._order: List[int] = [p[1] for p in pairs]
+
+        top: Dict[str, set] = {}
+        for key, order in pairs:
+            for m in range(1, min(len(key), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                top.setdefault(key[:m], set()).add(order)
+        self._top = {p: self._best(orders, k) for p, orders in top.items()}
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def _best(self, orders: Iterable[int], k: int) -> List[int]:
+        """Ranks of the k best distinct titles."""
+        n = len(self.titles)
+        ranks: List[int] = []
+        for order in heapq.nsmallest(2 * k, orders):
+            rank = order % n
+            if rank not in ranks:
+                ranks.append(rank)
+                if len(ranks) == k:
+                    break
+        return ranks
+
+    def suggest(self, prefix: str, k: int = MAX_SUGGESTIONS) -> List[Dict[str, Any]]:
+        p = normalize_text(prefix or "")
+        if not p:
+            return []
+        if len(p) <= PRECOMPUTED_PREFIX_LENGTH and k <= self.k:
+            ranks = self._top.get(p, [])[:k]
+        else:
+            lo = bisect_left(self._keys, p)
+            hi = bisect_left(self._keys, p + "\uffff", lo)
+            ranks = self._best(set(self._order[lo:hi]), k)
+        return [{"text": self.titles[r], "weight": self.weights[r]} for r in ranks]
+
+
+def titles_from_docs(docs: Iterable[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    """Each product counts once for its title."""
+    return [(d.get("title") or "", 1) for d in docs]
+
+
+def titles_from_terms_agg(buckets: Iterable[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    """Titles of a `terms` aggregation on `title.keyword`, weighted by doc_count."""
+    return [(b["key"], b["doc_count"]) for b in buckets]
@@ -5,6 +5,8 @@ export default function ProductDetailModal({ product, onClose }) {
   const images = (product && (product.images || product.image)) || [];
   const imgs = Array.isArray(images) ? images : (images ? [images] : []);
   const [idx, setIdx] = useState(0);
+  const [similar, setSimilar] = useState([]);
+  const productId = product && (product.url || product.sku);
 
   useEffect(() => {
     function onKey(e) {
@@ -16,6 +18,16 @@ export default function ProductDetailModal({ product, onClose }) {
     return () => document.removeEventListener("keydown", onKey);
   }, [imgs.length, onClose]);
 
+  useEffect(() => {
+    if (!productId) return;
+    let cancelled = false;
+    fetch(`http://localhost:8000/products/${encodeURIComponent(productId)}/similar?k=6`)
+      .then(r => r.ok ? r.json() : null)
+      .then(data => { if (!cancelled && data && data.hits) setSimilar(data.hits); })
+      .catch(() => {});
+    return () => { cancelled = true; };
+  }, [productId]);
+
   if (!product) return null;
 
   const title = product.title || product.name || "No title";
@@ -64,6 +76,23 @@ export default function ProductDetailModal({ product, onClose }) {
                 <div className="pdm-sizes-list">{sizesArr.map(s => <span key={s} className="pdm-size">{s}</span>)}</div>
               </div>
             )}
+            {similar.length > 0 && (
+              <div className="pdm-similar">
+                <div className="pdm-sizes-label">Similar products</div>
+                <div className="pdm-similar-list">
+                  {similar.map(p => {
+                    const pImgs = p.images || p.image || [];
+                    const thumb = Array.isArray(pImgs) ? pImgs[0] : pImgs;
+                    return (
+                      <a key={p.url || p.sku} className="pdm-similar-item" href={p.url} target="_blank" rel="noopener noreferrer">
+                        {thumb ? <img src={thumb} alt={p.title} /> : <div className="pdm-no-image">No image</div>}
+                        <span>{p.title}</span>
+                      </a>
+                    );
+                  })}
+                </div>
+              </div>
+            )}
           </div>
         </div>
       </div>
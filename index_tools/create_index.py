@@ -1,6 +1,8 @@
+import os
+
 from elasticsearch import Elasticsearch
 
-es = Elasticsearch(hosts=["http://localhost:9200"])
+es = Elasticsearch(hosts=[os.environ.get("ES_HOST", "http://localhost:9200")])
 
 index_name = "scuffers_products"
 
@@ -49,16 +51,30 @@ mapping = {
             "sku": {"type": "keyword"},
             "availability": {"type": "keyword"},
             "sizes": {"type": "keyword"},
-            "size": {"type": "keyword"}
-                    ,
-                    "color": {"type": "keyword"}
+            "size": {"type": "keyword"},
+            "color": {"type": "keyword"},
+            "content_hash": {"type": "keyword", "index": False}
         }
     }
 }
 
-# Create index (will raise if index exists)
-if es.indices.exists(index=index_name):
-    print(f"Index '{index_name}' already exists. Skipping creation.")
-else:
-    es.indices.create(index=index_name, body=mapping)
-    print(f"Index '{index_name}' created with mapping.")
\ No newline at end of file
+
+
+def create_index(name: str = index_name, settings: dict = None) -> bool:
+    """Create an index with the mapping above; extra `settings` are merged in.
+
+    Returns False (and does nothing) if the index or an alias with that name exists.
+    """
+    if es.indices.exists(index=name):
+        return False
+    body = {"settings": dict(mapping["settings"], **(settings or {})), "mappings": mapping["mappings"]}
+    es.indices.create(index=name, body=body)
+    return True
+
+
+if __name__ == "__main__":
+    # Create index (skipped if it exists)
+    if create_index(index_name):
+        print(f"Index '{index_name}' created with mapping.")
+    else:
+        print(f"Index '{index_name}' already exists. Skipping creation.")
@@ -2,6 +2,9 @@
 """
 Safe delete for Elasticsearch index `scuffers_products`.
 
+If `scuffers_products` is an alias (see index_tools/reindex.py), every
+generation `scuffers_products_*` is deleted with it.
+
 Usage:
   python index_tools/delete_index.py        # interactive confirmation
   python index_tools/delete_index.py -y     # non-interactive (force)
@@ -32,15 +35,24 @@ def delete_index(force: bool = False) -> int:
         print(f"Índice '{INDEX}' no existe.")
         return 0
 
+    try:
+        # Concrete indices behind the name (itself, or the generations of the alias)
+        targets = sorted(es.indices.get(index=INDEX).body)
+        if INDEX not in targets:
+            targets = sorted(set(targets) | set(es.indices.get(index=f"{INDEX}_*").body))
+    except Exception as e:
+        print("Error resolviendo los índices:", e)
+        return 3
+
     if not force:
-        confirm = input(f"Vas a borrar el índice '{INDEX}'. ¿Confirmas? [y/N] ")
+        confirm = input(f"Vas a borrar {', '.join(repr(t) for t in targets)}. ¿Confirmas? [y/N] ")
         if confirm.lower() != "y":
             print("Cancelado por el usuario.")
             return 1
 
     try:
-        es.indices.delete(index=INDEX)
-        print(f"Índice '{INDEX}' borrado correctamente.")
+        es.indices.delete(index=",".join(targets))
+        print(f"Índice '{INDEX}' borrado correctamente ({', '.join(targets)}).")
         return 0
     except Exception as e:
         print("Error borrando índice:", e)
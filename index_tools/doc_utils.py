@@ -0,0 +1,163 @@
+"""Normalization helpers shared by the indexer, the scraper pipeline and the
+API fallback engine.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from index_tools.color_utils import infer_color_from_url
+
+# Fields every indexed document carries (None when missing)
+DOC_FIELDS = ('url', 'title', 'description', 'currency', 'images', 'sku', 'availability', 'sizes', 'size')
+
+# Keys tried (in order) to get a display label out of a regional size entry,
+# e.g. {"eu": "36", "uk": "4.5", "usw": "6.5", "available": "false"}
+SIZE_LABEL_KEYS = ('label', 'size', 'name', 'eu', 'value')
+
+
+def parse_price(p: Any) -> Optional[float]:
+    """Parse scraped price strings like '82.0,' or '69,95 €' into a float."""
+    if p is None:
+        return None
+    if isinstance(p, (int, float)):
+        return float(p)
+    try:
+        s = str(p).strip()
+        s = s.replace('€', '').replace('$', '')
+        if ',' in s and '.' not in s:
+            s = s.replace(',', '.')
+        s = s.replace(',', '')
+        return float(s)
+    except Exception:
+        return None
+
+
+def size_label(entry: Any) -> str:
+    """Return the flat label of one size entry (plain string or regional dict)."""
+    if isinstance(entry, dict):
+        for key in SIZE_LABEL_KEYS:
+            v = entry.get(key)
+            if v not in (None, ''):
+                return str(v).strip()
+        return ''
+    if entry is None:
+        return ''
+    return ' '.join(str(entry).split())
+
+
+def flatten_sizes(sizes: Any) -> List[str]:
+    """Flatten a `sizes` value into a de-duplicated list of string labels."""
+    if not sizes:
+        return []
+    if isinstance(sizes, str):
+        sizes = sizes.split(',')
+    elif isinstance(sizes, dict):
+        sizes = [sizes]
+    out: List[str] = []
+    seen = set()
+    for entry in sizes:
+        label = size_label(entry)
+        if label and label not in seen:
+            seen.add(label)
+            out.append(label)
+    return out
+
+
+# Dead-letter error of a document doc_id() has no id for: indexed anyway,
+# Elasticsearch would store it under a new random id on every load
+NO_ID_ERROR = {'type': 'missing_id', 'reason': 'document has neither url nor sku to build an _id'}
+
+
+def doc_id(doc: Dict[str, Any]) -> Optional[str]:
+    """Elasticsearch `_id` of a product: its URL, else its SKU."""
+    return doc.get('url') or doc.get('sku') or None
+
+
+def normalize_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Return an index-ready copy of a scraped product.
+
+    The price becomes a float, the color is inferred from the URL and `sizes`
+    is flattened to a list of labels so it fits the `keyword` mapping.
+    """
+    out = dict(doc)
+    out['price'] = parse_price(doc.get('price'))
+    try:
+        color = infer_color_from_url(doc.get('url') or '')
+    except Exception:
+        color = 'unknown'
+    out['color'] = (color or 'unknown').lower()
+    sizes = flatten_sizes(doc.get('sizes'))
+    out['sizes'] = sizes
+    out['size'] = size_label(doc.get('size')) or (sizes[0] if sizes else None)
+    for k in DOC_FIELDS:
+        if k not in out:
+            out[k] = None
+    return out
+
+
+def content_hash(doc: Dict[str, Any]) -> str:
+    """Fingerprint of a normalized document, independent of key order.
+
+    Stored in the `content_hash` field so a later load can tell unchanged
+    documents apart without fetching their whole source.
+    """
+    payload = {k: v for k, v in doc.items() if k != 'content_hash'}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def iter_feed(path: Path, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Stream the documents of a scraper feed without loading it whole.
+
+    Accepts the JSON array written by `scrapy crawl -O file.json` and the
+    JSON-lines format (`-O file.jsonl`). Only one chunk plus the document
+    being decoded is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with Path(path).open('r', encoding='utf-8') as f:
+        buf = f.read(chunk_size)
+        pos = 0
+        eof = not buf
+
+        def refill() -> bool:
+            nonlocal buf, pos, eof
+            more = f.read(chunk_size)
+            buf = buf[pos:] + more
+            pos = 0
+            eof = not more
+            return bool(more)
+
+        def skip(chars: str) -> None:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                refill()
+
+        skip(' \t\r\n\ufeff')
+        if pos >= len(buf):
+            return
+        array = buf[pos] == '['
+        if array:
+            pos += 1
+
+        while True:
+            skip(' \t\r\n,' if array else ' \t\r\n')
+            if pos >= len(buf) or (array and buf[pos] == ']'):
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill()
+                continue
+            if end == len(buf) and not eof:
+                # A scalar at the chunk edge may continue in the next chunk
+                refill()
+                continue
+            pos = end
+            yield obj
@@ -0,0 +1,110 @@
+"""Elasticsearch write helpers shared by the indexing scripts and the scraper pipeline."""
+import json
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout, Elasticsearch
+
+# Bulk item statuses worth retrying: rejected (queue full) or node unavailable
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+def stamp_index_version(es: Elasticsearch, index: str) -> str:
+    """Record a new data version in the index mapping `_meta`.
+
+    The search API includes this version in its result cache keys, so bumping
+    it after a load invalidates every cached response for the old data.
+    """
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ')
+    es.indices.put_mapping(index=index, meta={'version': version})
+    return version
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _operations(actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    ops: List[Dict[str, Any]] = []
+    for a in actions:
+        op = a.get('_op_type', 'index')
+        meta = {'_index': a['_index']}
+        if a.get('_id') is not None:
+            meta['_id'] = a['_id']
+        ops.append({op: meta})
+        if op != 'delete':
+            ops.append(a['_source'])
+    return ops
+
+
+def _is_retryable_error(exc: Exception) -> bool:
+    if isinstance(exc, (ConnectionError, ConnectionTimeout)):
+        return True
+    return isinstance(exc, ApiError) and exc.status_code in RETRYABLE_STATUS
+
+
+def send_bulk(
+    es: Elasticsearch,
+    actions: List[Dict[str, Any]],
+    max_retries: int = 3,
+    backoff: float = 0.5,
+    on_retry: Optional[Callable[[int], None]] = None,
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """Send a batch of bulk actions, retrying only the items that were rejected.
+
+    Actions use the `helpers.bulk` shape (`_op_type`, `_index`, `_id`,
+    `_source`). Items rejected with 429/5xx, or the whole batch when the
+    request itself fails on the transport, are resent with exponential
+    backoff. Returns (number succeeded, failures), where each failure has the
+    `_id`, `status`, `error` and the original `action`.
+    """
+    pending = list(actions)
+    succeeded = 0
+    failures: List[Dict[str, Any]] = []
+    attempt = 0
+    while pending:
+        try:
+            resp = es.bulk(operations=_operations(pending))
+        except Exception as e:
+            if attempt < max_retries and _is_retryable_error(e):
+                if on_retry:
+                    on_retry(len(pending))
+                time.sleep(backoff_delay(attempt, backoff))
+                attempt += 1
+                continue
+            status = e.status_code if isinstance(e, ApiError) else None
+            failures.extend({'_id': a.get('_id'), 'status': status, 'error': str(e), 'action': a} for a in pending)
+            break
+
+        retry = []
+        for a, result in zip(pending, resp['items']):
+            op, info = next(iter(result.items()))
+            status = info.get('status', 500)
+            if status < 300 or (op == 'delete' and status == 404):
+                succeeded += 1
+            elif status in RETRYABLE_STATUS and attempt < max_retries:
+                retry.append(a)
+            else:
+                failures.append({'_id': a.get('_id'), 'status': status, 'error': info.get('error'), 'action': a})
+        if retry:
+            if on_retry:
+                on_retry(len(retry))
+            time.sleep(backoff_delay(attempt, backoff))
+            attempt += 1
+        pending = retry
+    return succeeded, failures
+
+
+def write_dead_letters(path: Path, failures: Iterable[Dict[str, Any]]) -> int:
+    """Append failed actions to a JSON-lines dead-letter file."""
+    n = 0
+    with Path(path).open('a', encoding='utf-8') as f:
+        for failure in failures:
+            record = dict(failure, failed_at=datetime.now(timezone.utc).isoformat())
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            n += 1
+    return n
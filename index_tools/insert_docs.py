@@ -1,78 +1,238 @@
-from elasticsearch import Elasticsearch, helpers
+"""Load the scraper feed into Elasticsearch.
+
+Usage:
+  python index_tools/insert_docs.py [--file scuffers_output.json] [--index scuffers_products]
+                                    [--chunk-size 500] [--threads 4] [--max-retries 3]
+                                    [--dead-letter failed_bulk_errors.json]
+                                    [--full] [--max-delete-ratio 0.5]
+
+The feed is streamed document by document (JSON array or JSON lines), each
+document is normalized (float price, inferred color, flat `sizes` labels) and
+sent in chunks by `--threads` parallel bulk requests. Items rejected with
+429/5xx, and whole chunks whose request fails on the transport (connection
+refused, timeout), are retried with backoff; whatever still fails is written
+to a structured dead-letter report.
+
+Loads are incremental: every document carries a `content_hash` of its
+normalized content, and only documents whose hash differs from the one
+already in the index are sent. Documents of the index that are no longer in
+the feed are deleted, unless that would remove more than `--max-delete-ratio`
+of the index (a truncated feed should not empty it). `--full` re-sends
+every document.
+
+Reads ES host from ES_HOST env var (default http://localhost:9200).
+"""
+from elasticsearch import Elasticsearch, NotFoundError, helpers
+import argparse
 import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
 from pathlib import Path
-from color_utils import infer_color_from_url
 
-ES_HOST = "http://localhost:9200"
+# Allow `python index_tools/insert_docs.py` to import the index_tools package
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+	sys.path.insert(0, str(ROOT))
+
+from index_tools.doc_utils import NO_ID_ERROR, content_hash, doc_id, iter_feed, normalize_doc
+from index_tools.es_utils import send_bulk, stamp_index_version
+
+ES_HOST = os.environ.get("ES_HOST", "http://localhost:9200")
 INDEX_NAME = "scuffers_products"
+FEED_FILE = ROOT / 'scuffers_output.json'
+DEAD_LETTER_FILE = ROOT / 'failed_bulk_errors.json'
 
 es = Elasticsearch(hosts=[ES_HOST])
 
 
-def parse_price(p):
-	if p is None:
-		return None
-	try:
-		s = str(p).strip()
-		s = s.replace('€', '').replace('$', '')
-		s = s.replace('\u20ac', '')
-		if ',' in s and '.' not in s:
-			s = s.replace(',', '.')
-		s = s.replace(',', '')
-		return float(s)
-	except Exception:
-		return None
-
-
-def load_json(path: Path):
-	with path.open('r', encoding='utf-8') as f:
-		return json.load(f)
-
-
-def docs_from_file(path: Path):
-	data = load_json(path)
-	for doc in data:
-		price = parse_price(doc.get('price'))
-		doc['price'] = price
-		# infer color from url and normalize to lower-case
-		try:
-			color = infer_color_from_url(doc.get('url') or '')
-		except Exception:
-			color = 'unknown'
-		doc['color'] = (color or 'unknown').lower()
-		for k in ['url', 'title', 'description', 'currency', 'images', 'sku', 'availability', 'sizes', 'size']:
-			if k not in doc:
-				doc[k] = None
-		_id = None
-		if doc.get('url'):
-			_id = doc.get('url')
-		elif doc.get('sku'):
-			_id = doc.get('sku')
-
+def docs_from_file(path: Path, index: str = INDEX_NAME):
+	for doc in iter_feed(path):
+		doc = normalize_doc(doc)
+		doc['content_hash'] = content_hash(doc)
 		action = {
-			'_index': INDEX_NAME,
-			'_id': _id,
+			'_index': index,
+			'_id': doc_id(doc),
 			'_source': doc,
 		}
 		yield action
 
 
-def main():
-	path = Path(__file__).resolve().parents[1] / 'scuffers_output.json'
-	if not path.exists():
-		print(f"File not found: {path}")
-		return
+def indexed_hashes(index: str = INDEX_NAME):
+	"""`_id` -> stored content_hash (None for documents indexed without one)."""
+	hashes = {}
+	try:
+		for hit in helpers.scan(es, index=index, query={'query': {'match_all': {}}}, _source=['content_hash'], size=1000):
+			hashes[hit['_id']] = (hit.get('_source') or {}).get('content_hash')
+	except NotFoundError:
+		pass
+	return hashes
+
+
+def changed_docs(actions, known, counts, seen, full=False, skipped=None):
+	"""Pass through the actions whose content differs from the index (all of
+	them when `full`), counting added/updated/unchanged and collecting ids.
+
+	Documents without an `_id` (neither url nor sku) are held back and added
+	to `skipped`: Elasticsearch would index them under a fresh random id on
+	every load."""
+	for a in actions:
+		_id = a['_id']
+		if _id is None:
+			counts['no_id'] += 1
+			if skipped is not None:
+				skipped.append({'_id': None, 'status': None, 'error': NO_ID_ERROR, 'document': a['_source']})
+			continue
+		seen.add(_id)
+		if _id not in known:
+			counts['added'] += 1
+		elif known[_id] != a['_source']['content_hash']:
+			counts['updated'] += 1
+		else:
+			counts['unchanged'] += 1
+			if not full:
+				continue
+		yield a
+
+
+def _chunks(items, size):
+	items = iter(items)
+	while chunk := list(islice(items, size)):
+		yield chunk
+
+
+def _parallel_chunks(send, chunks, threads):
+	"""Yield send(chunk) for every chunk, `threads` at a time; at most twice
+	that many chunks are held in memory."""
+	with ThreadPoolExecutor(max_workers=threads) as pool:
+		in_flight = deque()
+		for chunk in chunks:
+			in_flight.append(pool.submit(send, chunk))
+			if len(in_flight) >= 2 * threads:
+				yield in_flight.popleft().result()
+		while in_flight:
+			yield in_flight.popleft().result()
+
+
+def _error_type(error):
+	if isinstance(error, dict):
+		return error.get('type') or 'unknown'
+	return type(error).__name__ if isinstance(error, Exception) else 'transport_error'
+
+
+def load(path: Path, index: str = INDEX_NAME, chunk_size: int = 500, threads: int = 4, max_retries: int = 3, full: bool = False, max_delete_ratio: float = 0.5):
+	"""Index the new and changed documents of a feed file, delete the ones
+	that left it, and return a report dict (counts plus failures)."""
+	started = time.time()
+	indexed, retried, deleted = 0, 0, 0
+	failures = []
+	known = indexed_hashes(index)
+	counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'no_id': 0}
+	seen = set()
+	skipped = []
+	retry_lock = threading.Lock()
+
+	def count_retries(n):
+		nonlocal retried
+		with retry_lock:
+			retried += n
+
+	def send(chunk):
+		# send_bulk retries rejected items and chunks that fail on the
+		# transport, so a lost connection fails only its own chunk
+		return send_bulk(es, chunk, max_retries=max_retries, on_retry=count_retries)
+
+	changed = changed_docs(docs_from_file(path, index), known, counts, seen, full, skipped)
+	for ok_count, failed in _parallel_chunks(send, _chunks(changed, chunk_size), threads):
+		indexed += ok_count
+		for f in failed:
+			failures.append({'_id': f['_id'], 'status': f['status'], 'error': f['error'], 'document': f['action'].get('_source')})
+	failures.extend(skipped)
+
+	# Only ids that were never seen in the feed, so a failed write is not
+	# mistaken for a vanished product
+	vanished = [_id for _id in known if _id not in seen]
+	delete_skipped = bool(vanished) and len(vanished) > max_delete_ratio * len(known)
+	if vanished and not delete_skipped:
+		for batch in _chunks([{'_op_type': 'delete', '_index': index, '_id': _id} for _id in vanished], chunk_size):
+			ok_count, failed = send_bulk(es, batch, max_retries=max_retries)
+			deleted += ok_count
+			for f in failed:
+				failures.append({'_id': f['_id'], 'status': f['status'], 'error': f['error'], 'document': None})
+
+	by_type = {}
+	for f in failures:
+		t = _error_type(f['error'])
+		by_type[t] = by_type.get(t, 0) + 1
+
+	return {
+		'index': index,
+		'source': str(path),
+		'started_at': datetime.fromtimestamp(started, timezone.utc).isoformat(),
+		'seconds': round(time.time() - started, 3),
+		'indexed': indexed,
+		'added': counts['added'],
+		'updated': counts['updated'],
+		'unchanged': counts['unchanged'],
+		'skipped_no_id': counts['no_id'],
+		'deleted': deleted,
+		'vanished': len(vanished),
+		'delete_skipped': delete_skipped,
+		'retried': retried,
+		'failed': len(failures),
+		'failures_by_type': by_type,
+		'failures': failures,
+	}
+
+
+def write_dead_letter_report(path: Path, report):
+	with Path(path).open('w', encoding='utf-8') as f:
+		json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Load the scraper feed into Elasticsearch.')
+	parser.add_argument('--file', type=Path, default=FEED_FILE)
+	parser.add_argument('--index', default=INDEX_NAME)
+	parser.add_argument('--chunk-size', type=int, default=500, help='documents per bulk request')
+	parser.add_argument('--threads', type=int, default=4, help='parallel bulk threads')
+	parser.add_argument('--max-retries', type=int, default=3, help='retries for 429/5xx-rejected documents and failed requests')
+	parser.add_argument('--dead-letter', type=Path, default=DEAD_LETTER_FILE)
+	parser.add_argument('--full', action='store_true', help='re-send unchanged documents too')
+	parser.add_argument('--max-delete-ratio', type=float, default=0.5, help='skip deletes above this fraction of the index')
+	args = parser.parse_args(argv)
+
+	if not args.file.exists():
+		print(f"File not found: {args.file}")
+		return 1
 
-	actions = docs_from_file(path)
-	success, failed = 0, 0
 	try:
-		resp = helpers.bulk(es, actions, stats_only=True)
-		success = resp
-		print(f"Indexed {success} documents into '{INDEX_NAME}'.")
+		report = load(args.file, args.index, args.chunk_size, args.threads, args.max_retries, args.full, args.max_delete_ratio)
 	except Exception as e:
 		print("Bulk indexing failed:", e)
+		return 2
 
+	print(f"Indexed {report['indexed']} documents into '{args.index}' in {report['seconds']}s "
+		f"({report['retried']} retried, {report['failed']} failed).")
+	print(f"Added {report['added']}, updated {report['updated']}, unchanged {report['unchanged']}, deleted {report['deleted']}.")
+	if report['skipped_no_id']:
+		print(f"Skipped {report['skipped_no_id']} documents without url or sku (listed in the report).")
+	if report['delete_skipped']:
+		print(f"Skipped deleting {report['vanished']} documents missing from the feed "
+			f"(more than {args.max_delete_ratio:.0%} of the index); check the feed or raise --max-delete-ratio.")
+	if report['failed']:
+		write_dead_letter_report(args.dead_letter, report)
+		print(f"Failures by type: {report['failures_by_type']}. Report written to {args.dead_letter}")
+	if report['indexed'] or report['deleted']:
+		version = stamp_index_version(es, args.index)
+		print(f"Index version set to {version}.")
+	return 0 if not report['failed'] else 3
 
-if __name__ == '__main__':
-	main()
 
+if __name__ == '__main__':
+	sys.exit(main())
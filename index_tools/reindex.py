@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Zero-downtime rebuild of the `scuffers_products` index.
+
+Usage:
+  python index_tools/reindex.py [--file scuffers_output.json] [--keep 2]
+                                [--chunk-size 500] [--threads 4] [--max-retries 3]
+                                [--max-failed 0] [--dead-letter failed_bulk_errors.json]
+
+Instead of delete + create + insert on the live index, every rebuild loads a
+new generation `scuffers_products_<YYYYmmddHHMMSS>` while the API keeps
+serving the current one through the `scuffers_products` alias:
+
+  1. create the generation with `refresh_interval: -1` and no replicas
+  2. bulk load the feed (index_tools/insert_docs.py)
+  3. restore the serving refresh interval and replica count, refresh,
+     force-merge to one segment and warm it with a few representative queries
+  4. swap the alias in one atomic `_aliases` call
+  5. delete all but the `--keep` most recent generations
+
+If the load fails (more than `--max-failed` documents rejected) the new
+generation is deleted and the alias is left untouched. A concrete index named
+`scuffers_products` left over from the old scripts is replaced in the same
+atomic call.
+
+Reads ES host from ES_HOST env var (default http://localhost:9200).
+"""
+import argparse
+import re
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Allow `python index_tools/reindex.py` to import the index_tools package
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from elasticsearch import NotFoundError
+
+from index_tools.create_index import create_index
+from index_tools.es_utils import stamp_index_version
+from index_tools.insert_docs import DEAD_LETTER_FILE, ES_HOST, FEED_FILE, INDEX_NAME, es, load, write_dead_letter_report
+
+ALIAS = INDEX_NAME
+# Fastest settings for a one-off bulk load: no periodic refreshes, no replica writes
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+# Used when there is no live generation to copy the serving settings from
+DEFAULT_REPLICAS = 1
+# Aggregations the search API runs on every request (see api/main.py)
+WARMUP_AGGS = {
+    "sizes": {"terms": {"field": "sizes", "size": 50}},
+    "colors": {"terms": {"field": "color", "size": 50}},
+    "price_stats": {"stats": {"field": "price"}},
+    "price_histogram": {"histogram": {"field": "price", "interval": 25, "min_doc_count": 1}},
+}
+WARMUP_QUERY_COUNT = 10
+
+
+def generation_name(alias: str = ALIAS, now: datetime = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return f"{alias}_{now:%Y%m%d%H%M%S}"
+
+
+def list_generations(alias: str = ALIAS) -> list:
+    """Concrete generations of `alias`, oldest first."""
+    pattern = re.compile(rf"^{re.escape(alias)}_\d{{14}}$")
+    try:
+        names = es.indices.get(index=f"{alias}_*", expand_wildcards="open,closed").body
+    except NotFoundError:
+        return []
+    return sorted(n for n in names if pattern.match(n))
+
+
+def alias_targets(alias: str = ALIAS) -> list:
+    try:
+        return sorted(es.indices.get_alias(name=alias).body)
+    except NotFoundError:
+        return []
+
+
+def serving_settings(live: list) -> dict:
+    """Refresh interval and replica count of the generation being replaced."""
+    settings = {"refresh_interval": None, "number_of_replicas": DEFAULT_REPLICAS}
+    if live:
+        current = es.indices.get_settings(index=live[0]).body[live[0]]["settings"]["index"]
+        # None resets refresh_interval to the cluster default
+        settings["refresh_interval"] = current.get("refresh_interval")
+        settings["number_of_replicas"] = int(current.get("number_of_replicas", DEFAULT_REPLICAS))
+    return settings
+
+
+def finalize(index: str, settings: dict) -> None:
+    """Restore serving settings and compact the freshly loaded generation."""
+    es.indices.put_settings(index=index, settings={"index": settings})
+    es.indices.refresh(index=index)
+    es.options(request_timeout=600).indices.forcemerge(index=index, max_num_segments=1)
+    # Primaries must be allocated before the alias points here
+    es.cluster.health(index=index, wait_for_status="yellow", timeout="60s")
+
+
+def warm(index: str, queries: int = WARMUP_QUERY_COUNT) -> int:
+    """Run the API's aggregations and a few title queries once, so the first
+    real requests after the swap do not pay for cold caches and global ordinals."""
+    bodies = [
+        {"size": 20, "query": {"match_all": {}}, "aggs": WARMUP_AGGS},
+        {"size": 20, "query": {"match_all": {}}, "sort": [{"price": {"order": "asc"}}]},
+        {"size": 20, "query": {"match_all": {}}, "sort": [{"price": {"order": "desc"}}]},
+    ]
+    sample = es.search(index=index, size=queries, source=["title"], query={"match_all": {}})
+    for hit in sample["hits"]["hits"]:
+        words = (hit["_source"].get("title") or "").split()
+        if words:
+            bodies.append({
+                "size": 20,
+                "query": {"multi_match": {"query": words[0], "fields": ["title^3", "title.autocomplete", "description", "sku"]}},
+                "aggs": WARMUP_AGGS,
+            })
+    for body in bodies:
+        es.search(index=index, **body)
+    return len(bodies)
+
+
+def swap_alias(alias: str, new_index: str) -> list:
+    """Point `alias` at `new_index` only, in one atomic call. Returns the
+    indices it pointed to before."""
+    previous = alias_targets(alias)
+    actions = [{"add": {"index": new_index, "alias": alias}}]
+    actions += [{"remove": {"index": old, "alias": alias}} for old in previous if old != new_index]
+    if not previous and es.indices.exists(index=alias):
+        # Concrete index from before aliases were used: it has to go in the same
+        # call, an alias cannot share the name of an existing index
+        actions.append({"remove_index": {"index": alias}})
+    es.indices.update_aliases(actions=actions)
+    return previous
+
+
+def prune(alias: str, keep: int) -> list:
+    """Delete all but the `keep` most recent generations (never the live one)."""
+    live = set(alias_targets(alias))
+    generations = list_generations(alias)
+    stale = [g for g in generations[:max(0, len(generations) - keep)] if g not in live]
+    for name in stale:
+        es.indices.delete(index=name)
+    return stale
+
+
+def reindex(path: Path, alias: str = ALIAS, keep: int = 2, chunk_size: int = 500, threads: int = 4, max_retries: int = 3, max_failed: int = 0):
+    """Build a new generation and swap it in. Returns (new index, load report,
+    swapped) where swapped is False when the load was rejected."""
+    new_index = generation_name(alias)
+    live = alias_targets(alias) or ([alias] if es.indices.exists(index=alias) else [])
+    settings = serving_settings(live)
+
+    if not create_index(new_index, settings=BULK_LOAD_SETTINGS):
+        raise RuntimeError(f"index '{new_index}' already exists")
+    try:
+        report = load(path, new_index, chunk_size, threads, max_retries)
+    except Exception:
+        es.indices.delete(index=new_index, ignore_unavailable=True)
+        raise
+    if not report["indexed"] or report["failed"] > max_failed:
+        es.indices.delete(index=new_index, ignore_unavailable=True)
+        return new_index, report, False
+
+    finalize(new_index, settings)
+    warm(new_index)
+    stamp_index_version(es, new_index)
+    swap_alias(alias, new_index)
+    report["pruned"] = prune(alias, keep)
+    return new_index, report, True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the index into a new generation and swap the alias.")
+    parser.add_argument("--file", type=Path, default=FEED_FILE)
+    parser.add_argument("--alias", default=ALIAS)
+    parser.add_argument("--keep", type=int, default=2, help="generations kept after the swap, live one included")
+    parser.add_argument("--chunk-size", type=int, default=500, help="documents per bulk request")
+    parser.add_argument("--threads", type=int, default=4, help="parallel bulk threads")
+    parser.add_argument("--max-retries", type=int, default=3, help="retries for 429/5xx-rejected documents")
+    parser.add_argument("--max-failed", type=int, default=0, help="rejected documents tolerated before aborting the swap")
+    parser.add_argument("--dead-letter", type=Path, default=DEAD_LETTER_FILE)
+    args = parser.parse_args(argv)
+
+    if not args.file.exists():
+        print(f"File not found: {args.file}")
+        return 1
+    if not es.ping():
+        print(f"Elasticsearch is not reachable at {ES_HOST}.")
+        return 2
+
+    try:
+        new_index, report, swapped = reindex(
+            args.file, args.alias, max(1, args.keep), args.chunk_size, args.threads, args.max_retries, args.max_failed,
+        )
+    except Exception as e:
+        print("Reindex failed, alias left untouched:", e)
+        return 2
+
+    if report["failed"]:
+        write_dead_letter_report(args.dead_letter, report)
+        print(f"Failures by type: {report['failures_by_type']}. Report written to {args.dead_letter}")
+    if not swapped:
+        print(f"Load into '{new_index}' rejected ({report['indexed']} indexed, {report['failed']} failed); "
+              f"'{new_index}' deleted, alias '{args.alias}' left untouched.")
+        return 3
+
+    print(f"Indexed {report['indexed']} documents into '{new_index}' in {report['seconds']}s; "
+          f"alias '{args.alias}' now points to it.")
+    if report["pruned"]:
+        print(f"Deleted old generations: {', '.join(report['pruned'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Shopify JSON catalog support for the scuffers spider.
+
+Shopify storefronts expose the whole catalog as paginated JSON at
+`/products.json?limit=250&page=N` (and a single product at
+`/products/<handle>.json`, see tools/inspect_scuffers_product.py). One page
+carries up to 250 products with all their variants, options, prices and
+images, so the catalog can be enumerated in a handful of requests.
+"""
+from typing import Any, Dict, List, Optional
+
+from parsel import Selector
+
+# Shopify's maximum page size for /products.json
+CATALOG_PAGE_SIZE = 250
+# Option names that hold the product size (lowercased)
+SIZE_OPTION_NAMES = ('size', 'talla', 'taille', 'talle')
+# Item fields that are fetched from the product HTML page when the JSON
+# catalog leaves them empty
+HTML_FALLBACK_FIELDS = ('title', 'description', 'price', 'images')
+
+
+def catalog_page_url(base_url: str, page: int, limit: int = CATALOG_PAGE_SIZE) -> str:
+    return f"{base_url.rstrip('/')}/products.json?limit={limit}&page={page}"
+
+
+def product_url(base_url: str, handle: str) -> str:
+    return f"{base_url.rstrip('/')}/products/{handle}"
+
+
+def _html_text(html: Optional[str]) -> str:
+    if not html:
+        return ''
+    parts = Selector(text=html).xpath('//text()').getall()
+    return ' '.join(' '.join(parts).split())
+
+
+def _size_values(product: Dict[str, Any]) -> List[str]:
+    for opt in product.get('options') or []:
+        if str(opt.get('name') or '').strip().lower() in SIZE_OPTION_NAMES:
+            return [str(v).strip() for v in opt.get('values') or [] if str(v).strip()]
+    return []
+
+
+def item_from_catalog_product(product: Dict[str, Any], base_url: str, currency: str = '') -> Dict[str, Any]:
+    """Map one /products.json product to the fields of ScraperItem."""
+    variants = [v for v in product.get('variants') or [] if isinstance(v, dict)]
+    available = [v for v in variants if v.get('available')]
+    first = (available or variants or [{}])[0]
+
+    sizes = _size_values(product)
+    item = {
+        'url': product_url(base_url, product.get('handle') or ''),
+        'title': (product.get('title') or '').strip(),
+        'description': _html_text(product.get('body_html')),
+        'price': str(first.get('price') or '').strip(),
+        'currency': currency,
+        'images': [img.get('src') for img in product.get('images') or [] if isinstance(img, dict) and img.get('src')],
+        'sku': str(first.get('sku') or '').strip(),
+        # Same labels as the schema.org availability read from JSON-LD
+        'availability': ('InStock' if available else 'OutOfStock') if variants else '',
+        'sizes': sizes,
+        'size': sizes[0] if sizes else '',
+    }
+    return item
+
+
+def missing_fields(item: Dict[str, Any]) -> List[str]:
+    return [f for f in HTML_FALLBACK_FIELDS if not item.get(f)]
+
+
+def merge_missing(item: Dict[str, Any], html_item: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill the empty fields of a catalog item from the HTML-extracted item."""
+    merged = dict(item)
+    for k, v in html_item.items():
+        if not merged.get(k) and v:
+            merged[k] = v
+    return merged
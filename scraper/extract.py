@@ -0,0 +1,291 @@
+"""Single-parse extraction of scuffers.com pages.
+
+A page is parsed once into an lxml-backed parsel Selector (Scrapy responses
+already carry one as `response.selector`). That tree is shared by product
+detection, canonical URL lookup, link discovery and field extraction, and the
+JSON-LD blocks are decoded once with `json.loads` instead of being
+regex-scanned per field.
+
+The functions only take a URL and the page text/selector, so they can also
+run outside Scrapy (benchmarks, worker processes).
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from parsel import Selector
+
+LD_JSON_XPATH = '//script[@type="application/ld+json"]/text()'
+PRODUCT_TYPE_RE = re.compile(r'"@type"\s*:\s*"Product"')
+PRICE_RE = re.compile(r"(?:\$|€|£)?\s*(\d{1,3}(?:[.,]\d{2})?)")
+NUMBER_RE = re.compile(r'[\d.,]+')
+CURRENCY_CODE_RE = re.compile(r'\b([A-Z]{3})\b')
+
+PRODUCT_SELECTORS = '[data-product], form[action*="/cart/add"], .product-form, .product-single'
+PRICE_SELECTORS = '.price, .product__price, .product-price'
+SIZE_OPTION_SELECTORS = 'select[name*="size"] option, select[id*="size"] option, select[class*="size"] option'
+SIZE_PLACEHOLDERS = ('choose an option', 'select a size', 'select')
+# Regional size widget attributes that identify the variant, not the size
+REGIONAL_SIZE_SKIP = ('variant-id', 'variant_id', 'id')
+
+# avoid hitting checkout/cart/admin/account/search endpoints per robots.txt
+DISALLOWED_SUBSTRINGS = (
+    '/cart', '/carts', '/checkout', '/checkouts', '/orders', '/admin', '/account', '/search', '/policies', '/recommendations/products', '/sf_private_access_tokens'
+)
+# All of the above in one precompiled alternation
+DISALLOWED_RE = re.compile('|'.join(re.escape(s) for s in DISALLOWED_SUBSTRINGS))
+
+
+def _text(sel: Selector, strip_parts: bool = False) -> str:
+    parts = sel.xpath('.//text()').getall()
+    if strip_parts:
+        return ''.join(p.strip() for p in parts)
+    return ''.join(parts)
+
+
+def _find_product(data: Any) -> Optional[Dict[str, Any]]:
+    """Return the first JSON-LD object typed Product (looks into lists and @graph)."""
+    if isinstance(data, list):
+        for entry in data:
+            found = _find_product(entry)
+            if found is not None:
+                return found
+        return None
+    if not isinstance(data, dict):
+        return None
+    types = data.get('@type')
+    if types == 'Product' or (isinstance(types, list) and 'Product' in types):
+        return data
+    if '@graph' in data:
+        return _find_product(data['@graph'])
+    return None
+
+
+def read_product_ld(sel: Selector) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Decode the JSON-LD blocks once.
+
+    Returns (Product object or None, whether any block declares a Product).
+    Blocks that are not valid JSON still count as a Product declaration when
+    their text says so, like the old regex-based detection did.
+    """
+    declared = False
+    for txt in sel.xpath(LD_JSON_XPATH).getall():
+        try:
+            data = json.loads(txt)
+        except ValueError:
+            if PRODUCT_TYPE_RE.search(txt):
+                declared = True
+            continue
+        product = _find_product(data)
+        if product is not None:
+            return product, True
+    return None, declared
+
+
+def is_product_page(sel: Selector, ld_declared: bool) -> bool:
+    """Detect product pages using conservative heuristics."""
+    if ld_declared:
+        return True
+    # Open Graph product type
+    og = sel.xpath('//meta[@property="og:type"]/@content').get()
+    if og and og.lower() == 'product':
+        return True
+    # Common Shopify product selectors
+    return bool(sel.css(PRODUCT_SELECTORS))
+
+
+def canonical_url(sel: Selector, url: str) -> str:
+    href = sel.xpath('//link[@rel="canonical"]/@href').get()
+    return urljoin(url, href.strip()) if href and href.strip() else url
+
+
+def extract_links(sel: Selector, url: str, domain: str) -> List[str]:
+    """In-domain links of a page, minus the endpoints robots.txt disallows."""
+    links = []
+    for href in sel.xpath('//a/@href').getall():
+        if not href:
+            continue
+        link = urljoin(url, href)
+        # keep inside domain
+        if domain not in link:
+            continue
+        if DISALLOWED_RE.search(link):
+            continue
+        links.append(link)
+    return links
+
+
+def _first_offer(product: Dict[str, Any]) -> Dict[str, Any]:
+    offers = product.get('offers')
+    if isinstance(offers, list):
+        offers = next((o for o in offers if isinstance(o, dict)), None)
+    return offers if isinstance(offers, dict) else {}
+
+
+def _regional_sizes(sel: Selector) -> List[Dict[str, str]]:
+    regional_sizes = []
+    for wrapper in sel.css('div.selector-wrapper[data-option-name="size"]')[:1]:
+        for opt in wrapper.css('.size-region-option'):
+            entry = {}
+            for attr, val in opt.attrib.items():
+                if attr.startswith('data-'):
+                    key = attr[5:]
+                    if key in REGIONAL_SIZE_SKIP:
+                        continue
+                    entry[key] = val
+            if entry:
+                regional_sizes.append(entry)
+    return regional_sizes
+
+
+def _plain_sizes(sel: Selector) -> List[str]:
+    precomputed_sizes = []
+    for opt in sel.css(SIZE_OPTION_SELECTORS):
+        val = _text(opt).strip()
+        if val and val.lower() not in SIZE_PLACEHOLDERS:
+            precomputed_sizes.append(val)
+
+    for el in sel.css('[data-size], [data-value]'):
+        v = el.attrib.get('data-size') or el.attrib.get('data-value')
+        if v:
+            precomputed_sizes.append(v.strip())
+
+    seen_pre = set()
+    final_pre = []
+    for s in precomputed_sizes:
+        if not s:
+            continue
+        s_norm = ' '.join(str(s).split())
+        if s_norm in seen_pre:
+            continue
+        seen_pre.add(s_norm)
+        final_pre.append(s_norm)
+    return final_pre
+
+
+def extract_product(sel: Selector, url: str, text: str, product_ld: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the product item dict from an already parsed page."""
+    ld = product_ld or {}
+    offer = _first_offer(ld)
+    item: Dict[str, Any] = {'url': url}
+
+    # Title
+    title = ''
+    h1 = sel.css('h1')[:1]
+    if h1:
+        title = _text(h1[0], strip_parts=True)
+    if not title:
+        ttag = sel.css('title')[:1]
+        title = _text(ttag[0], strip_parts=True) if ttag else ''
+    item['title'] = title.strip() if title else ''
+
+    # Description
+    description = sel.css('div.metafield-rich_text_field p::text').get()
+    item['description'] = description.strip() if description else ''
+
+    # Price: JSON-LD offer first, then visible price selectors, then raw text
+    price = offer.get('price', ld.get('price'))
+    price = str(price).strip() if price not in (None, '') else ''
+    if not price:
+        for el in sel.css(PRICE_SELECTORS):
+            m = NUMBER_RE.search(_text(el))
+            if m:
+                price = m.group(0)
+                break
+    if not price:
+        m = PRICE_RE.search(text or '')
+        if m:
+            price = m.group(1)
+
+    # Currency: JSON-LD priceCurrency first, fallback to visible price text
+    currency = offer.get('priceCurrency') or ld.get('priceCurrency') or ''
+    if not currency:
+        price_text = sel.css('.price::text, .product__price::text, .product-price::text').get() or ''
+        if '€' in price_text:
+            currency = 'EUR'
+        elif '$' in price_text:
+            currency = 'USD'
+        elif '£' in price_text:
+            currency = 'GBP'
+        else:
+            mcode = CURRENCY_CODE_RE.search(price_text)
+            if mcode:
+                currency = mcode.group(1)
+
+    item['price'] = price
+    item['currency'] = currency
+
+    # Images
+    product_imgs = []
+    for div in sel.css('div.product-media'):
+        src = div.css('img.rimage__image::attr(src)').get()
+        if src:
+            product_imgs.append('https:' + src if src.startswith('//') else urljoin(url, src))
+    item['images'] = product_imgs
+
+    # SKU
+    sku = sel.css('[data-sku]::attr(data-sku)').get() or ''
+    if not sku:
+        selt = sel.css('.sku')[:1] or sel.css('.product-sku')[:1]
+        if selt:
+            sku = _text(selt[0]).strip()
+    if not sku:
+        sku = str(ld.get('sku') or offer.get('sku') or '')
+    item['sku'] = sku.strip() if sku else ''
+
+    # Availability: e.g. "http://schema.org/InStock" -> "InStock"
+    availability = str(offer.get('availability') or '')
+    availability = availability.rstrip('/').rsplit('/', 1)[-1] if '/' in availability else ''
+    if not availability:
+        availability = 'out_of_stock' if sel.css('.sold-out, .out-of-stock') else 'in_stock'
+    item['availability'] = availability
+
+    # Regional size widget first; plain size selectors otherwise
+    regional_sizes = _regional_sizes(sel)
+    if regional_sizes:
+        item['sizes'] = regional_sizes
+        first = regional_sizes[0]
+        first_label = first.get('label') or first.get('size') or first.get('name') or ''
+        item['size'] = str(first_label).strip()
+    else:
+        sizes = _plain_sizes(sel)
+        item['sizes'] = sizes
+        item['size'] = sizes[0] if sizes else ''
+
+    return item
+
+
+def parse_page(url: str, text: str, domain: str, sel: Optional[Selector] = None) -> Dict[str, Any]:
+    """Parse a page once and return everything the spider needs from it.
+
+    Product pages yield {'is_product': True, 'canonical': ..., 'item': {...}};
+    other pages yield {'is_product': False, 'links': [...]}.
+    """
+    if sel is None:
+        sel = Selector(text=text or '')
+    product_ld, declared = read_product_ld(sel)
+    if is_product_page(sel, declared):
+        return {
+            'is_product': True,
+            'canonical': canonical_url(sel, url),
+            'item': extract_product(sel, url, text, product_ld),
+        }
+    return {'is_product': False, 'links': extract_links(sel, url, domain)}
+
+
+def _decode(body: bytes, encoding: str) -> str:
+    return body.decode(encoding or 'utf-8', errors='replace')
+
+
+def parse_page_body(url: str, body: bytes, encoding: str, domain: str) -> Dict[str, Any]:
+    """parse_page() on a raw response body; runs in parse pool workers."""
+    return parse_page(url, _decode(body, encoding), domain)
+
+
+def parse_product_body(url: str, body: bytes, encoding: str) -> Dict[str, Any]:
+    """Product fields of a page known to be a product (catalog fallback)."""
+    text = _decode(body, encoding)
+    sel = Selector(text=text)
+    product_ld, _ = read_product_ld(sel)
+    return extract_product(sel, url, text, product_ld)
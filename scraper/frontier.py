@@ -0,0 +1,407 @@
+"""Priority crawl frontier for the scuffers spider.
+
+FrontierScheduler replaces Scrapy's scheduler with a frontier kept in SQLite.
+Every request is scored by the kind of page it points to, so products are
+downloaded before the listings that lead to more products, and both before
+anything else:
+
+  product  - /products/<handle> (and its collection/locale aliases)
+  listing  - /collections/... pages, including their ?page=N pagination
+  other    - home, content pages, sitemaps, catalog JSON
+
+Within a score requests are served in discovery order. The request's own
+priority (retries, DEPTH_PRIORITY) is added to the score.
+
+With JOBDIR (or FRONTIER_FILE) set the frontier lives on disk: queued and
+downloaded requests, and the fingerprints used to drop duplicates, survive a
+killed crawl, and running the same command again resumes where it stopped.
+Requests that were downloading when the crawl died are queued again.
+Requests that fail for good (dropped by robots.txt or the offsite filter,
+or still failing after RetryMiddleware's retries) are marked failed and are
+not fetched again. dont_filter requests (start URLs) are keyed by method and
+URL instead of a fingerprint, so a resume does not add them a second time;
+a retry takes the place of the request it repeats.
+Without either setting the frontier is kept in memory.
+
+Several crawler processes can share one FRONTIER_FILE, each started with its
+own FRONTIER_WORKER name (scraper/workers.py does this). A worker claims a
+request with a lease of FRONTIER_LEASE_TIMEOUT seconds; once the lease of a
+dead worker expires the request goes back to the queue, at most
+FRONTIER_MAX_ATTEMPTS times. An idle worker stays open while the others still
+hold live leases, since their pages may add new links. SharedPolitenessMiddleware
+keeps the delay of each download slot between the requests of all workers to
+it.
+
+Enabled through the SCHEDULER setting, together with FrontierMiddleware in
+SPIDER_MIDDLEWARES: a request only counts as done once the output of its
+callback (the links it found) has been handed to the frontier. Failed
+downloads are reported by FrontierFailureMiddleware in
+DOWNLOADER_MIDDLEWARES.
+
+Stats:
+  frontier/enqueued         - requests added to the frontier
+  frontier/duplicates       - requests dropped as already seen (by any worker)
+  frontier/dequeued/<kind>  - requests handed to the downloader, per kind
+  frontier/size             - requests queued now (frontier/max_size: peak)
+  frontier/resumed          - in-flight requests queued again on resume
+  frontier/failed           - requests given up after a download error
+  frontier/expired_leases   - requests taken back from a worker that died
+  frontier/politeness_wait  - seconds waited for the shared domain delay
+  frontier/yield            - items scraped per downloaded response
+"""
+import os
+import pickle
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.utils.request import request_from_dict
+
+from scraper.reactor import sleep
+from scraper.urls import product_handle, strip_locale
+
+# Score of each page kind; far enough apart that request priorities
+# (retries, depth) only reorder requests of the same kind
+KIND_SCORES = {'product': 200, 'listing': 100, 'other': 0}
+
+QUEUED, DOWNLOADING, DONE, FAILED = 0, 1, 2, 3
+
+# Longer than DOWNLOAD_TIMEOUT, so a slow download keeps its lease
+LEASE_TIMEOUT = 300
+MAX_ATTEMPTS = 3
+# Seconds a worker waits for another worker's write to finish
+BUSY_TIMEOUT = 30
+
+# Sent by FrontierMiddleware once a response's callback output is consumed
+response_processed = object()
+# Sent by FrontierFailureMiddleware when a request gets no response
+request_failed = object()
+
+
+def page_kind(url):
+    if product_handle(url) is not None:
+        return 'product'
+    if strip_locale(urlsplit(url).path).startswith('/collections'):
+        return 'listing'
+    return 'other'
+
+
+def connect(path):
+    # Autocommit + WAL: every change is durable without fsync per write, and
+    # the other workers' reads never block a write
+    db = sqlite3.connect(path, isolation_level=None, timeout=BUSY_TIMEOUT)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    return db
+
+
+class FrontierScheduler(BaseScheduler):
+    """Scrapy scheduler serving requests from the SQLite frontier, best score first."""
+
+    def __init__(self, crawler, path=':memory:', worker=None, lease_timeout=LEASE_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.path = path
+        # None when the frontier is not shared with other processes
+        self.worker = worker
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.fingerprinter = crawler.request_fingerprinter
+        self.spider = None
+        self.db = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        path = s.get('FRONTIER_FILE')
+        if not path and s.get('JOBDIR'):
+            os.makedirs(s['JOBDIR'], exist_ok=True)
+            path = os.path.join(s['JOBDIR'], 'frontier.sqlite')
+        worker = s.get('FRONTIER_WORKER')
+        if worker and not path:
+            raise NotConfigured('FRONTIER_WORKER needs a FRONTIER_FILE shared by the workers')
+        scheduler = cls(
+            crawler,
+            path or ':memory:',
+            worker=worker,
+            lease_timeout=s.getfloat('FRONTIER_LEASE_TIMEOUT', LEASE_TIMEOUT),
+            max_attempts=s.getint('FRONTIER_MAX_ATTEMPTS', MAX_ATTEMPTS),
+        )
+        crawler.signals.connect(scheduler.response_processed, signal=response_processed)
+        crawler.signals.connect(scheduler.request_failed, signal=request_failed)
+        if worker:
+            crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    @property
+    def owner(self):
+        return self.worker or 'main'
+
+    def open(self, spider):
+        self.spider = spider
+        self.db = connect(self.path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS frontier ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' fingerprint TEXT UNIQUE,'
+            ' score INTEGER NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' state INTEGER NOT NULL,'
+            ' request BLOB,'
+            ' owner TEXT,'
+            ' lease_until REAL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS frontier_next ON frontier (state, score DESC, id)')
+        # Only this worker's own requests: the other workers may still be running
+        resumed = self.db.execute(
+            'UPDATE frontier SET state = ?, owner = NULL, lease_until = NULL WHERE state = ? AND owner = ?',
+            (QUEUED, DOWNLOADING, self.owner),
+        ).rowcount
+        if resumed:
+            self.stats.set_value('frontier/resumed', resumed)
+        self._update_size()
+
+    def close(self, reason):
+        responses = self.stats.get_value('response_received_count', 0)
+        if responses:
+            self.stats.set_value('frontier/yield', round(self.stats.get_value('item_scraped_count', 0) / responses, 3))
+        # Requests dropped in flight (e.g. CLOSESPIDER_ITEMCOUNT) go back to
+        # the other workers now instead of when their lease expires
+        self.db.execute(
+            'UPDATE frontier SET state = ?, owner = NULL, lease_until = NULL, attempts = attempts - 1 WHERE state = ? AND owner = ?',
+            (QUEUED, DOWNLOADING, self.owner),
+        )
+        self.db.close()
+        self.db = None
+
+    def __len__(self):
+        # Counted in the database: other workers add and take requests too
+        return self.db.execute('SELECT COUNT(*) FROM frontier WHERE state = ?', (QUEUED,)).fetchone()[0]
+
+    def has_pending_requests(self):
+        self._expire_leases()
+        return self.db.execute('SELECT EXISTS(SELECT 1 FROM frontier WHERE state = ?)', (QUEUED,)).fetchone()[0] == 1
+
+    def _update_size(self):
+        size = len(self)
+        self.stats.set_value('frontier/size', size)
+        self.stats.max_value('frontier/max_size', size)
+
+    def _expire_leases(self):
+        """Queue again the requests whose worker let the lease run out."""
+        if self.worker is None:
+            return
+        # A request that keeps killing its worker is given up after max_attempts
+        expired = self.db.execute(
+            'UPDATE frontier SET state = CASE WHEN attempts < ? THEN ? ELSE ? END, owner = NULL, lease_until = NULL'
+            ' WHERE state = ? AND lease_until < ?',
+            (self.max_attempts, QUEUED, DONE, DOWNLOADING, time.time()),
+        ).rowcount
+        if expired:
+            self.stats.inc_value('frontier/expired_leases', expired)
+
+    def _done(self, frontier_id):
+        # The serialized request is not needed any more, only its fingerprint
+        self.db.execute('UPDATE frontier SET state = ?, request = NULL, lease_until = NULL WHERE id = ?', (DONE, frontier_id))
+
+    def _key(self, request):
+        # dont_filter requests bypass the duplicate check, but still need a
+        # stable key so a resume does not queue them again
+        if request.dont_filter:
+            return f'url:{request.method} {request.url}'
+        return self.fingerprinter.fingerprint(request).hex()
+
+    def enqueue_request(self, request):
+        kind = page_kind(request.url)
+        frontier_id = request.meta.pop('frontier_id', None)
+        data = pickle.dumps(request.to_dict(spider=self.spider), protocol=4)
+        if frontier_id is not None and request.dont_filter:
+            # A retry is queued again in the row of the request it repeats;
+            # the failed download does not count as a lost lease
+            self.db.execute(
+                'UPDATE frontier SET state = ?, score = ?, kind = ?, request = ?, owner = NULL, lease_until = NULL,'
+                ' attempts = MAX(attempts - 1, 0) WHERE id = ?',
+                (QUEUED, KIND_SCORES[kind] + request.priority, kind, data, frontier_id),
+            )
+            self.stats.inc_value('frontier/enqueued')
+            return True
+        # A redirect replaces the request it was created from
+        if frontier_id is not None:
+            self._done(frontier_id)
+        cur = self.db.execute(
+            'INSERT OR IGNORE INTO frontier (fingerprint, score, kind, state, request) VALUES (?, ?, ?, ?, ?)',
+            (self._key(request), KIND_SCORES[kind] + request.priority, kind, QUEUED, data),
+        )
+        if not cur.rowcount:
+            self.stats.inc_value('frontier/duplicates')
+            return False
+        self.stats.inc_value('frontier/enqueued')
+        return True
+
+    def next_request(self):
+        self._expire_leases()
+        # Select and claim in one statement, so no two workers get the same request
+        row = self.db.execute(
+            'UPDATE frontier SET state = ?, owner = ?, lease_until = ?, attempts = attempts + 1'
+            ' WHERE id = (SELECT id FROM frontier WHERE state = ? ORDER BY score DESC, id LIMIT 1)'
+            ' RETURNING id, kind, request',
+            (DOWNLOADING, self.owner, time.time() + self.lease_timeout, QUEUED),
+        ).fetchone()
+        if row is None:
+            return None
+        frontier_id, kind, data = row
+        self._update_size()
+        self.stats.inc_value(f'frontier/dequeued/{kind}')
+        request = request_from_dict(pickle.loads(data), spider=self.spider)
+        request.meta['frontier_id'] = frontier_id
+        return request
+
+    def response_processed(self, request):
+        frontier_id = request.meta.get('frontier_id')
+        if frontier_id is not None and self.db is not None:
+            self._done(frontier_id)
+
+    def request_failed(self, request):
+        frontier_id = request.meta.get('frontier_id')
+        if frontier_id is not None and self.db is not None:
+            self.db.execute(
+                'UPDATE frontier SET state = ?, request = NULL, lease_until = NULL WHERE id = ?', (FAILED, frontier_id)
+            )
+            self.stats.inc_value('frontier/failed')
+
+    def spider_idle(self, spider):
+        # Pages leased by other workers may still add links to the frontier;
+        # an expired lease belongs to a worker that is gone
+        busy = self.db.execute(
+            'SELECT EXISTS(SELECT 1 FROM frontier WHERE state = ? AND owner != ? AND lease_until >= ?)',
+            (DOWNLOADING, self.owner, time.time()),
+        ).fetchone()[0]
+        if busy:
+            raise DontCloseSpider
+
+
+class FrontierMiddleware:
+    """Spider middleware reporting fully processed responses to the frontier."""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _processed(self, response):
+        self.crawler.signals.send_catch_log(signal=response_processed, request=response.request)
+
+    def process_spider_output(self, response, result, spider=None):
+        yield from result
+        self._processed(response)
+
+    async def process_spider_output_async(self, response, result, spider=None):
+        async for r in result:
+            yield r
+        self._processed(response)
+
+    def process_spider_exception(self, response, exception, spider=None):
+        # A failing callback would fail again on resume
+        self._processed(response)
+
+
+class FrontierFailureMiddleware:
+    """Downloader middleware reporting requests that got no response to the frontier.
+
+    Placed below RetryMiddleware (550), so it only sees the exceptions that
+    are not retried: IgnoreRequest from robots.txt or the offsite filter, and
+    download errors that are left once the retries are used up. Without it
+    those requests would stay leased, and be fetched again on every resume.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_exception(self, request, exception, spider=None):
+        self.crawler.signals.send_catch_log(signal=request_failed, request=request)
+        return None
+
+
+class SharedPolitenessMiddleware:
+    """Downloader middleware spacing the requests of all frontier workers.
+
+    Each request books the next free turn of its download slot in the shared
+    frontier file, one slot delay after the previous one, and waits for it.
+    N workers together send a slot no more requests than one crawler with
+    that delay would.
+
+    The delay is the current delay of the worker's downloader slot: the one
+    AdaptiveThrottleMiddleware tunes per host profile (it runs first and
+    picks the slot), else DOWNLOAD_DELAY. FRONTIER_DOMAIN_DELAY is a floor
+    for every slot. A slot whose delay is 0 (e.g. the CDN profile) is not
+    spaced at all: only each worker's concurrency limits it.
+
+    The booked turn must also be when the request leaves the worker, so the
+    random jitter Scrapy adds to slot delays (DOWNLOAD_DELAY_JITTER) is turned
+    off for the slots of a worker: it could otherwise hold a request past the
+    next worker's turn. With a fixed slot delay no longer than the booked
+    one, a request that has a free place in its slot goes out at its turn.
+    Concurrency caps still apply per worker.
+    """
+
+    def __init__(self, crawler, path, delay=0.0):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.db = connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS politeness (domain TEXT PRIMARY KEY, next_at REAL NOT NULL)')
+        # Smallest delay of every slot
+        self.delay = delay
+        self.default_delay = crawler.settings.getfloat('DOWNLOAD_DELAY')
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        if not s.get('FRONTIER_WORKER'):
+            raise NotConfigured('only needed by the workers of a shared frontier')
+        return cls(crawler, s['FRONTIER_FILE'], s.getfloat('FRONTIER_DOMAIN_DELAY'))
+
+    def slot_delay(self, key):
+        engine = self.crawler.engine
+        slot = engine.downloader.slots.get(key) if engine else None
+        return max(self.delay, slot.delay if slot is not None else self.default_delay)
+
+    def request_reached_downloader(self, request, spider):
+        # Slots are created after the middlewares ran, and again after they
+        # are garbage-collected: turn the jitter off as the request arrives
+        slot = self.crawler.engine.downloader.slots.get(request.meta.get('download_slot'))
+        if slot is not None:
+            slot.jitter = 0.0
+
+    def _book(self, key, delay):
+        """Start of the slot's next free turn, taken by the caller."""
+        now = time.time()
+        next_at = self.db.execute(
+            'INSERT INTO politeness (domain, next_at) VALUES (?, ?)'
+            ' ON CONFLICT(domain) DO UPDATE SET next_at = MAX(next_at, ?) + ?'
+            ' RETURNING next_at',
+            (key, now + delay, now, delay),
+        ).fetchone()[0]
+        return next_at - delay
+
+    async def process_request(self, request, spider=None):
+        key = request.meta.get('download_slot') or urlsplit(request.url).hostname or ''
+        delay = self.slot_delay(key)
+        if delay <= 0:
+            return None
+        wait = self._book(key, delay) - time.time()
+        if wait > 0:
+            if self.stats is not None:
+                self.stats.inc_value('frontier/politeness_wait', round(wait, 3))
+            await sleep(wait)
+        return None
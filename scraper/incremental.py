@@ -0,0 +1,129 @@
+"""Incremental recrawl support for the scuffers spider.
+
+Shopify storefronts publish a sitemap index at `/sitemap.xml` whose
+`sitemap_products_*.xml` children list every product URL with its `lastmod`.
+An incremental crawl reads those sitemaps and keeps, per product URL, the
+`lastmod` it was last fetched at, the ETag / Last-Modified response headers
+and the item extracted from it (CrawlState, a small SQLite file).
+
+  - lastmod unchanged: the stored item is emitted again, no request is made
+  - lastmod changed or unknown: the page is requested with If-None-Match /
+    If-Modified-Since, and a 304 answer reuses the stored item as well
+
+Every run still emits the whole catalog, so the output file stays a full
+snapshot for index_tools/insert_docs.py, but only changed pages are
+downloaded and parsed.
+"""
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from scrapy.utils.sitemap import Sitemap
+
+from scraper.urls import canonical_product_url
+
+# Child sitemaps of the index that list products
+PRODUCT_SITEMAP_MARKER = 'sitemap_products'
+# Saved rows between two commits of the state database
+COMMIT_EVERY = 100
+
+
+def product_sitemaps(body: bytes) -> List[str]:
+    """Product sitemap URLs of a sitemap index (empty for other documents)."""
+    sitemap = Sitemap(body)
+    if sitemap.type != 'sitemapindex':
+        return []
+    return [entry['loc'] for entry in sitemap if PRODUCT_SITEMAP_MARKER in entry.get('loc', '')]
+
+
+def product_entries(body: bytes) -> Iterator[Tuple[str, Optional[str]]]:
+    """(canonical product URL, lastmod) of the products in a urlset sitemap."""
+    sitemap = Sitemap(body)
+    if sitemap.type != 'urlset':
+        return
+    for entry in sitemap:
+        url = canonical_product_url(entry.get('loc', ''))
+        if url:
+            yield url, entry.get('lastmod')
+
+
+def conditional_headers(page: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since for a previously fetched page."""
+    headers = {}
+    if page and page['etag']:
+        headers['If-None-Match'] = page['etag']
+    if page and page['last_modified']:
+        headers['If-Modified-Since'] = page['last_modified']
+    return headers
+
+
+class CrawlState:
+    """Per-URL fetch state of incremental crawls, in SQLite.
+
+    `seen_at` is set for every URL listed by the current run's sitemaps, so
+    URLs that left the sitemaps can be pruned once the run is over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            ' url TEXT PRIMARY KEY,'
+            ' lastmod TEXT,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' item TEXT,'
+            ' fetched_at REAL,'
+            ' seen_at REAL)'
+        )
+        self.db.commit()
+        self.run_started = time.time()
+        self._pending = 0
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute('SELECT * FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        page = dict(row)
+        page['item'] = json.loads(page['item']) if page['item'] else None
+        return page
+
+    def _changed(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+
+    def seen(self, url: str, lastmod: Optional[str] = None) -> None:
+        """The page is still listed; record the lastmod its stored item matches."""
+        self.db.execute(
+            'INSERT INTO pages (url, lastmod, seen_at) VALUES (?, ?, ?)'
+            ' ON CONFLICT(url) DO UPDATE SET lastmod = COALESCE(excluded.lastmod, lastmod), seen_at = excluded.seen_at',
+            (url, lastmod, time.time()),
+        )
+        self._changed()
+
+    def save(self, url: str, lastmod: Optional[str], etag: Optional[str], last_modified: Optional[str], item: Dict[str, Any]) -> None:
+        """Record a freshly fetched page and the item extracted from it."""
+        now = time.time()
+        self.db.execute(
+            'INSERT OR REPLACE INTO pages (url, lastmod, etag, last_modified, item, fetched_at, seen_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (url, lastmod, etag, last_modified, json.dumps(item, ensure_ascii=False), now, now),
+        )
+        self._changed()
+
+    def prune(self) -> int:
+        """Forget the URLs the current run's sitemaps no longer list."""
+        cur = self.db.execute('DELETE FROM pages WHERE seen_at IS NULL OR seen_at < ?', (self.run_started,))
+        self.commit()
+        return cur.rowcount
+
+    def commit(self) -> None:
+        self.db.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.db.close()
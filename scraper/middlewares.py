@@ -0,0 +1,61 @@
+from scrapy import Request
+
+from scraper.extract import DISALLOWED_RE
+from scraper.urls import canonical_key, canonical_product_url
+
+
+class CanonicalDedupMiddleware:
+    """Drop duplicate and disallowed requests before they are scheduled.
+
+    Every request yielded by a spider callback is mapped to its canonical key
+    (see scraper/urls.py). Requests whose key was already scheduled are dropped
+    without being downloaded, product aliases are rewritten to the canonical
+    /products/<handle> URL, and robots-disallowed paths are filtered with one
+    precompiled pattern.
+
+    Stats:
+      dedup/avoided_downloads - aliases of an already scheduled page
+      dedup/disallowed        - requests to disallowed paths
+      dedup/canonicalized     - product requests rewritten to the canonical URL
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.seen = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def _filter(self, request):
+        if request.dont_filter:
+            return request
+        if DISALLOWED_RE.search(request.url):
+            self.stats.inc_value('dedup/disallowed')
+            return None
+        key = canonical_key(request.url)
+        if key in self.seen:
+            self.stats.inc_value('dedup/avoided_downloads')
+            return None
+        self.seen.add(key)
+        canonical = canonical_product_url(request.url)
+        if canonical and canonical != request.url:
+            self.stats.inc_value('dedup/canonicalized')
+            return request.replace(url=canonical)
+        return request
+
+    def process_spider_output(self, response, result, spider):
+        for r in result:
+            if isinstance(r, Request):
+                r = self._filter(r)
+                if r is None:
+                    continue
+            yield r
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for r in result:
+            if isinstance(r, Request):
+                r = self._filter(r)
+                if r is None:
+                    continue
+            yield r
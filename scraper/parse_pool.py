@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.defer import Deferred, DeferredSemaphore
+from twisted.internet.threads import deferToThread
+
+from scraper.reactor import call_from_thread
+
+
+class ParsePool:
+    """Run page parsing in worker processes, off the reactor thread.
+
+    Parsing (lxml trees, selectors, JSON-LD, regexes) is CPU-bound; on the
+    reactor thread it stops downloads from being scheduled and caps the crawl
+    at one core. submit() hands a raw response body to a pool of worker
+    processes and returns a Deferred that fires with the worker's result.
+
+    At most `max_pending` pages are in the workers at once. Further pages wait
+    for a free slot while their callback keeps the response alive, which fills
+    Scrapy's scraper slot (SCRAPER_SLOT_MAX_ACTIVE_SIZE) and makes the engine
+    stop scheduling downloads until the workers catch up (backpressure).
+
+    Enabled with PARSE_POOL_ENABLED, e.g.
+      python -m scrapy crawl scuffers -s PARSE_POOL_ENABLED=1 -s CONCURRENT_REQUESTS=16
+
+    Stats:
+      parse_pool/pages   - pages parsed by the workers
+      parse_pool/waits   - pages that had to wait for a free worker slot
+      parse_pool/errors  - pages whose parsing raised in the worker
+    """
+
+    def __init__(self, workers=0, max_pending=0, stats=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        self.stats = stats
+        # spawn: forking the crawler process would copy the running reactor
+        # and its threads into every worker
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        self.slots = DeferredSemaphore(self.max_pending)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        return cls(
+            workers=s.getint('PARSE_POOL_WORKERS', 0),
+            max_pending=s.getint('PARSE_POOL_MAX_PENDING', 0),
+            stats=crawler.stats,
+        )
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f'parse_pool/{key}', count)
+
+    def submit(self, fn, *args):
+        """Deferred result of fn(*args) in a worker; fn must be picklable."""
+        if not self.slots.tokens:
+            self._inc('waits')
+        return self.slots.run(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        d = Deferred()
+        future = self.executor.submit(fn, *args)
+        # Done callbacks run on the executor's thread: hop back to the reactor
+        future.add_done_callback(lambda f: call_from_thread(self._fire, d, f))
+        return d
+
+    def _fire(self, d, future):
+        if future.cancelled():
+            # Dropped by close()
+            d.errback(CancelledError())
+            return
+        error = future.exception()
+        if error is not None:
+            self._inc('errors')
+            d.errback(error)
+            return
+        self._inc('pages')
+        d.callback(future.result())
+
+    async def close(self):
+        # Pages still waiting for a slot are dropped; wait for the running ones off the reactor
+        await maybe_deferred_to_future(deferToThread(self.executor.shutdown, wait=True, cancel_futures=True))
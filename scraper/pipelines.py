@@ -1,3 +1,163 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from elasticsearch import Elasticsearch
+from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.defer import DeferredSemaphore
+from twisted.internet.threads import deferToThread
+
+from index_tools.doc_utils import NO_ID_ERROR, content_hash, doc_id, normalize_doc
+from index_tools.es_utils import send_bulk, stamp_index_version, write_dead_letters
+from scraper.reactor import call_from_thread
+
+logger = logging.getLogger(__name__)
+
+
 class ScraperPipeline:
     def process_item(self, item, spider):
         return item
+
+
+class ElasticsearchBulkPipeline:
+    """Index items into Elasticsearch while the crawl runs.
+
+    Each item is normalized (numeric price, inferred color, flat sizes) and
+    handed to a background worker thread through a queue. The worker sends
+    bulk requests when ES_BULK_SIZE actions are buffered or ES_BULK_INTERVAL
+    seconds have passed, retries rejected items with backoff and appends the
+    ones that still fail to ES_DEAD_LETTER_FILE. Items with neither url nor
+    sku have no stable `_id`; they are not indexed and go to the dead-letter
+    file as missing_id. The index version the search API caches on is
+    stamped once, when the crawl closes.
+
+    At most ES_BULK_QUEUE_SIZE actions wait in the queue. The places are
+    counted on the reactor thread: when none is free, process_item waits
+    until the worker takes an action off the queue, which slows the crawl
+    down to the indexing rate (backpressure) without holding a thread.
+
+    Disabled unless ES_PIPELINE_ENABLED is set, e.g.
+      python -m scrapy crawl scuffers -s ES_PIPELINE_ENABLED=1
+    """
+
+    _STOP = object()
+
+    def __init__(self, es_host, index, bulk_size=500, flush_interval=5.0, queue_size=2000, max_retries=3, dead_letter_file='es_dead_letter.jsonl', stats=None):
+        self.es = Elasticsearch(hosts=[es_host])
+        self.index = index
+        self.bulk_size = bulk_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.dead_letter_file = dead_letter_file
+        self.stats = stats
+        self.queue = queue.Queue()
+        # Free places in the queue; only used on the reactor thread
+        self.slots = DeferredSemaphore(queue_size)
+        self.indexed = 0
+        # Items without an _id, written to the dead-letter file at close
+        self.skipped = []
+        self.worker = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        if not s.getbool('ES_PIPELINE_ENABLED'):
+            raise NotConfigured('ES_PIPELINE_ENABLED is not set')
+        return cls(
+            es_host=s.get('ES_HOST') or os.environ.get('ES_HOST', 'http://localhost:9200'),
+            index=s.get('ES_INDEX') or os.environ.get('ES_INDEX', 'scuffers_products'),
+            bulk_size=s.getint('ES_BULK_SIZE', 500),
+            flush_interval=s.getfloat('ES_BULK_INTERVAL', 5.0),
+            queue_size=s.getint('ES_BULK_QUEUE_SIZE', 2000),
+            max_retries=s.getint('ES_BULK_MAX_RETRIES', 3),
+            dead_letter_file=s.get('ES_DEAD_LETTER_FILE', 'es_dead_letter.jsonl'),
+            stats=crawler.stats,
+        )
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f'es_pipeline/{key}', count)
+
+    def open_spider(self, spider):
+        self.worker = threading.Thread(target=self._run, name='es-bulk-worker', daemon=True)
+        self.worker.start()
+
+    async def close_spider(self, spider):
+        # Let the worker drain the queue and flush the last batch off the reactor
+        await maybe_deferred_to_future(deferToThread(self._finish))
+
+    def _finish(self):
+        self.queue.put(self._STOP)
+        self.worker.join()
+        if self.skipped:
+            try:
+                write_dead_letters(self.dead_letter_file, self.skipped)
+            except Exception:
+                logger.warning('Could not write %d items without an _id to %s', len(self.skipped), self.dead_letter_file, exc_info=True)
+        if self.indexed:
+            try:
+                # Invalidate the search API's result cache for the fresh docs
+                stamp_index_version(self.es, self.index)
+            except Exception:
+                logger.warning('Could not stamp the version of index %s', self.index, exc_info=True)
+
+    async def process_item(self, item, spider):
+        doc = normalize_doc(ItemAdapter(item).asdict())
+        doc['content_hash'] = content_hash(doc)
+        action = {'_index': self.index, '_id': doc_id(doc), '_source': doc}
+        if action['_id'] is None:
+            self._inc('skipped_no_id')
+            self.skipped.append({'_id': None, 'status': None, 'error': NO_ID_ERROR, 'action': action})
+            return item
+        if self.slots.tokens:
+            self.slots.acquire()
+        else:
+            self._inc('backpressure_waits')
+            await maybe_deferred_to_future(self.slots.acquire())
+        self.queue.put(action)
+        return item
+
+    # --- worker thread ---------------------------------------------------
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                action = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                action = None
+            if action is self._STOP:
+                self._flush(batch)
+                return
+            if action is not None:
+                batch.append(action)
+                call_from_thread(self.slots.release)
+            if len(batch) >= self.bulk_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            succeeded, failures = send_bulk(
+                self.es, batch, max_retries=self.max_retries, on_retry=lambda n: self._inc('retried', n),
+            )
+            self._inc('batches')
+            self._inc('indexed', succeeded)
+            self.indexed += succeeded
+            if failures:
+                self._inc('failed', len(failures))
+                write_dead_letters(self.dead_letter_file, failures)
+        except Exception:
+            # The worker must keep draining: process_item would otherwise wait
+            # for room in the queue forever
+            self._inc('errors')
+            logger.exception('Elasticsearch bulk batch of %d actions failed', len(batch))
@@ -0,0 +1,24 @@
+"""Access to the running Twisted reactor from scraper code.
+
+Scraper modules never import `twisted.internet.reactor` at module level:
+that import installs Twisted's default reactor, and Scrapy has to be the one
+installing the reactor set in TWISTED_REACTOR (asyncio) when the crawl
+starts. These helpers import it when called, once the crawl is running.
+"""
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.task import deferLater
+
+
+def get_reactor():
+    from twisted.internet import reactor
+    return reactor
+
+
+async def sleep(seconds):
+    """Wait without blocking the reactor."""
+    await maybe_deferred_to_future(deferLater(get_reactor(), seconds))
+
+
+def call_from_thread(fn, *args, **kwargs):
+    """Run fn on the reactor thread; safe to call from any thread."""
+    get_reactor().callFromThread(fn, *args, **kwargs)
@@ -5,6 +5,85 @@ NEWSPIDER_MODULE = 'scraper.spiders'
 
 ROBOTSTXT_OBEY = True
 
+# Priority frontier: products first, then collection pages, then the rest;
+# resumable when run with -s JOBDIR=<dir> (see scraper/frontier.py)
+SCHEDULER = 'scraper.frontier.FrontierScheduler'
+
+# Shared frontier of several crawler processes (set per worker by
+# python -m scraper.workers): lease length of a claimed request, claims of a
+# request before it is given up, and the smallest delay kept between the
+# requests of all workers to one download slot (the slot's own delay applies
+# when longer: tuned by the adaptive throttle, else DOWNLOAD_DELAY)
+FRONTIER_LEASE_TIMEOUT = 300
+FRONTIER_MAX_ATTEMPTS = 3
+FRONTIER_DOMAIN_DELAY = 0
+
+# Canonicalize and dedup requests before they are scheduled
+SPIDER_MIDDLEWARES = {
+    'scraper.middlewares.CanonicalDedupMiddleware': 543,
+    # Tells the frontier when a response's links have been scheduled
+    'scraper.frontier.FrontierMiddleware': 100,
+}
+
+DOWNLOADER_MIDDLEWARES = {
+    # Marks requests that got no response (after retries) as failed
+    'scraper.frontier.FrontierFailureMiddleware': 10,
+    # Sees 429/503 responses before RetryMiddleware (550) retries them
+    'scraper.throttle.AdaptiveThrottleMiddleware': 580,
+    # Per-slot delay shared by the workers of a frontier (only active with
+    # FRONTIER_WORKER set); after the throttle, which picks the slot
+    'scraper.frontier.SharedPolitenessMiddleware': 585,
+}
+
+# Per-host concurrency and delay tuned from latency percentiles, 429/503 and
+# Retry-After (see scraper/throttle.py); enabled by the scuffers spider.
+# Keys are a host with an optional path prefix, which gets its own slot.
+# max_concurrency is the hard cap of requests in flight per slot;
+# CONCURRENT_REQUESTS only caps the sum over all slots
+ADAPTIVE_THROTTLE_ENABLED = False
+ADAPTIVE_THROTTLE_HOSTS = {
+    'scuffers.com': {
+        'start_concurrency': 2, 'max_concurrency': 4,
+        'start_delay': 1.0, 'min_delay': 0.25, 'max_delay': 30.0,
+        'target_latency': 1.0,
+    },
+    'scuffers.com/cdn/shop': {
+        'start_concurrency': 4, 'max_concurrency': 8,
+        'start_delay': 0.0, 'min_delay': 0.0, 'max_delay': 10.0,
+        'target_latency': 0.5,
+    },
+    'cdn.shopify.com': {
+        'start_concurrency': 4, 'max_concurrency': 8,
+        'start_delay': 0.0, 'min_delay': 0.0, 'max_delay': 10.0,
+        'target_latency': 0.5,
+    },
+}
+ADAPTIVE_THROTTLE_WINDOW = 40
+ADAPTIVE_THROTTLE_ADJUST_EVERY = 10
+ADAPTIVE_THROTTLE_MAX_RETRY_AFTER = 120
+
+# Streaming indexing into Elasticsearch while crawling (opt-in with
+# -s ES_PIPELINE_ENABLED=1; the index must exist, see index_tools/create_index.py)
+ITEM_PIPELINES = {
+    'scraper.pipelines.ElasticsearchBulkPipeline': 300,
+}
+ES_PIPELINE_ENABLED = False
+ES_BULK_SIZE = 500
+ES_BULK_INTERVAL = 5.0
+ES_BULK_QUEUE_SIZE = 2000
+ES_BULK_MAX_RETRIES = 3
+ES_DEAD_LETTER_FILE = 'es_dead_letter.jsonl'
+
+# Parse pages in worker processes instead of on the reactor thread (opt-in
+# with -s PARSE_POOL_ENABLED=1, see scraper/parse_pool.py); 0 workers = one
+# per CPU core, 0 pending = twice the workers
+PARSE_POOL_ENABLED = False
+PARSE_POOL_WORKERS = 0
+PARSE_POOL_MAX_PENDING = 0
+
+# Per-URL lastmod/ETag/item store of the incremental mode (-a mode=incremental)
+CRAWL_STATE_FILE = 'crawl_state.sqlite'
+
 # Keep logging low for demo
 LOG_LEVEL = 'INFO'
 
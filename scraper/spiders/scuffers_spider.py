@@ -1,9 +1,13 @@
-import re
-from urllib.parse import urljoin
+import json
 
 import scrapy
-from bs4 import BeautifulSoup
+from scrapy import signals
+from scrapy.utils.defer import maybe_deferred_to_future
+from scraper.catalog import CATALOG_PAGE_SIZE, catalog_page_url, item_from_catalog_product, merge_missing, missing_fields
+from scraper.extract import canonical_url, extract_links, extract_product, is_product_page, parse_page_body, parse_product_body, read_product_ld
+from scraper.incremental import CrawlState, conditional_headers, product_entries, product_sitemaps
 from scraper.items import ScraperItem
+from scraper.parse_pool import ParsePool
 
 
 class ScuffersSpider(scrapy.Spider):
@@ -18,259 +22,217 @@ class ScuffersSpider(scrapy.Spider):
         # Polite user agent identifying the project
         'USER_AGENT': 'RIWS-scuffers-scraper/1.0 (+https://github.com/Javier-r-r)',
         # Usar si te bloquean: 'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0 Safari/537.36',
+        # Concurrency and delay are tuned per host by the adaptive throttle
+        # (ADAPTIVE_THROTTLE_HOSTS in settings.py). The real per-host cap is
+        # the max_concurrency of each profile (2 for hosts without one), even
+        # with AutoThrottle off; CONCURRENT_REQUESTS only bounds all hosts
+        # together. DOWNLOAD_DELAY is the delay of hosts without a profile
         'DOWNLOAD_DELAY': 1,
-        'CONCURRENT_REQUESTS': 2,
-        'AUTOTHROTTLE_ENABLED': True,
-        'AUTOTHROTTLE_START_DELAY': 0.5,
-        'AUTOTHROTTLE_TARGET_CONCURRENCY': 2.0,
+        'CONCURRENT_REQUESTS': 16,
+        'ADAPTIVE_THROTTLE_ENABLED': True,
+        'AUTOTHROTTLE_ENABLED': False,
         # Stop the crawl after scraping 100 items (user request)
         'CLOSESPIDER_ITEMCOUNT': 100,
     }
 
-    price_re = re.compile(r"(?:\$|€|£)?\s*(\d{1,3}(?:[.,]\d{2})?)")
+    # Crawl modes (scrapy crawl scuffers -a mode=catalog):
+    #   html    - follow links from the home page and parse product pages
+    #   catalog - enumerate the Shopify /products.json catalog, fetching the
+    #             product HTML page only when the JSON leaves a field empty
+    #   incremental - read the products from /sitemap.xml and only fetch the
+    #             pages changed since the previous incremental run (see
+    #             scraper/incremental.py); run it with -s CLOSESPIDER_ITEMCOUNT=0
+    mode = 'html'
+    base_url = 'https://scuffers.com'
+    # /products.json carries no currency; the store sells in EUR
+    currency = 'EUR'
+    # Worker processes for HTML parsing, started with the crawl when
+    # PARSE_POOL_ENABLED is set (see scraper/parse_pool.py)
+    parse_pool = None
+    # Fetch state of the incremental mode
+    crawl_state = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if crawler.settings.getbool('PARSE_POOL_ENABLED'):
+            crawler.signals.connect(spider.open_parse_pool, signal=signals.spider_opened)
+        if spider.mode == 'incremental':
+            spider.crawl_state = CrawlState(crawler.settings.get('CRAWL_STATE_FILE', 'crawl_state.sqlite'))
+            if crawler.settings.getint('CLOSESPIDER_ITEMCOUNT'):
+                spider.logger.warning('Incremental crawls emit the whole catalog; CLOSESPIDER_ITEMCOUNT will cut it short (pass -s CLOSESPIDER_ITEMCOUNT=0)')
+        return spider
+
+    def open_parse_pool(self):
+        self.parse_pool = ParsePool.from_crawler(self.crawler)
+        self.crawler.signals.connect(self.parse_pool.close, signal=signals.spider_closed)
+
+    @property
+    def offload_parsing(self):
+        return self.settings.getbool('PARSE_POOL_ENABLED')
+
+    @property
+    def page_callback(self):
+        return self.parse_offloaded if self.offload_parsing else self.parse
+
+    @property
+    def product_callback(self):
+        return self.parse_product_offloaded if self.offload_parsing else self.parse_product
+
+    async def start(self):
+        # Entry point of Scrapy >= 2.13, which no longer calls start_requests()
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        if self.mode == 'catalog':
+            yield scrapy.Request(catalog_page_url(self.base_url, 1), callback=self.parse_catalog, cb_kwargs={'page': 1})
+            return
+        if self.mode == 'incremental':
+            yield scrapy.Request(f'{self.base_url}/sitemap.xml', callback=self.parse_sitemap)
+            return
+        for url in self.start_urls:
+            yield scrapy.Request(url, callback=self.page_callback)
 
-    def parse(self, response):
-        # Use BeautifulSoup for page analysis and product detection
-        soup = BeautifulSoup(response.text or '', 'html.parser')
+    def parse_catalog(self, response, page):
+        products = json.loads(response.text).get('products') or []
+        self.crawler.stats.inc_value('catalog/pages')
+        self.crawler.stats.inc_value('catalog/products', len(products))
 
-        # Detect product pages using conservative heuristics.
-        is_product = False
+        for product in products:
+            item = item_from_catalog_product(product, self.base_url, self.currency)
+            if not self.first_seen(item['url']):
+                continue
 
-        # JSON-LD product schema
-        for script in soup.find_all('script', type='application/ld+json'):
-            txt = script.string or script.get_text() or ''
-            if re.search(r'"@type"\s*:\s*"Product"', txt):
-                is_product = True
-                break
+            if missing_fields(item):
+                self.crawler.stats.inc_value('catalog/html_fallback')
+                yield scrapy.Request(item['url'], callback=self.product_callback, cb_kwargs={'partial': item})
+                continue
+            yield self.to_item(item)
+
+        # A short page is the last one
+        if len(products) >= CATALOG_PAGE_SIZE:
+            yield scrapy.Request(catalog_page_url(self.base_url, page + 1), callback=self.parse_catalog, cb_kwargs={'page': page + 1})
+
+    def parse_sitemap(self, response):
+        # The index lists the product sitemaps, which list the products
+        for loc in product_sitemaps(response.body):
+            yield scrapy.Request(loc, callback=self.parse_sitemap)
+
+        for url, lastmod in product_entries(response.body):
+            self.crawler.stats.inc_value('incremental/listed')
+            page = self.crawl_state.get(url)
+            if page and page['item'] is not None and lastmod and page['lastmod'] == lastmod:
+                self.crawler.stats.inc_value('incremental/unchanged')
+                self.crawl_state.seen(url)
+                yield self.to_item(page['item'])
+                continue
+            yield scrapy.Request(
+                url,
+                callback=self.parse_changed,
+                headers=conditional_headers(page),
+                cb_kwargs={'url': url, 'lastmod': lastmod},
+                meta={'handle_httpstatus_list': [304]},
+            )
 
-        # Open Graph product type
-        og = soup.find('meta', attrs={'property': 'og:type'})
-        if og and og.get('content', '').lower() == 'product':
-            is_product = True
+    async def parse_changed(self, response, url, lastmod):
+        if response.status == 304:
+            # Unchanged after all (lastmod also moves on e.g. stock updates)
+            self.crawler.stats.inc_value('incremental/not_modified')
+            self.crawl_state.seen(url, lastmod)
+            yield self.to_item(self.crawl_state.get(url)['item'])
+            return
+        self.crawler.stats.inc_value('incremental/fetched')
+        item = await self.extract_item(response)
+        headers = response.headers
+        self.crawl_state.save(
+            url,
+            lastmod,
+            headers.get('ETag', b'').decode('latin-1') or None,
+            headers.get('Last-Modified', b'').decode('latin-1') or None,
+            item,
+        )
+        yield self.to_item(item)
+
+    def closed(self, reason):
+        if self.crawl_state is None:
+            return
+        # Only a complete run knows which products left the sitemaps
+        if reason == 'finished':
+            self.crawler.stats.set_value('incremental/pruned', self.crawl_state.prune())
+        self.crawl_state.close()
 
-        # Common Shopify product selectors
-        if soup.select('[data-product], form[action*="/cart/add"], .product-form, .product-single'):
-            is_product = True
+    def parse(self, response):
+        # One lxml tree (response.selector) is shared by detection and
+        # extraction; JSON-LD is decoded once.
+        sel = response.selector
+        product_ld, ld_declared = read_product_ld(sel)
 
-        if is_product:
+        if is_product_page(sel, ld_declared):
             # --- EXTRAER LA URL CANÓNICA ---
-            canonical = soup.find("link", rel="canonical")
-            canonical_url = canonical["href"].strip() if canonical and canonical.get("href") else response.url
-
-            # Normalizar por si la URL es relativa
-            canonical_url = urljoin(response.url, canonical_url)
+            canonical = canonical_url(sel, response.url)
 
             # --- EVITAR PRODUCTOS DUPLICADOS ---
-            if not hasattr(self, "seen_products"):
-                self.seen_products = set()
-
-            if canonical_url in self.seen_products:
+            if not self.first_seen(canonical):
                 return  # ya procesado → evitar duplicado
 
-            self.seen_products.add(canonical_url)
-
-            # Llamar a parse_product con la URL canonizada
-            yield from self.parse_product(response)
+            yield from self.parse_product(response, product_ld)
             return
 
         # Otherwise, follow internal links but be conservative: only follow links within allowed_domains
-        for a in soup.find_all('a', href=True):
-            href = a.get('href')
-            if not href:
-                continue
-            url = urljoin(response.url, href)
-            # keep inside domain
-            if self.allowed_domains[0] not in url:
-                continue
-
-            # avoid hitting checkout/cart/admin/account/search endpoints per robots.txt
-            disallowed_substrings = (
-                '/cart', '/carts', '/checkout', '/checkouts', '/orders', '/admin', '/account', '/search', '/policies', '/recommendations/products', '/sf_private_access_tokens'
-            )
-            if any(s in url for s in disallowed_substrings):
-                continue
-
+        for url in extract_links(sel, response.url, self.allowed_domains[0]):
             yield response.follow(url, callback=self.parse)
 
-    def parse_product(self, response):
-        # Build item dictionary
-        item = {}
-        item['url'] = response.url
-        text = response.text
-        soup = BeautifulSoup(text or '', 'html.parser')
-
-        # Title
-        title = ''
-        h1 = soup.find('h1')
-        if h1 and h1.get_text(strip=True):
-            title = h1.get_text(strip=True)
-        else:
-            ttag = soup.find('title')
-            title = ttag.get_text(strip=True) if ttag else ''
-        item['title'] = title.strip() if title else ''
-
-        # Description
-        description = ''
-        paragraph = response.css('div.metafield-rich_text_field')
-        description = paragraph.css('p::text').get()
-
-        item['description'] = description.strip() if description else ''
-
-        # Price
-        price = ''
-        ld = None
-        ld_tag = soup.find('script', type='application/ld+json')
-        if ld_tag:
-            ld = ld_tag.string or ld_tag.get_text()
-        if ld:
-            m = re.search(r'"price"\s*:\s*"?([\d.,]+)"?', ld)
-            if m:
-                price = m.group(1)
-
-        if not price:
-            # visible price selectors
-            sel = []
-            for sel_text in soup.select('.price, .product__price, .product-price'):
-                txt = sel_text.get_text() or ''
-                m = re.search(r'[\d.,]+', txt)
-                if m:
-                    price = m.group(0)
-                    break
-
-        if not price:
-            for m in self.price_re.finditer(text):
-                price = m.group(1)
-                break
-
-        # Currency: JSON-LD priceCurrency first, fallback to visible price text
-        currency = ''
-        if ld:
-            mcur = re.search(r'"priceCurrency"\s*:\s*"([A-Z]{3}|[^\"]+)"', ld)
-            if mcur:
-                currency = mcur.group(1)
-
-        if not currency:
-            price_text = response.css('.price::text, .product__price::text, .product-price::text').get() or ''
-            if '€' in price_text:
-                currency = 'EUR'
-            elif '$' in price_text:
-                currency = 'USD'
-            elif '£' in price_text:
-                currency = 'GBP'
-            else:
-                mcode = re.search(r'\b([A-Z]{3})\b', price_text)
-                if mcode:
-                    currency = mcode.group(1)
-
-        item['price'] = price.strip() if price else ''
-        item['currency'] = currency
-
-        # Images
-        product_imgs = []
-
-        for div in response.css('div.product-media'):
-            image = div.css('img.rimage__image')
-            product_imgs.append('https:' + image.attrib['src'])
-
-        item['images'] = product_imgs
-
-        # SKU
-        sku = ''
-        ds = soup.select_one('[data-sku]')
-        if ds and ds.get('data-sku'):
-            sku = ds.get('data-sku')
-        else:
-            selt = soup.select_one('.sku') or soup.select_one('.product-sku')
-            if selt and selt.get_text(strip=True):
-                sku = selt.get_text(strip=True)
-        if not sku and ld:
-            m = re.search(r'"sku"\s*:\s*"([^\"]+)"', ld)
-            if m:
-                sku = m.group(1)
-        item['sku'] = sku.strip() if sku else ''
-
-        # Availability
-        availability = ''
-        if ld:
-            m = re.search(r'"availability"\s*:\s*"[^\"]*\/([^"}]+)"', ld)
-            if m:
-                availability = m.group(1)
-        if not availability:
-            if soup.select('.sold-out, .out-of-stock'):
-                availability = 'out_of_stock'
-            else:
-                availability = 'in_stock'
-        item['availability'] = availability
-        # First check for regional sizes: if the site provides a size widget
-        # we extract those and skip the heavier extraction logic.
-        regional_sizes = []
-        try:
-            wrapper = soup.select_one('div.selector-wrapper[data-option-name="size"]')
-            if wrapper:
-                for opt in wrapper.select('.size-region-option'):
-                    entry = {}
-                    for attr, val in opt.attrs.items():
-                        if attr.startswith('data-'):
-                            key = attr[5:]
-                            if key in ('variant-id', 'variant_id', 'id'):
-                                continue
-                            entry[key] = val
-                    if entry:
-                        regional_sizes.append(entry)
-        except Exception:
-            regional_sizes = []
-
-        # regional_sizes extracted above; do not persist this field in the final item
-        if regional_sizes:
-            # fast path: if regional sizes exist, save them into sizes
-            item['sizes'] = regional_sizes
-            # set item['size'] from the regional size's label if available
-            first_label = ''
-            try:
-                if isinstance(regional_sizes, list) and regional_sizes:
-                    first = regional_sizes[0]
-                    if isinstance(first, dict):
-                        # prefer 'label', fallback to other common keys
-                        first_label = first.get('label') or first.get('size') or first.get('name') or ''
-                    else:
-                        first_label = str(first)
-                if first_label:
-                    first_label = str(first_label).strip()
-            except Exception:
-                first_label = ''
-            item['size'] = first_label or ''
-        else:
-            precomputed_sizes = []
-
-            for sel in soup.select('select[name*="size"] option, select[id*="size"] option, select[class*="size"] option'):
-                opt = sel.get_text()
-                if opt:
-                    val = opt.strip()
-                    if val and val.lower() not in ('choose an option', 'select a size', 'select'):
-                        precomputed_sizes.append(val)
-
-            for a in soup.select('[data-size], [data-value]'):
-                v = a.get('data-size') or a.get('data-value')
-                if v:
-                    precomputed_sizes.append(v.strip())
-
-            seen_pre = set()
-            final_pre = []
-            for s in precomputed_sizes:
-                if not s:
-                    continue
-                s_norm = ' '.join(str(s).split())
-                if s_norm in seen_pre:
-                    continue
-                seen_pre.add(s_norm)
-                final_pre.append(s_norm)
-
-            item['sizes'] = final_pre
-            item['size'] = final_pre[0] if final_pre else ''
-
-        # convert to ScraperItem and yield
+    def parse_product(self, response, product_ld=None, partial=None):
+        if product_ld is None:
+            product_ld, _ = read_product_ld(response.selector)
+        item = extract_product(response.selector, response.url, response.text, product_ld)
+        if partial is not None:
+            # catalog mode: the JSON fields win, HTML only fills the gaps
+            item = merge_missing(partial, item)
+
+        yield self.to_item(item)
+
+    async def parse_offloaded(self, response):
+        # Same as parse(), with the parsing done by a parse pool worker
+        page = await maybe_deferred_to_future(
+            self.parse_pool.submit(parse_page_body, response.url, response.body, response.encoding, self.allowed_domains[0])
+        )
+        if page['is_product']:
+            if self.first_seen(page['canonical']):
+                yield self.to_item(page['item'])
+            return
+        for url in page['links']:
+            yield response.follow(url, callback=self.parse_offloaded)
+
+    async def parse_product_offloaded(self, response, partial=None):
+        item = await self.extract_item(response)
+        if partial is not None:
+            item = merge_missing(partial, item)
+        yield self.to_item(item)
+
+    async def extract_item(self, response):
+        """Product fields of a page, parsed by the parse pool when enabled."""
+        if self.offload_parsing:
+            return await maybe_deferred_to_future(
+                self.parse_pool.submit(parse_product_body, response.url, response.body, response.encoding)
+            )
+        product_ld, _ = read_product_ld(response.selector)
+        return extract_product(response.selector, response.url, response.text, product_ld)
+
+    def first_seen(self, canonical):
+        """Record a product page; False if it was already scraped."""
+        if not hasattr(self, "seen_products"):
+            self.seen_products = set()
+        if canonical in self.seen_products:
+            return False
+        self.seen_products.add(canonical)
+        return True
+
+    @staticmethod
+    def to_item(item):
+        # convert to ScraperItem
         scraped = ScraperItem()
         for k, v in item.items():
             scraped[k] = v
-
-        yield scraped
+        return scraped
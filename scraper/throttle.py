@@ -0,0 +1,301 @@
+"""Adaptive per-host throughput control for the scuffers spider.
+
+AdaptiveThrottleMiddleware replaces AutoThrottle's single latency/target rule
+with a controller per host profile (ADAPTIVE_THROTTLE_HOSTS). A profile key is
+a host, optionally followed by a path prefix ('scuffers.com/cdn/shop'); a
+prefixed profile gets its own downloader slot, so the CDN and the storefront
+are throttled apart even though they share a host name.
+
+Each profile starts at start_concurrency / start_delay and is tuned from the
+responses of its slot:
+
+  - every ADAPTIVE_THROTTLE_ADJUST_EVERY responses the latency percentiles of
+    the last ADAPTIVE_THROTTLE_WINDOW responses are checked: a p95 above twice
+    target_latency slows down (one request less in flight, then a longer
+    delay), a p50 under target_latency speeds up (a shorter delay, then one
+    request more in flight)
+  - a 429 or 503 response, or a timeout, halves the concurrency and doubles
+    the delay at once; a Retry-After header also pauses the slot for that long
+    (at most ADAPTIVE_THROTTLE_MAX_RETRY_AFTER seconds)
+
+Hard caps: the delay stays within min_delay..max_delay and the concurrency
+within 1..max_concurrency. A Crawl-delay in a host's robots.txt raises the
+delay floor of all its profiles and caps their concurrency at 1; disallowed
+paths are still dropped by RobotsTxtMiddleware before they get here.
+
+Enabled with ADAPTIVE_THROTTLE_ENABLED; AutoThrottle should be off, or both
+will set the slot delays. ADAPTIVE_THROTTLE_DEBUG logs every decision.
+
+Stats, per profile slot (e.g. throttle/scuffers.com/delay):
+  throttle/<slot>/concurrency, /delay  - current values
+  throttle/<slot>/latency_p50, _p95    - download latency in the window (s)
+  throttle/<slot>/speedups, /slowdowns - adjustments from the latency
+  throttle/<slot>/backoffs             - 429/503/timeouts that halved the rate
+  throttle/<slot>/retry_after          - seconds paused on Retry-After
+  throttle/<host>/robots_crawl_delay   - Crawl-delay read from robots.txt
+"""
+import logging
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from protego import Protego
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet.error import TCPTimedOutError, TimeoutError
+
+from scraper.reactor import sleep
+
+logger = logging.getLogger(__name__)
+
+# Profile of hosts missing from ADAPTIVE_THROTTLE_HOSTS; its delays default
+# to DOWNLOAD_DELAY
+DEFAULT_PROFILE = {
+    'start_concurrency': 1,
+    'max_concurrency': 2,
+    'start_delay': None,
+    'min_delay': None,
+    'max_delay': 60.0,
+    'target_latency': 1.0,
+}
+BACKOFF_STATUS = (429, 503)
+# Smallest delay set by a backoff or a slowdown from no delay at all
+MIN_STEP_DELAY = 0.25
+# Delay factors of a speedup and a slowdown
+SPEEDUP_FACTOR = 0.75
+SLOWDOWN_FACTOR = 1.5
+
+
+def retry_after_seconds(value, now=None):
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.decode('latin-1') if isinstance(value, bytes) else value
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HostThrottle:
+    """Throughput state of one downloader slot."""
+
+    def __init__(self, key, host, profile, window):
+        self.key = key
+        self.host = host
+        self.profile = profile
+        self.concurrency = profile['start_concurrency']
+        self.delay = profile['start_delay']
+        self.min_delay = profile['min_delay']
+        self.max_concurrency = profile['max_concurrency']
+        self.latencies = deque(maxlen=window)
+        self.since_adjust = 0
+        self.paused_until = 0.0
+
+    def clamp(self):
+        self.delay = min(max(self.delay, self.min_delay), self.profile['max_delay'])
+        self.concurrency = min(max(self.concurrency, 1), self.max_concurrency)
+
+    def speed_up(self):
+        if self.delay > self.min_delay:
+            delay = self.delay * SPEEDUP_FACTOR
+            self.delay = max(self.min_delay, 0 if delay < MIN_STEP_DELAY else delay)
+        elif self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+        else:
+            return False
+        return True
+
+    def slow_down(self):
+        if self.concurrency > 1:
+            self.concurrency -= 1
+        elif self.delay < self.profile['max_delay']:
+            self.delay = max(self.delay * SLOWDOWN_FACTOR, MIN_STEP_DELAY)
+        else:
+            return False
+        self.clamp()
+        # Judge the new rate on its own latencies, not on the slow ones again
+        self.latencies.clear()
+        return True
+
+    def back_off(self):
+        self.concurrency = max(1, self.concurrency // 2)
+        self.delay = max(self.delay * 2, MIN_STEP_DELAY)
+        self.clamp()
+        self.latencies.clear()
+        self.since_adjust = 0
+
+
+class AdaptiveThrottleMiddleware:
+    """Downloader middleware tuning concurrency and delay per host profile."""
+
+    def __init__(self, crawler, profiles, window=40, adjust_every=10, max_retry_after=120.0):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.profiles = profiles
+        self.window = window
+        self.adjust_every = adjust_every
+        self.max_retry_after = max_retry_after
+        s = crawler.settings
+        self.debug = s.getbool('ADAPTIVE_THROTTLE_DEBUG')
+        self.user_agent = s.get('ROBOTSTXT_USER_AGENT') or s.get('USER_AGENT')
+        self.default_delay = s.getfloat('DOWNLOAD_DELAY')
+        # Slot key -> HostThrottle, host -> robots.txt Crawl-delay
+        self.slots = {}
+        self.crawl_delays = {}
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        if not s.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise NotConfigured
+        return cls(
+            crawler,
+            s.getdict('ADAPTIVE_THROTTLE_HOSTS'),
+            window=s.getint('ADAPTIVE_THROTTLE_WINDOW', 40),
+            adjust_every=s.getint('ADAPTIVE_THROTTLE_ADJUST_EVERY', 10),
+            max_retry_after=s.getfloat('ADAPTIVE_THROTTLE_MAX_RETRY_AFTER', 120.0),
+        )
+
+    def profile_key(self, host, path):
+        """Longest ADAPTIVE_THROTTLE_HOSTS key matching the host (or a
+        subdomain of it) and the start of the path."""
+        best = None
+        for key in self.profiles:
+            key_host, _, prefix = key.partition('/')
+            if not (host == key_host or host.endswith('.' + key_host)):
+                continue
+            if prefix and not path.startswith(f'/{prefix}'):
+                continue
+            if best is None or len(key) > len(best):
+                best = key
+        return best
+
+    def throttle_for(self, request):
+        meta_slot = request.meta.get('download_slot')
+        if meta_slot is not None and meta_slot in self.slots:
+            return self.slots[meta_slot]
+        parts = urlsplit(request.url)
+        host = parts.hostname or ''
+        key = self.profile_key(host, parts.path)
+        # A path-prefixed profile needs a slot of its own
+        slot = meta_slot or (f'{host}/{key.partition("/")[2]}' if key and '/' in key else host)
+        if slot not in self.slots:
+            profile = dict(DEFAULT_PROFILE, **self.profiles.get(key, {}))
+            for field in ('start_delay', 'min_delay'):
+                if profile[field] is None:
+                    profile[field] = self.default_delay
+            throttle = HostThrottle(slot, host, profile, self.window)
+            self._apply_crawl_delay(throttle)
+            self.slots[slot] = throttle
+            self._record(throttle)
+        request.meta['download_slot'] = slot
+        return self.slots[slot]
+
+    def _apply_crawl_delay(self, throttle):
+        crawl_delay = self.crawl_delays.get(throttle.host)
+        if crawl_delay:
+            throttle.min_delay = max(throttle.profile['min_delay'], crawl_delay)
+            throttle.max_concurrency = 1
+            throttle.clamp()
+
+    def _record(self, throttle, decision=None):
+        prefix = f'throttle/{throttle.key}'
+        self.stats.set_value(f'{prefix}/concurrency', throttle.concurrency)
+        self.stats.set_value(f'{prefix}/delay', round(throttle.delay, 3))
+        if decision is not None:
+            self.stats.inc_value(f'{prefix}/{decision}')
+            if self.debug:
+                logger.info(
+                    'slot: %s | %s | conc: %d | delay: %d ms | p50: %s | p95: %s',
+                    throttle.key, decision, throttle.concurrency, throttle.delay * 1000,
+                    self.stats.get_value(f'{prefix}/latency_p50'), self.stats.get_value(f'{prefix}/latency_p95'),
+                )
+        slot = self.crawler.engine.downloader.slots.get(throttle.key) if self.crawler.engine else None
+        if slot is not None:
+            slot.concurrency = throttle.concurrency
+            slot.delay = throttle.delay
+
+    def request_reached_downloader(self, request, spider):
+        # Slots are created on their first request and garbage-collected when
+        # idle; give each one the controller's current values
+        throttle = self.slots.get(request.meta.get('download_slot'))
+        if throttle is not None:
+            self._record(throttle)
+
+    async def process_request(self, request, spider=None):
+        throttle = self.throttle_for(request)
+        wait = throttle.paused_until - time.time()
+        if wait > 0:
+            await sleep(wait)
+        return None
+
+    def process_response(self, request, response, spider=None):
+        throttle = self.throttle_for(request)
+        if urlsplit(response.url).path == '/robots.txt' and response.status == 200:
+            self._read_robots(throttle.host, response.body)
+        if response.status in BACKOFF_STATUS:
+            self._back_off(throttle, response.headers.get('Retry-After'))
+            return response
+        latency = request.meta.get('download_latency')
+        if latency is None or response.status >= 500:
+            return response
+        throttle.latencies.append(latency)
+        throttle.since_adjust += 1
+        if throttle.since_adjust >= self.adjust_every:
+            self._adjust(throttle)
+        return response
+
+    def process_exception(self, request, exception, spider=None):
+        if isinstance(exception, (TimeoutError, TCPTimedOutError)):
+            self._back_off(self.throttle_for(request), None)
+        return None
+
+    def _adjust(self, throttle):
+        throttle.since_adjust = 0
+        p50 = percentile(throttle.latencies, 0.5)
+        p95 = percentile(throttle.latencies, 0.95)
+        prefix = f'throttle/{throttle.key}'
+        self.stats.set_value(f'{prefix}/latency_p50', round(p50, 3))
+        self.stats.set_value(f'{prefix}/latency_p95', round(p95, 3))
+        target = throttle.profile['target_latency']
+        if p95 > 2 * target:
+            if throttle.slow_down():
+                self._record(throttle, 'slowdowns')
+        elif p50 <= target:
+            if throttle.speed_up():
+                self._record(throttle, 'speedups')
+
+    def _back_off(self, throttle, retry_after):
+        throttle.back_off()
+        wait = retry_after_seconds(retry_after)
+        if wait:
+            wait = min(wait, self.max_retry_after)
+            throttle.paused_until = max(throttle.paused_until, time.time() + wait)
+            self.stats.inc_value(f'throttle/{throttle.key}/retry_after', wait)
+        self._record(throttle, 'backoffs')
+
+    def _read_robots(self, host, body):
+        try:
+            crawl_delay = Protego.parse(body.decode('utf-8', errors='ignore')).crawl_delay(self.user_agent)
+        except Exception:
+            return
+        if not crawl_delay:
+            return
+        self.crawl_delays[host] = float(crawl_delay)
+        self.stats.set_value(f'throttle/{host}/robots_crawl_delay', float(crawl_delay))
+        for throttle in self.slots.values():
+            if throttle.host == host:
+                self._apply_crawl_delay(throttle)
+                self._record(throttle)
@@ -0,0 +1,54 @@
+"""URL canonicalization for request-time deduplication.
+
+The same Shopify product is reachable through several URLs:
+
+  /products/<handle>
+  /collections/<collection>/products/<handle>
+  /es/products/<handle>, /en-us/collections/<collection>/products/<handle>
+  any of the above with ?variant=..., tracking or search parameters
+
+`canonical_key` maps all of them to one key before a request is scheduled,
+so each alias is downloaded at most once.
+"""
+import re
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from w3lib.url import canonicalize_url
+
+# Shopify locale prefix, e.g. /es/ or /en-us/
+LOCALE_PREFIX_RE = re.compile(r'^/[a-z]{2}(?:-[a-z]{2})?(?=/|$)', re.IGNORECASE)
+# /collections/<collection>/products/<handle> and /products/<handle>
+PRODUCT_PATH_RE = re.compile(r'^(?:/collections/[^/]+)?/products/([^/?#.]+)/?$', re.IGNORECASE)
+# Query parameters that never change the page being served
+IGNORED_PARAMS = re.compile(r'^(?:utm_\w+|_pos|_sid|_ss|_psq|_fid|_v|variant|fbclid|gclid)$', re.IGNORECASE)
+
+
+def strip_locale(path: str) -> str:
+    return LOCALE_PREFIX_RE.sub('', path, count=1) or '/'
+
+
+def product_handle(url: str) -> Optional[str]:
+    """Return the product handle of a (possibly aliased) product URL."""
+    m = PRODUCT_PATH_RE.match(strip_locale(urlsplit(url).path))
+    return m.group(1).lower() if m else None
+
+
+def canonical_product_url(url: str) -> Optional[str]:
+    """`https://host/products/<handle>` for product URLs, None otherwise."""
+    handle = product_handle(url)
+    if handle is None:
+        return None
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme or 'https', parts.netloc.lower(), f'/products/{handle}', '', ''))
+
+
+def canonical_key(url: str) -> str:
+    """Dedup key shared by every alias of the same page."""
+    handle = product_handle(url)
+    if handle is not None:
+        return f'product:{handle}'
+    parts = urlsplit(url)
+    path = strip_locale(parts.path).rstrip('/') or '/'
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not IGNORED_PARAMS.match(k)])
+    return canonicalize_url(urlunsplit((parts.scheme, parts.netloc.lower(), path, query, '')))
@@ -0,0 +1,101 @@
+"""Run several scuffers crawler processes on one shared frontier.
+
+Usage:
+  python -m scraper.workers [-n 4] [--dir crawls/scuffers] [--output scuffers_output.json]
+                            [--merge-only] [scrapy crawl options, e.g. -s CLOSESPIDER_ITEMCOUNT=0]
+
+Every worker is a `scrapy crawl scuffers` process with the same FRONTIER_FILE
+(<dir>/frontier.sqlite) and its own FRONTIER_WORKER name, so the workers take
+requests from one queue and share its duplicate filter and per-domain delay
+(see scraper/frontier.py). Each worker writes its items to <dir>/<worker>.jsonl;
+once all of them exit the feeds are merged into one deduplicated JSON array.
+
+Running the same command again resumes the crawl left in <dir>; delete the
+directory to start over. Run from the project root (where scrapy.cfg is).
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Iterable
+
+from index_tools.doc_utils import iter_feed
+from scraper.urls import canonical_key
+
+SPIDER = 'scuffers'
+
+
+def worker_command(name: str, workdir: Path, extra: Iterable[str]):
+    return [
+        sys.executable, '-m', 'scrapy', 'crawl', SPIDER,
+        '-s', f'FRONTIER_FILE={workdir / "frontier.sqlite"}',
+        '-s', f'FRONTIER_WORKER={name}',
+        '-s', f'LOG_FILE={workdir / f"{name}.log"}',
+        # -o appends: items of a resumed run are added to the worker's feed
+        '-o', f'{workdir / f"{name}.jsonl"}:jsonlines',
+        *extra,
+    ]
+
+
+def run_workers(n: int, workdir: Path, extra: Iterable[str]) -> int:
+    """Start n workers and wait for all of them; the worst exit code."""
+    workdir.mkdir(parents=True, exist_ok=True)
+    procs = [subprocess.Popen(worker_command(f'w{i}', workdir, extra)) for i in range(n)]
+    codes = []
+    for proc in procs:
+        try:
+            codes.append(proc.wait())
+        except KeyboardInterrupt:
+            # Ctrl-C reaches the workers too; let them shut down cleanly
+            codes.append(proc.wait())
+    return max(codes, default=0)
+
+
+def item_key(item) -> str:
+    url = item.get('url')
+    return canonical_key(url) if url else f'sku:{item.get("sku")}'
+
+
+def merge_outputs(paths: Iterable[Path], output: Path) -> int:
+    """Write the items of the worker feeds to one JSON array, each product
+    once (the first copy found); returns the number of items written."""
+    seen = set()
+    tmp = output.with_name(output.name + '.tmp')
+    with tmp.open('w', encoding='utf-8') as f:
+        f.write('[')
+        for path in paths:
+            for item in iter_feed(path):
+                key = item_key(item)
+                if key in seen:
+                    continue
+                f.write(',\n' if seen else '\n')
+                seen.add(key)
+                f.write(json.dumps(item, ensure_ascii=False))
+        f.write('\n]\n')
+    tmp.replace(output)
+    return len(seen)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Crawl with several processes sharing one frontier.')
+    parser.add_argument('-n', '--workers', type=int, default=4, help='crawler processes')
+    parser.add_argument('--dir', type=Path, default=Path('crawls') / SPIDER, help='frontier, logs and worker feeds')
+    parser.add_argument('--output', type=Path, default=Path('scuffers_output.json'), help='merged feed')
+    parser.add_argument('--merge-only', action='store_true', help='only merge the feeds already in --dir')
+    args, extra = parser.parse_known_args(argv)
+
+    code = 0
+    if not args.merge_only:
+        code = run_workers(max(1, args.workers), args.dir, extra)
+    feeds = sorted(args.dir.glob('*.jsonl'))
+    if not feeds:
+        print(f'No worker feeds in {args.dir}')
+        return code or 1
+    count = merge_outputs(feeds, args.output)
+    print(f'Merged {len(feeds)} worker feeds into {args.output}: {count} items')
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+
+from scraper.catalog import catalog_page_url, item_from_catalog_product, merge_missing, missing_fields
+from scraper.items import ScraperItem
+from scraper.spiders.scuffers_spider import ScuffersSpider
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'products_page.json'
+BASE_URL = 'https://scuffers.com'
+
+
+@pytest.fixture
+def products():
+    return json.loads(FIXTURE.read_text(encoding='utf-8'))['products']
+
+
+def test_catalog_page_url():
+    assert catalog_page_url(BASE_URL + '/', 3) == 'https://scuffers.com/products.json?limit=250&page=3'
+
+
+def test_item_from_catalog_product(products):
+    item = item_from_catalog_product(products[0], BASE_URL, 'EUR')
+    assert item == {
+        'url': 'https://scuffers.com/products/iconic-jersey-lime',
+        'title': 'Iconic Jersey Lime',
+        'description': 'Oversized jersey in lime . 100% cotton',
+        # First variant in stock (XS is sold out)
+        'price': '89.00',
+        'currency': 'EUR',
+        'images': [
+            'https://cdn.shopify.com/s/files/1/0123/4567/files/IJ_LIME_1.jpg?v=1725286900',
+            'https://cdn.shopify.com/s/files/1/0123/4567/files/IJ_LIME_2.jpg?v=1725286901',
+        ],
+        'sku': 'SC-IJ-LIME-S',
+        'availability': 'InStock',
+        'sizes': ['XS', 'S', 'M'],
+        'size': 'XS',
+    }
+    assert missing_fields(item) == []
+
+
+def test_sold_out_product_without_size_option(products):
+    item = item_from_catalog_product(products[1], BASE_URL, 'EUR')
+    assert item['availability'] == 'OutOfStock'
+    assert item['price'] == '15.00'
+    assert item['sizes'] == [] and item['size'] == ''
+    assert missing_fields(item) == ['description', 'images']
+
+
+def test_merge_missing_fills_only_empty_fields(products):
+    item = item_from_catalog_product(products[1], BASE_URL, 'EUR')
+    html_item = {
+        'title': 'Basic Socks Black (HTML)',
+        'description': 'Ribbed cotton socks.',
+        'images': ['https://scuffers.com/cdn/shop/files/SOCKS.jpg'],
+        'price': '',
+    }
+    merged = merge_missing(item, html_item)
+    assert merged['title'] == 'Basic Socks Black'
+    assert merged['description'] == 'Ribbed cotton socks.'
+    assert merged['images'] == ['https://scuffers.com/cdn/shop/files/SOCKS.jpg']
+    assert merged['price'] == '15.00'
+    assert item['description'] == ''
+
+
+def test_parse_catalog_page():
+    crawler = get_crawler(ScuffersSpider, {'FEEDS': {}})
+    spider = crawler._create_spider(mode='catalog')
+    url = catalog_page_url(BASE_URL, 1)
+    response = TextResponse(url, body=FIXTURE.read_bytes(), encoding='utf-8', request=Request(url))
+
+    output = list(spider.parse_catalog(response, page=1))
+
+    items = [o for o in output if isinstance(o, ScraperItem)]
+    requests = [o for o in output if isinstance(o, Request)]
+    # The repeated product is emitted once, and the incomplete one is
+    # completed from its HTML page; a short page is the last one
+    assert [i['url'] for i in items] == ['https://scuffers.com/products/iconic-jersey-lime']
+    assert [r.url for r in requests] == ['https://scuffers.com/products/basic-socks-black']
+    assert requests[0].cb_kwargs['partial']['sku'] == ''
+    assert crawler.stats.get_value('catalog/products') == 3
+    assert crawler.stats.get_value('catalog/html_fallback') == 1
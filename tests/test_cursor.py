@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+import api.main
+from api.cursor import InvalidCursor, decode_cursor, encode_cursor, query_fingerprint
+
+FINGERPRINT = query_fingerprint('hoodie', None, None, None, None, None)
+
+
+def es_hit(i):
+    return {'_source': {'url': f'https://scuffers.com/products/p{i}'}, 'sort': [1.0, f'p{i}']}
+
+
+def test_cursor_round_trip():
+    state = {'src': 'fallback', 'k': FINGERPRINT, 'gen': 3, 'pos': 40, 't': 95}
+    assert decode_cursor(encode_cursor(state), FINGERPRINT) == dict(state, v=1)
+
+
+@pytest.mark.parametrize('state', [
+    {'src': 'fallback', 'k': FINGERPRINT},
+    {'src': 'fallback', 'k': FINGERPRINT, 'gen': 3, 'pos': '40', 't': 95},
+    {'src': 'fallback', 'k': FINGERPRINT, 'gen': 3, 'pos': -20, 't': 95},
+    {'src': 'es', 'k': FINGERPRINT, 'n': 20, 't': 95, 'x': True},
+    {'src': 'es', 'k': FINGERPRINT, 'after': [], 'n': 20, 't': 95, 'x': True},
+    {'src': 'es', 'k': FINGERPRINT, 'after': [1.0, 'p19'], 'n': True, 't': 95, 'x': True},
+    {'src': 'es', 'k': FINGERPRINT, 'after': [1.0, 'p19'], 'n': 20, 't': 95, 'x': True, 'pit': 7},
+])
+def test_cursor_missing_or_mistyped_fields_is_rejected(state):
+    with pytest.raises(InvalidCursor, match='malformed cursor'):
+        decode_cursor(encode_cursor(state), FINGERPRINT)
+
+
+def test_cursor_of_another_query_is_rejected():
+    cursor = encode_cursor({'src': 'fallback', 'k': FINGERPRINT, 'gen': 3, 'pos': 40, 't': 95})
+    with pytest.raises(InvalidCursor, match='different query'):
+        decode_cursor(cursor, query_fingerprint('pants', None, None, None, None, None))
+
+
+class StubES:
+    """Point-in-time search serving `total` hits, per_page at a time."""
+
+    def __init__(self, total):
+        self.total = total
+        self.closed = []
+
+    async def open_point_in_time(self, index, keep_alive):
+        return {'id': 'pit-1'}
+
+    async def search(self, body):
+        start = int(body['search_after'][1][1:]) + 1
+        hits = [es_hit(i) for i in range(start, min(start + body['size'], self.total))]
+        return {'pit_id': 'pit-1', 'hits': {'hits': hits}}
+
+    async def close_point_in_time(self, id):
+        self.closed.append(id)
+
+
+def test_cursor_walk_goes_past_the_counted_total(monkeypatch):
+    es = StubES(total=10050)
+    monkeypatch.setattr(api.main, 'es', es)
+    # First page of a query ES stopped counting at 10000 hits
+    first = api.main.es_search_result(
+        {'hits': {'total': {'value': 10000, 'relation': 'gte'}, 'hits': [es_hit(i) for i in range(9950, 10000)]}},
+        FINGERPRINT, 200, 50,
+    )
+    state = decode_cursor(first['next_cursor'], FINGERPRINT)
+
+    page = asyncio.run(api.main.es_cursor_page(state, 'hoodie', None, None, None, None, 50, None))
+    assert page['total'] == 10050 and len(page['hits']) == 50
+    state = decode_cursor(page['next_cursor'], FINGERPRINT)
+
+    last = asyncio.run(api.main.es_cursor_page(state, 'hoodie', None, None, None, None, 50, None))
+    assert last['hits'] == [] and last['next_cursor'] is None
+    assert es.closed == ['pit-1']
+
+
+def test_exact_total_ends_the_walk():
+    result = api.main.es_search_result(
+        {'hits': {'total': {'value': 40, 'relation': 'eq'}, 'hits': [es_hit(i) for i in range(20, 40)]}},
+        FINGERPRINT, 2, 20,
+    )
+    assert result['next_cursor'] is None
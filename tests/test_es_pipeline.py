@@ -0,0 +1,137 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+import index_tools.es_utils
+import scraper.pipelines
+from scraper.pipelines import ElasticsearchBulkPipeline
+
+
+class StubES:
+    """Bulk endpoint answering each item with a scripted status (201 by default)."""
+
+    def __init__(self, statuses=None):
+        # _id -> statuses returned on successive attempts
+        self.statuses = statuses or {}
+        self.batches = []
+        self.mappings = []
+        self.indices = SimpleNamespace(put_mapping=lambda **kw: self.mappings.append(kw))
+
+    def bulk(self, operations):
+        metas = operations[0::2]
+        self.batches.append([m['index']['_id'] for m in metas])
+        items = []
+        for meta in metas:
+            _id = meta['index']['_id']
+            script = self.statuses.get(_id)
+            status = script.pop(0) if script else 201
+            info = {'_id': _id, 'status': status}
+            if status >= 300:
+                info['error'] = {'type': 'es_rejected_execution_exception' if status == 429 else 'mapper_parsing_exception'}
+            items.append({'index': info})
+        return {'errors': any(i['index']['status'] >= 300 for i in items), 'items': items}
+
+
+@pytest.fixture(autouse=True)
+def no_reactor(monkeypatch):
+    # The worker hands queue places back through the reactor; there is none here
+    monkeypatch.setattr(scraper.pipelines, 'call_from_thread', lambda fn, *args: fn(*args))
+    monkeypatch.setattr(index_tools.es_utils, 'backoff_delay', lambda attempt, base=0.5, cap=30.0: 0)
+
+
+def make_pipeline(tmp_path, es, **kwargs):
+    stats = MemoryStatsCollector(get_crawler())
+    kwargs.setdefault('flush_interval', 60.0)
+    pipeline = ElasticsearchBulkPipeline('http://localhost:9200', 'products', dead_letter_file=str(tmp_path / 'dead.jsonl'), stats=stats, **kwargs)
+    pipeline.es = es
+    pipeline.open_spider(None)
+    return pipeline
+
+
+def feed(pipeline, n):
+    for i in range(n):
+        asyncio.run(pipeline.process_item({'url': f'https://scuffers.com/products/p{i}', 'title': f'P{i}', 'price': '10,00'}, None))
+
+
+def es_stats(pipeline):
+    return {k.split('/', 1)[1]: v for k, v in pipeline.stats.get_stats().items() if k.startswith('es_pipeline/')}
+
+
+def test_batches_by_size_and_stamps_once(tmp_path):
+    es = StubES()
+    pipeline = make_pipeline(tmp_path, es, bulk_size=2)
+    feed(pipeline, 5)
+    pipeline._finish()
+
+    assert [len(b) for b in es.batches] == [2, 2, 1]
+    assert es_stats(pipeline) == {'batches': 3, 'indexed': 5}
+    assert len(es.mappings) == 1
+    assert pipeline.slots.tokens == pipeline.slots.limit
+
+
+def test_rejected_items_are_retried(tmp_path):
+    es = StubES({'https://scuffers.com/products/p1': [429, 429]})
+    pipeline = make_pipeline(tmp_path, es, bulk_size=3)
+    feed(pipeline, 3)
+    pipeline._finish()
+
+    assert es.batches[1:] == [['https://scuffers.com/products/p1']] * 2
+    assert es_stats(pipeline) == {'batches': 1, 'indexed': 3, 'retried': 2}
+    assert not (tmp_path / 'dead.jsonl').exists()
+
+
+def test_failed_items_go_to_the_dead_letter_file(tmp_path):
+    es = StubES({
+        'https://scuffers.com/products/p0': [400],
+        'https://scuffers.com/products/p2': [503, 503, 503],
+    })
+    pipeline = make_pipeline(tmp_path, es, bulk_size=3, max_retries=2)
+    feed(pipeline, 3)
+    pipeline._finish()
+
+    dead = [json.loads(line) for line in (tmp_path / 'dead.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert sorted((d['_id'], d['status']) for d in dead) == [
+        ('https://scuffers.com/products/p0', 400),
+        ('https://scuffers.com/products/p2', 503),
+    ]
+    assert dead[0]['action']['_source']['price'] == 10.0
+    assert es_stats(pipeline) == {'batches': 1, 'indexed': 1, 'retried': 2, 'failed': 2}
+
+
+def test_worker_keeps_draining_after_a_failed_batch(tmp_path):
+    es = StubES({'https://scuffers.com/products/p0': [400]})
+    pipeline = make_pipeline(tmp_path, es, bulk_size=2)
+    # Writing the dead letters fails: the dead-letter path is a directory
+    pipeline.dead_letter_file = str(tmp_path)
+    feed(pipeline, 4)
+    pipeline._finish()
+
+    assert not pipeline.worker.is_alive()
+    assert len(es.batches) == 2
+    assert es_stats(pipeline) == {'batches': 2, 'indexed': 3, 'failed': 1, 'errors': 1}
+    assert len(es.mappings) == 1
+
+
+def test_items_without_id_are_dead_lettered(tmp_path):
+    es = StubES()
+    pipeline = make_pipeline(tmp_path, es)
+    feed(pipeline, 1)
+    asyncio.run(pipeline.process_item({'title': 'No url', 'price': '5,00'}, None))
+    pipeline._finish()
+
+    assert es.batches == [['https://scuffers.com/products/p0']]
+    dead = [json.loads(line) for line in (tmp_path / 'dead.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert [(d['_id'], d['error']['type'], d['action']['_source']['title']) for d in dead] == [(None, 'missing_id', 'No url')]
+    assert es_stats(pipeline) == {'batches': 1, 'indexed': 1, 'skipped_no_id': 1}
+
+
+def test_nothing_indexed_leaves_the_version_alone(tmp_path):
+    es = StubES()
+    pipeline = make_pipeline(tmp_path, es)
+    pipeline._finish()
+
+    assert es.batches == [] and es.mappings == []
@@ -0,0 +1,126 @@
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
+from scrapy.utils.test import get_crawler
+
+from scraper.frontier import DONE, FAILED, QUEUED, FrontierFailureMiddleware, FrontierScheduler, SharedPolitenessMiddleware
+
+PRODUCT = 'https://scuffers.com/products/iconic-jersey-lime'
+HOME = 'https://scuffers.com/'
+
+
+class FrontierSpider(Spider):
+    name = 'frontier'
+
+
+@pytest.fixture
+def frontier_file(tmp_path):
+    return str(tmp_path / 'frontier.sqlite')
+
+
+def open_scheduler(path, worker=None):
+    crawler = get_crawler(FrontierSpider, {'FRONTIER_FILE': path, 'FRONTIER_WORKER': worker})
+    crawler.spider = crawler._create_spider()
+    scheduler = FrontierScheduler.from_crawler(crawler)
+    scheduler.open(crawler.spider)
+    return crawler, scheduler
+
+
+def states(path):
+    with sqlite3.connect(path) as db:
+        return db.execute('SELECT kind, state FROM frontier').fetchall()
+
+
+@pytest.mark.parametrize('exception', [IgnoreRequest('Forbidden by robots.txt'), ConnectionRefusedError()])
+def test_failed_request_is_not_fetched_again(frontier_file, exception):
+    crawler, scheduler = open_scheduler(frontier_file)
+    scheduler.enqueue_request(Request(PRODUCT))
+    request = scheduler.next_request()
+
+    assert FrontierFailureMiddleware.from_crawler(crawler).process_exception(request, exception) is None
+    scheduler.close('finished')
+
+    assert states(frontier_file) == [('product', FAILED)]
+    assert crawler.stats.get_value('frontier/failed') == 1
+    crawler, scheduler = open_scheduler(frontier_file)
+    assert not scheduler.has_pending_requests()
+    assert crawler.stats.get_value('frontier/resumed') is None
+    scheduler.close('finished')
+
+
+def test_start_url_is_queued_once_across_resumes(frontier_file):
+    crawler, scheduler = open_scheduler(frontier_file)
+    assert scheduler.enqueue_request(Request(HOME, dont_filter=True))
+    scheduler.close('shutdown')
+
+    crawler, scheduler = open_scheduler(frontier_file)
+    assert not scheduler.enqueue_request(Request(HOME, dont_filter=True))
+    assert len(scheduler) == 1
+    scheduler.close('finished')
+
+
+def test_retry_takes_the_place_of_its_request(frontier_file):
+    crawler, scheduler = open_scheduler(frontier_file)
+    scheduler.enqueue_request(Request(PRODUCT))
+    request = scheduler.next_request()
+
+    # What RetryMiddleware sends back to the scheduler
+    assert scheduler.enqueue_request(request.replace(dont_filter=True, priority=-1))
+    assert states(frontier_file) == [('product', QUEUED)]
+
+    retry = scheduler.next_request()
+    assert retry.url == PRODUCT and retry.dont_filter
+    scheduler.response_processed(retry)
+    assert states(frontier_file) == [('product', DONE)]
+    scheduler.close('finished')
+
+
+def test_idle_worker_waits_for_live_leases_only(frontier_file):
+    _, first = open_scheduler(frontier_file, worker='w1')
+    _, second = open_scheduler(frontier_file, worker='w2')
+    first.enqueue_request(Request(PRODUCT))
+    first.next_request()
+
+    with pytest.raises(DontCloseSpider):
+        second.spider_idle(second.spider)
+
+    # w1 died without settling its request
+    first.db.execute('UPDATE frontier SET lease_until = ?', (time.time() - 1,))
+    second.spider_idle(second.spider)
+    first.db.close()
+    second.close('finished')
+
+
+def politeness(path, worker, slots, **settings):
+    crawler = get_crawler(FrontierSpider, dict({'FRONTIER_FILE': path, 'FRONTIER_WORKER': worker, 'DOWNLOAD_DELAY': 0.5}, **settings))
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots=slots))
+    return SharedPolitenessMiddleware.from_crawler(crawler)
+
+
+def test_politeness_follows_the_slot_delay(frontier_file):
+    slots = {'scuffers.com': Slot(2, 1.0, 0.5), 'cdn.shopify.com': Slot(8, 0.0, 0.5)}
+    mw = politeness(frontier_file, 'w1', slots)
+    assert mw.slot_delay('scuffers.com') == 1.0
+    assert mw.slot_delay('cdn.shopify.com') == 0.0
+    # No slot yet: DOWNLOAD_DELAY
+    assert mw.slot_delay('example.com') == 0.5
+    assert politeness(frontier_file, 'w2', slots, FRONTIER_DOMAIN_DELAY=2).slot_delay('scuffers.com') == 2.0
+
+
+def test_politeness_turns_off_the_slot_jitter(frontier_file):
+    slot = Slot(2, 1.0, 0.5)
+    mw = politeness(frontier_file, 'w1', {'scuffers.com': slot})
+    mw.request_reached_downloader(Request(PRODUCT, meta={'download_slot': 'scuffers.com'}), None)
+    assert slot.jitter == 0.0 and slot.download_delay() == 1.0
+
+
+def test_workers_book_turns_one_delay_apart(frontier_file):
+    first = politeness(frontier_file, 'w1', {})
+    second = politeness(frontier_file, 'w2', {})
+    turns = [first._book('scuffers.com', 1.0), second._book('scuffers.com', 1.0), first._book('scuffers.com', 1.0)]
+    assert turns[1] - turns[0] == pytest.approx(1.0) and turns[2] - turns[1] == pytest.approx(1.0)
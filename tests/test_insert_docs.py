@@ -0,0 +1,98 @@
+import json
+
+import pytest
+from elasticsearch import ConnectionError
+
+import index_tools.es_utils
+import index_tools.insert_docs
+from index_tools.insert_docs import changed_docs, load
+
+
+def action(doc_id, content_hash):
+    return {'_index': 'products', '_id': doc_id, '_source': {'content_hash': content_hash}}
+
+
+def test_changed_docs_sends_new_and_changed_only():
+    known = {'a': 'h1', 'b': 'h2'}
+    counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'no_id': 0}
+    seen = set()
+    actions = [action('a', 'h1'), action('b', 'h3'), action('c', 'h4')]
+
+    sent = list(changed_docs(actions, known, counts, seen))
+
+    assert [a['_id'] for a in sent] == ['b', 'c']
+    assert counts == {'added': 1, 'updated': 1, 'unchanged': 1, 'no_id': 0}
+    assert seen == {'a', 'b', 'c'}
+
+
+def test_changed_docs_skips_documents_without_id():
+    counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'no_id': 0}
+    seen, skipped = set(), []
+    actions = [action(None, 'h1'), action('a', 'h2')]
+
+    sent = list(changed_docs(actions, {}, counts, seen, full=True, skipped=skipped))
+
+    assert [a['_id'] for a in sent] == ['a']
+    assert counts['no_id'] == 1 and seen == {'a'}
+    assert skipped == [{
+        '_id': None,
+        'status': None,
+        'error': {'type': 'missing_id', 'reason': 'document has neither url nor sku to build an _id'},
+        'document': {'content_hash': 'h1'},
+    }]
+
+
+class StubES:
+    """Bulk endpoint whose requests fail on the transport for some documents."""
+
+    def __init__(self, down_for=(), failures=1):
+        # A request carrying one of these _ids fails `failures` times
+        self.down_for = set(down_for)
+        self.failures = failures
+        self.indexed = []
+
+    def bulk(self, operations):
+        ids = [meta['index']['_id'] for meta in operations[0::2]]
+        if self.down_for & set(ids) and self.failures:
+            self.failures -= 1
+            raise ConnectionError('Connection refused')
+        self.indexed.extend(ids)
+        return {'errors': False, 'items': [{'index': {'_id': _id, 'status': 201}} for _id in ids]}
+
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_tools.insert_docs, 'indexed_hashes', lambda index: {})
+    monkeypatch.setattr(index_tools.es_utils, 'backoff_delay', lambda attempt, base=0.5, cap=30.0: 0)
+    path = tmp_path / 'feed.jsonl'
+    path.write_text(''.join(json.dumps({'url': f'https://scuffers.com/products/p{i}', 'price': '10,00'}) + '\n' for i in range(6)), encoding='utf-8')
+    return path
+
+
+def use_es(monkeypatch, es):
+    monkeypatch.setattr(index_tools.insert_docs, 'es', es)
+
+
+def test_chunk_lost_on_the_transport_is_retried(feed, monkeypatch):
+    es = StubES(down_for=['https://scuffers.com/products/p2'], failures=1)
+    use_es(monkeypatch, es)
+
+    report = load(feed, 'products', chunk_size=2, threads=2, max_retries=2)
+
+    assert sorted(es.indexed) == [f'https://scuffers.com/products/p{i}' for i in range(6)]
+    assert report['indexed'] == 6 and report['retried'] == 2 and report['failed'] == 0
+
+
+def test_chunk_down_for_good_goes_to_the_report(feed, monkeypatch):
+    es = StubES(down_for=['https://scuffers.com/products/p2'], failures=10)
+    use_es(monkeypatch, es)
+
+    report = load(feed, 'products', chunk_size=2, threads=2, max_retries=2)
+
+    assert report['indexed'] == 4
+    assert sorted(f['_id'] for f in report['failures']) == [
+        'https://scuffers.com/products/p2',
+        'https://scuffers.com/products/p3',
+    ]
+    assert report['failures'][0]['document']['price'] == 10.0
+    assert report['failures_by_type'] == {'transport_error': 2}
@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import ConnectionError, NotFoundError
+from fastapi import HTTPException
+
+import api.main
+from api.breaker import CircuitBreaker
+
+PRODUCT = 'https://scuffers.com/products/only-in-es'
+
+
+class StubES:
+    def __init__(self, error):
+        self.error = error
+
+    async def search(self, index, body):
+        raise self.error
+
+
+@pytest.fixture(autouse=True)
+def es_only_product(monkeypatch):
+    # The product is not in the fallback corpus, so only ES can answer
+    snap = SimpleNamespace(similar=SimpleNamespace(similar=lambda product_id, k: None))
+    monkeypatch.setattr(api.main, 'fallback_store', SimpleNamespace(get=lambda: snap))
+    monkeypatch.setattr(api.main, 'breaker', CircuitBreaker(failure_threshold=1))
+
+
+def similar(monkeypatch, es):
+    monkeypatch.setattr(api.main, 'es', es)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(api.main.similar_products(PRODUCT, k=5))
+    return e.value
+
+
+def test_outage_is_reported_as_unavailable(monkeypatch):
+    error = similar(monkeypatch, StubES(ConnectionError('Connection refused')))
+    assert error.status_code == 503
+    assert 'Connection' not in error.detail
+
+    # The breaker is now open: no ES call at all
+    assert similar(monkeypatch, StubES(AssertionError('ES called'))).status_code == 503
+
+
+def test_missing_index_is_not_found(monkeypatch):
+    meta = ApiResponseMeta(status=404, http_version='1.1', headers=HttpHeaders(), duration=0.0, node=NodeConfig('http', 'localhost', 9200))
+    error = similar(monkeypatch, StubES(NotFoundError('index_not_found_exception', meta, {})))
+    assert (error.status_code, error.detail) == (404, 'unknown product')
+
+
+def test_without_es_unknown_products_are_not_found(monkeypatch):
+    assert similar(monkeypatch, None).status_code == 404
@@ -0,0 +1,71 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.core.downloader import Slot
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from scraper.throttle import AdaptiveThrottleMiddleware, retry_after_seconds
+
+PROFILES = {
+    'scuffers.com': {
+        'start_concurrency': 4, 'max_concurrency': 4,
+        'start_delay': 0.5, 'min_delay': 0.25, 'max_delay': 30.0,
+        'target_latency': 1.0,
+    },
+}
+
+
+class ThrottleSpider(Spider):
+    name = 'throttle'
+
+
+@pytest.fixture
+def middleware():
+    crawler = get_crawler(ThrottleSpider, {
+        'ADAPTIVE_THROTTLE_ENABLED': True,
+        'ADAPTIVE_THROTTLE_HOSTS': PROFILES,
+        'ADAPTIVE_THROTTLE_MAX_RETRY_AFTER': 60,
+    })
+    # The downloader slot the throttle applies its values to
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots={'scuffers.com': Slot(4, 0.5)}))
+    return AdaptiveThrottleMiddleware.from_crawler(crawler)
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(b'120') == 120.0
+    assert retry_after_seconds('Wed, 21 Oct 2015 07:28:30 GMT', now=1445412480.0) == 30.0
+    assert retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412480.0) == 0.0
+    assert retry_after_seconds('soon') is None
+    assert retry_after_seconds(None) is None
+
+
+def test_429_with_retry_after_backs_off_the_slot(middleware):
+    request = Request('https://scuffers.com/products/iconic-jersey-lime')
+    throttle = middleware.throttle_for(request)
+    assert (throttle.concurrency, throttle.delay) == (4, 0.5)
+
+    response = Response(request.url, status=429, headers={'Retry-After': '5'}, request=request)
+    before = time.time()
+    assert middleware.process_response(request, response) is response
+
+    assert request.meta['download_slot'] == 'scuffers.com'
+    assert (throttle.concurrency, throttle.delay) == (2, 1.0)
+    slot = middleware.crawler.engine.downloader.slots['scuffers.com']
+    assert (slot.concurrency, slot.delay) == (2, 1.0)
+    assert before + 5 <= throttle.paused_until <= time.time() + 5
+    stats = middleware.stats
+    assert stats.get_value('throttle/scuffers.com/backoffs') == 1
+    assert stats.get_value('throttle/scuffers.com/retry_after') == 5.0
+    assert stats.get_value('throttle/scuffers.com/concurrency') == 2
+
+
+def test_retry_after_is_capped(middleware):
+    request = Request('https://scuffers.com/collections/all')
+    response = Response(request.url, status=503, headers={'Retry-After': '3600'}, request=request)
+    middleware.process_response(request, response)
+
+    assert middleware.throttle_for(request).paused_until <= time.time() + 60
+    assert middleware.stats.get_value('throttle/scuffers.com/retry_after') == 60
@@ -0,0 +1,228 @@
+"""Benchmark ScuffersSpider page parsing: BeautifulSoup baseline vs single-parse lxml.
+
+Usage:
+  python tools/bench_spider_parse.py PAGE.html [PAGE2.html | DIR ...] [-n 50]
+
+Pages are saved HTML files (e.g. `curl -o page.html <product url>`); a
+directory argument means every *.html file inside it. Each page is wrapped in
+a fresh Scrapy HtmlResponse per iteration, so tree construction is included in
+the measured time for both implementations.
+
+The baseline is a frozen copy of the spider's previous parse/parse_product,
+which built two BeautifulSoup trees plus Scrapy's own selector per page.
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urljoin
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bs4 import BeautifulSoup
+from scrapy.http import HtmlResponse
+
+from scraper.spiders.scuffers_spider import ScuffersSpider
+
+
+# --- baseline: previous BeautifulSoup implementation ------------------------
+
+PRICE_RE = re.compile(r"(?:\$|€|£)?\s*(\d{1,3}(?:[.,]\d{2})?)")
+DISALLOWED = ('/cart', '/carts', '/checkout', '/checkouts', '/orders', '/admin', '/account', '/search', '/policies', '/recommendations/products', '/sf_private_access_tokens')
+
+
+def legacy_parse(response, seen):
+    soup = BeautifulSoup(response.text or '', 'html.parser')
+    is_product = False
+    for script in soup.find_all('script', type='application/ld+json'):
+        txt = script.string or script.get_text() or ''
+        if re.search(r'"@type"\s*:\s*"Product"', txt):
+            is_product = True
+            break
+    og = soup.find('meta', attrs={'property': 'og:type'})
+    if og and og.get('content', '').lower() == 'product':
+        is_product = True
+    if soup.select('[data-product], form[action*="/cart/add"], .product-form, .product-single'):
+        is_product = True
+
+    if is_product:
+        canonical = soup.find("link", rel="canonical")
+        canonical_url = canonical["href"].strip() if canonical and canonical.get("href") else response.url
+        canonical_url = urljoin(response.url, canonical_url)
+        if canonical_url in seen:
+            return []
+        seen.add(canonical_url)
+        return [legacy_parse_product(response)]
+
+    links = []
+    for a in soup.find_all('a', href=True):
+        url = urljoin(response.url, a.get('href'))
+        if 'scuffers.com' not in url or any(s in url for s in DISALLOWED):
+            continue
+        links.append(url)
+    return links
+
+
+def legacy_parse_product(response):
+    item = {'url': response.url}
+    text = response.text
+    soup = BeautifulSoup(text or '', 'html.parser')
+
+    h1 = soup.find('h1')
+    if h1 and h1.get_text(strip=True):
+        title = h1.get_text(strip=True)
+    else:
+        ttag = soup.find('title')
+        title = ttag.get_text(strip=True) if ttag else ''
+    item['title'] = title.strip() if title else ''
+
+    description = response.css('div.metafield-rich_text_field').css('p::text').get()
+    item['description'] = description.strip() if description else ''
+
+    price = ''
+    ld = None
+    ld_tag = soup.find('script', type='application/ld+json')
+    if ld_tag:
+        ld = ld_tag.string or ld_tag.get_text()
+    if ld:
+        m = re.search(r'"price"\s*:\s*"?([\d.,]+)"?', ld)
+        if m:
+            price = m.group(1)
+    if not price:
+        for sel_text in soup.select('.price, .product__price, .product-price'):
+            m = re.search(r'[\d.,]+', sel_text.get_text() or '')
+            if m:
+                price = m.group(0)
+                break
+    if not price:
+        for m in PRICE_RE.finditer(text):
+            price = m.group(1)
+            break
+
+    currency = ''
+    if ld:
+        mcur = re.search(r'"priceCurrency"\s*:\s*"([A-Z]{3}|[^\"]+)"', ld)
+        if mcur:
+            currency = mcur.group(1)
+    if not currency:
+        price_text = response.css('.price::text, .product__price::text, .product-price::text').get() or ''
+        if '€' in price_text:
+            currency = 'EUR'
+    item['price'] = price.strip() if price else ''
+    item['currency'] = currency
+
+    item['images'] = ['https:' + div.css('img.rimage__image').attrib['src'] for div in response.css('div.product-media')]
+
+    sku = ''
+    ds = soup.select_one('[data-sku]')
+    if ds and ds.get('data-sku'):
+        sku = ds.get('data-sku')
+    else:
+        selt = soup.select_one('.sku') or soup.select_one('.product-sku')
+        if selt and selt.get_text(strip=True):
+            sku = selt.get_text(strip=True)
+    if not sku and ld:
+        m = re.search(r'"sku"\s*:\s*"([^\"]+)"', ld)
+        if m:
+            sku = m.group(1)
+    item['sku'] = sku.strip() if sku else ''
+
+    availability = ''
+    if ld:
+        m = re.search(r'"availability"\s*:\s*"[^\"]*\/([^"}]+)"', ld)
+        if m:
+            availability = m.group(1)
+    if not availability:
+        availability = 'out_of_stock' if soup.select('.sold-out, .out-of-stock') else 'in_stock'
+    item['availability'] = availability
+
+    regional_sizes = []
+    wrapper = soup.select_one('div.selector-wrapper[data-option-name="size"]')
+    if wrapper:
+        for opt in wrapper.select('.size-region-option'):
+            entry = {k[5:]: v for k, v in opt.attrs.items() if k.startswith('data-') and k[5:] not in ('variant-id', 'variant_id', 'id')}
+            if entry:
+                regional_sizes.append(entry)
+    if regional_sizes:
+        item['sizes'] = regional_sizes
+        first = regional_sizes[0]
+        item['size'] = str(first.get('label') or first.get('size') or first.get('name') or '').strip()
+    else:
+        sizes = []
+        for sel in soup.select('select[name*="size"] option, select[id*="size"] option, select[class*="size"] option'):
+            val = (sel.get_text() or '').strip()
+            if val and val.lower() not in ('choose an option', 'select a size', 'select'):
+                sizes.append(val)
+        for a in soup.select('[data-size], [data-value]'):
+            v = a.get('data-size') or a.get('data-value')
+            if v:
+                sizes.append(v.strip())
+        final = []
+        for s in sizes:
+            s = ' '.join(s.split())
+            if s and s not in final:
+                final.append(s)
+        item['sizes'] = final
+        item['size'] = final[0] if final else ''
+    return item
+
+
+# --- harness ----------------------------------------------------------------
+
+def collect_pages(paths):
+    pages = []
+    for p in map(Path, paths):
+        files = sorted(p.glob('*.html')) if p.is_dir() else [p]
+        for f in files:
+            url = f'https://scuffers.com/products/{f.stem}'
+            pages.append((url, f.read_bytes()))
+    return pages
+
+
+def run_legacy(pages):
+    seen = set()
+    for url, body in pages:
+        legacy_parse(HtmlResponse(url=url, body=body, encoding='utf-8'), seen)
+
+
+def run_current(pages):
+    spider = ScuffersSpider()
+    for url, body in pages:
+        for _ in spider.parse(HtmlResponse(url=url, body=body, encoding='utf-8')):
+            pass
+
+
+def bench(fn, pages, iterations):
+    fn(pages)  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(pages)
+    elapsed = time.perf_counter() - start
+    return (len(pages) * iterations) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pages', nargs='+', help='saved HTML pages or directories of them')
+    parser.add_argument('-n', '--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    pages = collect_pages(args.pages)
+    if not pages:
+        print('No pages found.')
+        return 2
+
+    before = bench(run_legacy, pages, args.iterations)
+    after = bench(run_current, pages, args.iterations)
+    print(f'{len(pages)} pages x {args.iterations} iterations')
+    print(f'  before (BeautifulSoup):  {before:8.1f} pages/s')
+    print(f'  after  (single lxml):    {after:8.1f} pages/s')
+    print(f'  speed-up:                {after / before:8.2f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())